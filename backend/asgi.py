@@ -0,0 +1,330 @@
+"""
+Async (ASGI) deployment of the backend:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The analysis routes (/trigger-scan, /trigger-scan/stream, /monitors/<id>/trigger) run as
+coroutines on the async Gemini client, so one process holds hundreds of in-flight analyses
+instead of one thread or worker each. Every other route is served by the Flask app from
+main.py on a worker thread, so URLs and JSON contracts are the same in both deployments.
+Scheduler, caches, routing and /metrics are main.py's own (CAMAI_ROLE applies as usual);
+model calls are capped by ASYNC_MODEL_CONCURRENCY rather than MODEL_CONCURRENCY (lanes.py).
+"""
+import io
+import re
+import sys
+import json
+import time
+
+from anyio import to_thread, from_thread
+from werkzeug.wrappers import Request
+
+import main
+import imaging
+import lanes
+import budgets
+import result_cache
+
+# One loop holds far more awaiting calls than threads do: the async cap replaces the threaded one
+# (scheduler and Flask-route calls share it, see lanes.ASYNC_MODEL_CONCURRENCY)
+main.model_lanes.capacity = lanes.ASYNC_MODEL_CONCURRENCY
+
+# Concurrent identical previews / scans of one monitor share a single model call
+# (monitor scans also join main.monitor_scans, see trigger_monitor)
+trigger_flight = result_cache.AsyncSingleFlight()
+monitor_flight = result_cache.AsyncSingleFlight(fresh_for=main.SCAN_FRESHNESS)
+
+
+# --- GEMINI (async) ---
+async def generate(mode, image, rule, ideal_bytes=None, model=main.routing.FAST_MODEL, usage=None,
+                   lane=lanes.INTERACTIVE):
+    """Async analyze_<mode>: the same request, awaited on client.aio. Unknown modes give "{}" like main.py."""
+    if mode not in ('QUANTIFIER', 'DETECTOR', 'PROCESS'):
+        return "{}"
+    contents, config = main.analysis_request(mode, image, rule, ideal_bytes)
+    # Same lanes and capacity as main.py's threads (scheduler scans included)
+    queued = time.perf_counter()
+    async with main.model_lanes.async_slot(lane):
+        started = time.perf_counter()
+        response = await main.gemini.acall(
+            lambda client: client.aio.models.generate_content(model=model, contents=contents, config=config))
+    if usage is not None:
+        budgets.add_usage(usage, response, time.perf_counter() - started, started - queued)
+    return response.text
+
+async def analyze_monitor(m, frame, lane=lanes.TRIGGERED):
+    """main.analyze_monitor on the async client: same regions, tiers, escalation and lanes."""
+    m, image, ideal_bytes = await to_thread.run_sync(main.prepare_scan, m, frame)
+    rule = m.get('rule', "")
+    usage = {}
+
+    async def run(model):
+        return main.parse_result(await generate(m['type'], image, rule, ideal_bytes, model, usage, lane))
+
+    try:
+        result, route = await main.router.analyze_async(m, run, lambda result: main.result_status(m, result))
+    finally:
+        await to_thread.run_sync(main.budget.record, m['id'], usage, m['type'])
+    route["usage"] = usage
+    return result, route
+
+
+# --- RESPONSES ---
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *CORS_HEADERS,
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+# --- ASYNC ROUTES ---
+async def trigger_scan(request, send):
+    try:
+        mode = request.form.get('mode', 'QUANTIFIER')
+        user_rule = request.form.get('rule', '')
+        if 'image' not in request.files:
+            return await send_json(send, {"error": "No image uploaded"}, 400)
+        image_bytes = request.files['image'].read()
+        ideal_bytes = request.files['ideal_image'].read() if 'ideal_image' in request.files else None
+
+        key = main.trigger_cache_key(mode, user_rule, image_bytes, ideal_bytes)
+        cached = main.trigger_cache.get(key)
+        if cached is not None:
+            main.trigger_cache.stats["hits"] += 1
+            return await send_json(send, {**cached, "cached": True})
+
+        deployment = await to_thread.run_sync(main.budget.deployment) # reads usage.json: off the event loop
+        if deployment['exhausted']:
+            return await send_json(send, {"error": "Deployment budget exhausted", "budget": deployment}, 429)
+
+        async def analyze():
+            usage = {}
+            try:
+                result = json.loads(await generate(mode, image_bytes, user_rule, ideal_bytes, usage=usage))
+            finally:
+                await to_thread.run_sync(main.budget.record, None, usage)
+            main.trigger_cache.put(key, result)
+            return result
+
+        result, source = await trigger_flight.do(key, analyze)
+        main.trigger_cache.stats["coalesced" if source != "leader" else "misses"] += 1
+        await send_json(send, {**result, "cached": source != "leader"})
+    except Exception as e:
+        print(f"Test Scan Error: {e}")
+        await send_json(send, {"error": str(e)}, 500)
+
+async def stream_test_scan(request, send):
+    mode = request.form.get('mode', 'QUANTIFIER')
+    user_rule = request.form.get('rule', '')
+    if 'image' not in request.files:
+        return await send_json(send, {"error": "No image uploaded"}, 400)
+    image_bytes = request.files['image'].read()
+    ideal_bytes = request.files['ideal_image'].read() if 'ideal_image' in request.files else None
+    cache_key = main.trigger_cache_key(mode, user_rule, image_bytes, ideal_bytes)
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"), *CORS_HEADERS,
+    ]})
+
+    async def emit(event, data):
+        await send({"type": "http.response.body", "body": main.sse(event, data).encode(), "more_body": True})
+
+    started = time.perf_counter()
+    first_chunk = None
+    cached = main.trigger_cache.get(cache_key)
+    if cached is not None:
+        main.trigger_cache.stats["hits"] += 1
+        await emit("result", {**cached, "cached": True})
+    elif (await to_thread.run_sync(main.budget.deployment))['exhausted']:
+        await emit("error", {"error": "Deployment budget exhausted"})
+    else:
+        text = []
+        usage = {}
+        last = None
+        try:
+            contents, config = main.analysis_request(mode, image_bytes, user_rule, ideal_bytes)
+            queued = time.perf_counter()
+            async with main.model_lanes.async_slot(lanes.INTERACTIVE):
+                stream_started = time.perf_counter()
+                with main.gemini.lease() as client:
+                    stream = await client.aio.models.generate_content_stream(model=main.routing.FAST_MODEL, contents=contents, config=config)
+                    async for chunk in stream:
+                        last = chunk # usage metadata is cumulative; the last chunk has the totals
+                        if not chunk.text:
+                            continue
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - started
+                        text.append(chunk.text)
+                        await emit("chunk", {"text": chunk.text})
+            result = json.loads("".join(text))
+            main.trigger_cache.stats["misses"] += 1
+            main.trigger_cache.put(cache_key, result)
+            await emit("result", {**result, "cached": False})
+        except Exception as e:
+            print(f"Test Scan Stream Error: {e}")
+            await emit("error", {"error": str(e)})
+        finally:
+            if last is not None:
+                budgets.add_usage(usage, last, time.perf_counter() - stream_started, stream_started - queued)
+                await to_thread.run_sync(main.budget.record, None, usage)
+    await emit("done", {
+        "cached": cached is not None,
+        "first_chunk_ms": round(first_chunk * 1000, 1) if first_chunk is not None else None,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+    await send({"type": "http.response.body", "body": b""})
+
+async def trigger_monitor(request, send, id):
+    try:
+        monitors = await to_thread.run_sync(main.load_monitors)
+        monitor = next((m for m in monitors if m['id'] == id), None)
+        if not monitor:
+            return await send_json(send, {"error": "Monitor not found"}, 404)
+
+        print(f"⚡ EXTERNAL TRIGGER RECEIVED: {monitor['name']}")
+        state = await to_thread.run_sync(main.budget.state, monitor)
+        if state['level'] == budgets.PAUSED:
+            return await send_json(send, {"error": "Monitor budget exhausted", "budget": state}, 429)
+        has_image = 'image' in request.files
+
+        async def scan():
+            frame = None
+            if has_image:
+                frame = imaging.Frame.from_jpeg(monitor['id'], request.files['image'].read())
+            elif monitor.get('connection_url'):
+                frame = await to_thread.run_sync(main.capture_frame, main.camera_input(monitor), monitor.get('capture_driver'))
+            if frame is None:
+                return None
+
+            result_json, route = await analyze_monitor(monitor, frame)
+            log_entry = await to_thread.run_sync(lambda: main.save_log_entry(
+                monitor['id'], monitor['name'], monitor['type'], result_json, frame.jpeg_view, extra={"routing": route}))
+            outcome = {"result": result_json, "status": main.result_status(monitor, result_json), "log_id": log_entry['id']}
+            main.monitor_scans.remember(monitor['id'], outcome) # the scheduler and WSGI triggers reuse it too
+            return outcome
+
+        # A scan already running or just finished on main.py's side (scheduler, threaded triggers)
+        # answers this trigger; otherwise concurrent async triggers share one scan.
+        # The two are only checked one after the other, so a thread scan starting in between still runs.
+        shared = await to_thread.run_sync(main.monitor_scans.join, monitor['id'])
+        outcome, source = shared if shared is not None else await monitor_flight.do(monitor['id'], scan)
+        if source == "leader":
+            main.dedup_stats["scans"] += 1
+        else:
+            main.dedup_stats[source] += 1
+            main.dedup_stats["api_calls_saved"] += 1
+            main.dedup_stats["captures_saved"] += int(not has_image)
+            if outcome is None:
+                outcome = await scan() # the scan it joined analysed nothing
+        if outcome is None:
+            return await send_json(send, {"error": "No image provided and camera capture failed"}, 400)
+
+        await send_json(send, {
+            "success": True,
+            "message": "Scan completed",
+            "result": outcome['result'],
+            "log_id": outcome['log_id'],
+            "shared": source != "leader",
+        })
+    except Exception as e:
+        print(f"Trigger Error: {e}")
+        await send_json(send, {"error": str(e)}, 500)
+
+ASYNC_ROUTES = [
+    ("POST", re.compile(r"^/trigger-scan$"), trigger_scan),
+    ("POST", re.compile(r"^/trigger-scan/stream$"), stream_test_scan),
+    ("POST", re.compile(r"^/monitors/(?P<id>[^/]+)/trigger$"), trigger_monitor),
+]
+
+
+# --- EVERYTHING ELSE: main.py's Flask app ---
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def run_wsgi(environ, send):
+    """Runs the Flask app on a worker thread. The whole response is iterated on that one thread
+    (streamed responses keep their request context), chunks are sent back through the event loop."""
+    def respond():
+        status_headers = {}
+
+        def start_response(status, headers, exc_info=None):
+            status_headers["status"] = int(status.split(" ", 1)[0])
+            status_headers["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        result = main.app(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not started:
+                    from_thread.run(send, {"type": "http.response.start", "status": status_headers["status"], "headers": status_headers["headers"]})
+                    started = True
+                if chunk:
+                    from_thread.run(send, {"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                from_thread.run(send, {"type": "http.response.start", "status": status_headers["status"], "headers": status_headers["headers"]})
+            from_thread.run(send, {"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    await to_thread.run_sync(respond)
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+# --- ASGI ENTRY POINT ---
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    for method, pattern, handler in ASYNC_ROUTES:
+        match = pattern.match(scope["path"])
+        if match and scope["method"] == method:
+            return await handler(Request(environ), send, **match.groupdict())
+    await run_wsgi(environ, send)
@@ -0,0 +1,149 @@
+"""
+Trigger throughput: gunicorn sync workers (main:app) vs one async process (asgi:app).
+
+    python benchmarks/bench_async.py                         # 200 concurrent, 1.5s model latency
+    python benchmarks/bench_async.py --concurrency 500 --latency 3 --sync-workers 8
+
+Both deployments talk to a local Gemini stub (benchmarks/gemini_stub.py) that answers
+after --latency seconds, so the numbers show how many analyses each deployment can keep
+in flight, not Gemini's speed. Every request uses a different rule so the result cache
+never answers. RSS is summed over the server's whole process tree. The async process
+runs under its own lane cap (ASYNC_MODEL_CONCURRENCY, 512 by default); beyond it calls queue.
+Needs gunicorn and uvicorn on PATH; a deployment whose server is missing is skipped.
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from gemini_stub import StubGemini
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def tree_rss_mb(pid):
+    """Resident memory of pid and all its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, ValueError, IndexError):
+                pass
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            pass
+    return total / 1024
+
+async def wait_ready(base, timeout=60):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                if (await client.get(base + "/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{base} did not come up")
+
+async def load(base, concurrency, image, pid):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    peak_rss = 0.0
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        async def one(i):
+            started = time.perf_counter()
+            response = await client.post(base + "/trigger-scan", data={"mode": "DETECTOR", "rule": f"bench rule {i}"},
+                                         files={"image": ("frame.jpg", image, "image/jpeg")})
+            return time.perf_counter() - started, response.status_code
+
+        async def sample_rss():
+            nonlocal peak_rss
+            while True:
+                peak_rss = max(peak_rss, tree_rss_mb(pid))
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.ensure_future(sample_rss())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+    latencies = sorted(r[0] * 1000 for r in results)
+    return {
+        "ok": sum(1 for r in results if r[1] == 200),
+        "elapsed": elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "rss": peak_rss,
+    }
+
+def deployments(args, port):
+    return [
+        ("gunicorn sync", "gunicorn", ["gunicorn", "-w", str(args.sync_workers), "--threads", str(args.sync_threads),
+                                        "-b", f"127.0.0.1:{port}", "--timeout", "600", "main:app"]),
+        ("uvicorn async", "uvicorn", ["uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                                       "--log-level", "warning"]),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.5)
+    parser.add_argument("--sync-workers", type=int, default=4)
+    parser.add_argument("--sync-threads", type=int, default=1)
+    args = parser.parse_args()
+
+    import cv2
+    import numpy as np
+    image = cv2.imencode(".jpg", np.full((480, 640, 3), 128, np.uint8))[1].tobytes()
+    stub = StubGemini(args.latency).start()
+
+    print(f"{args.concurrency} concurrent /trigger-scan, model latency {args.latency}s")
+    print(f"{'deployment':<15} {'ok':>5} {'wall (s)':>9} {'req/s':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        monitors_file = os.path.join(tmp, "monitors.json")
+        with open(monitors_file, "w") as f: f.write("[]")
+        env = dict(os.environ, CAMAI_ROLE="api", GEMINI_API_KEY="bench", GEMINI_BASE_URL=stub.url,
+                   MONITORS_FILE=monitors_file, LOGS_FILE=os.path.join(tmp, "logs.json"), WARM_STATE_FILE="off",
+                   USAGE_FILE=os.path.join(tmp, "usage.json"))
+
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        for name, binary, command in deployments(args, port):
+            if not shutil.which(binary):
+                print(f"{name:<15} skipped: {binary} not installed")
+                continue
+            server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                asyncio.run(wait_ready(base))
+                r = asyncio.run(load(base, args.concurrency, image, server.pid))
+                print(f"{name:<15} {r['ok']:>5} {r['elapsed']:>9.2f} {args.concurrency / r['elapsed']:>7.1f} "
+                      f"{r['p50']:>9.0f} {r['p95']:>9.0f} {r['rss']:>14.1f}")
+            finally:
+                server.terminate()
+                server.wait(10)
+    stub.stop()
+
+if __name__ == "__main__":
+    main()
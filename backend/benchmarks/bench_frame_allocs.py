@@ -0,0 +1,83 @@
+"""
+Allocations per scan: the old bytes-everywhere pipeline vs the shared imaging.Frame.
+
+    python benchmarks/bench_frame_allocs.py                 # 1280x720, 50 scans
+    python benchmarks/bench_frame_allocs.py --size 1920x1080 --scans 100
+
+Both paths do what a scheduler scan does with a captured frame: JPEG-encode it,
+build the motion thumbnail, write it to disk and hand the JPEG to the Gemini SDK
+(simulated; the SDK keeps a reference to the bytes). Image work runs inline
+(IMAGE_WORKERS=0) so tracemalloc sees every allocation in this process.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+os.environ["IMAGE_WORKERS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+import imaging
+
+
+def legacy_scan(raw, out_path):
+    _, buffer = cv2.imencode('.jpg', raw)
+    frame_bytes = buffer.tobytes()
+    # has_significant_change: decode the JPEG we just encoded
+    gray = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    thumb = cv2.resize(gray, imaging.THUMB_SIZE)
+    with open(out_path, "wb") as f:
+        f.write(frame_bytes)
+    sdk_payload = frame_bytes
+    return thumb, sdk_payload
+
+def frame_scan(raw, out_path):
+    jpeg, thumb = imaging.encode_frame("bench", raw)
+    frame = imaging.Frame("bench", jpeg=jpeg, thumbnail=thumb)
+    thumb = frame.thumbnail
+    with open(out_path, "wb") as f:
+        f.write(frame.jpeg_view)
+    sdk_payload = frame.jpeg_bytes
+    return thumb, sdk_payload
+
+def measure(fn, raw, scans, out_path):
+    fn(raw, out_path) # warm-up (lazy imports, cv2 internals)
+    tracemalloc.start()
+    started = time.perf_counter()
+    total = 0
+    for _ in range(scans):
+        snapshot_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = fn(raw, out_path)
+        total += tracemalloc.get_traced_memory()[1] - snapshot_before
+        del result
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    return total / scans, elapsed / scans
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--scans", type=int, default=50)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    # Smooth gradient + noise: compresses like a real scene rather than pure noise
+    rng = np.random.default_rng(0)
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    raw = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "capture.jpg")
+        print(f"{args.size}, {args.scans} scans")
+        print(f"{'path':<8} {'peak alloc / scan (KB)':>24} {'time / scan (ms)':>18}")
+        for name, fn in (("legacy", legacy_scan), ("frame", frame_scan)):
+            peak, per_scan = measure(fn, raw, args.scans, out_path)
+            print(f"{name:<8} {peak / 1024:>24.1f} {per_scan * 1000:>18.2f}")
+
+if __name__ == "__main__":
+    main()
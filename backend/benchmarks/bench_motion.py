@@ -0,0 +1,84 @@
+"""
+Motion gating cost per scheduler tick: per-monitor dict + cv2.absdiff path vs the
+batched MotionEngine and the mmap-backed SharedMotionEngine, at 10, 100 and 1000 cameras.
+
+    python benchmarks/bench_motion.py
+    python benchmarks/bench_motion.py --cameras 10 100 1000 5000 --ticks 50
+
+Each tick perturbs ~half the thumbnails so both paths see a mix of motion/no motion.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from imaging import THUMB_SIZE
+from motion import MotionEngine, SharedMotionEngine, MOTION_THRESHOLD, PIXEL_DELTA
+
+
+def per_monitor_gate(refs, batch):
+    """The original has_significant_change loop body, one camera at a time."""
+    changed = {}
+    for monitor_id, current in batch:
+        last = refs.get(monitor_id)
+        if last is None:
+            refs[monitor_id] = current
+            changed[monitor_id] = True
+            continue
+        diff = cv2.absdiff(current, last)
+        ratio = np.count_nonzero(diff > PIXEL_DELTA) / (current.shape[0] * current.shape[1])
+        if ratio > MOTION_THRESHOLD:
+            refs[monitor_id] = current
+        changed[monitor_id] = ratio > MOTION_THRESHOLD
+    return changed
+
+def make_ticks(cameras, ticks, rng):
+    shape = (THUMB_SIZE[1], THUMB_SIZE[0])
+    base = rng.integers(0, 256, (cameras, *shape), dtype=np.uint8)
+    out = []
+    for _ in range(ticks):
+        frames = base.copy()
+        moving = rng.random(cameras) < 0.5
+        frames[moving] = rng.integers(0, 256, (int(moving.sum()), *shape), dtype=np.uint8)
+        out.append([(f"cam-{i}", frames[i]) for i in range(cameras)])
+    return out
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cameras", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'cameras':>8} {'per-monitor (ms/tick)':>22} {'batched (ms/tick)':>18} {'speedup':>8} "
+          f"{'shared (ms/tick)':>17} {'speedup':>8}")
+    for cameras in args.cameras:
+        ticks = make_ticks(cameras, args.ticks, rng)
+
+        refs = {}
+        per_monitor_gate(refs, ticks[0]) # seed references
+        started = time.perf_counter()
+        for batch in ticks:
+            legacy = per_monitor_gate(refs, batch)
+        legacy_ms = (time.perf_counter() - started) * 1000 / args.ticks
+
+        timings = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for engine in (MotionEngine(), SharedMotionEngine(os.path.join(tmp, "motion.bin"), capacity=cameras)):
+                engine.compare(ticks[0])
+                started = time.perf_counter()
+                for batch in ticks:
+                    batched = engine.compare(batch)
+                timings.append((time.perf_counter() - started) * 1000 / args.ticks)
+                assert {k: v[0] for k, v in batched.items()} == legacy, "paths disagree"
+        batched_ms, shared_ms = timings
+        print(f"{cameras:>8} {legacy_ms:>22.3f} {batched_ms:>18.3f} {legacy_ms / batched_ms:>7.1f}x "
+              f"{shared_ms:>17.3f} {legacy_ms / shared_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Gemini client pool: one key vs several under a per-key rate limit.
+
+    python benchmarks/bench_pool.py                          # 120 calls, 4 keys, 40 calls/key/minute
+    python benchmarks/bench_pool.py --calls 300 --keys 8 --key-quota 50 --concurrency 32
+
+Calls go through main.generate against a local Gemini stub (benchmarks/gemini_stub.py)
+that throttles each key after --key-quota calls, so the numbers show how much of the
+workload a pool of keys absorbs (rotation plus failover on 429) compared with a single
+key, and how many TCP connections the pool's keep-alive settings needed.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gemini_stub import StubGemini
+
+
+def run(backend, keys, args):
+    stub = StubGemini(args.latency, key_quota=args.key_quota).start()
+    backend.gemini = backend.gemini_pool.GeminiPool(keys, base_url=stub.url)
+    contents, config = backend.analysis_request('DETECTOR', args.image, "bench rule")
+
+    def one(_):
+        try:
+            backend.generate(backend.routing.FAST_MODEL, contents, config)
+            return True
+        except Exception:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        ok = sum(pool.map(one, range(args.calls)))
+    elapsed = time.perf_counter() - started
+    stats = backend.gemini.stats()
+    stub.stop()
+    return ok, elapsed, stats, stub
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=120)
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--key-quota", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(CAMAI_ROLE="api", MOTION_STORE="memory", WARM_STATE_FILE="off", MODEL_CONCURRENCY="0",
+                      MONITORS_FILE=os.path.join(tmp, "monitors.json"), LOGS_FILE=os.path.join(tmp, "logs.json"),
+                      USAGE_FILE=os.path.join(tmp, "usage.json"))
+    import cv2
+    import numpy as np
+    import main as backend
+    args.image = cv2.imencode(".jpg", np.full((480, 640, 3), 128, np.uint8))[1].tobytes()
+
+    print(f"{args.calls} calls, {args.concurrency} at a time, {args.key_quota} calls/key/minute, {args.latency}s latency")
+    print(f"{'keys':>4} {'ok':>5} {'failed':>7} {'wall (s)':>9} {'429s':>5} {'failovers':>10} {'connections':>12}")
+    for count in sorted({1, args.keys}):
+        keys = [f"bench-key-{i:04d}" for i in range(count)]
+        ok, elapsed, stats, stub = run(backend, keys, args)
+        print(f"{count:>4} {ok:>5} {args.calls - ok:>7} {elapsed:>9.2f} {stub.throttled:>5} "
+              f"{stats['failovers']:>10} {stub.connections:>12}")
+        for name, key in stats["keys"].items():
+            print(f"       {name}: {key['calls']} calls, {key['throttled']} throttled, {key['state']}")
+
+if __name__ == "__main__":
+    main()
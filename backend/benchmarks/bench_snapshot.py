@@ -0,0 +1,113 @@
+"""
+Capture latency for an HTTP JPEG snapshot camera: cv2.VideoCapture vs the snapshot driver.
+
+    python benchmarks/bench_snapshot.py                    # 1280x720, 30 captures per path
+    python benchmarks/bench_snapshot.py --size 1920x1080 --captures 100
+    python benchmarks/bench_snapshot.py --url http://cam.local/snapshot.jpg
+
+Without --url a local HTTP server serves a fixed JPEG (with an ETag) so the
+numbers reflect client-side cost only. Paths measured per capture:
+  videocapture - what the scheduler did before: FFmpeg open + read + re-encode
+  snapshot     - pooled keep-alive GET, JPEG passed through as-is
+  conditional  - same GET with If-None-Match; the camera answers 304
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ["IMAGE_WORKERS"] = "0"
+os.environ["CAPTURE_WORKERS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+import capture
+import imaging
+
+
+def serve_jpeg(jpeg_bytes):
+    etag = f'"{hash(jpeg_bytes) & 0xffffffff:08x}"'
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive
+
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(jpeg_bytes)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(jpeg_bytes)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/snapshot.jpg"
+
+def videocapture_path(url):
+    frame, _ = capture.grab(url)
+    if frame is None:
+        raise RuntimeError("VideoCapture could not read the snapshot URL")
+    return imaging.encode_frame(url, frame)[0]
+
+def snapshot_path(url):
+    capture._snapshots.pop(url, None) # no validators: always a full 200
+    return capture.fetch_snapshot(url)[0].jpeg_view
+
+def conditional_path(url):
+    return capture.fetch_snapshot(url)[0].jpeg_view
+
+def measure(fn, url, captures):
+    fn(url) # warm-up: connection, lazy imports, cached validators
+    samples = []
+    for _ in range(captures):
+        started = time.perf_counter()
+        fn(url)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--captures", type=int, default=30)
+    parser.add_argument("--url")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        width, height = (int(v) for v in args.size.split("x"))
+        rng = np.random.default_rng(0)
+        base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        raw = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+        server, url = serve_jpeg(cv2.imencode(".jpg", raw)[1].tobytes())
+
+    print(f"{url}, {args.captures} captures per path")
+    print(f"{'path':<13} {'median (ms)':>12} {'p95 (ms)':>10}")
+    for name, fn in (("videocapture", videocapture_path), ("snapshot", snapshot_path), ("conditional", conditional_path)):
+        try:
+            samples = sorted(measure(fn, url, args.captures))
+        except Exception as e:
+            print(f"{name:<13} failed: {e}")
+            continue
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{name:<13} {statistics.median(samples):>12.2f} {p95:>10.2f}")
+    print(f"snapshot stats: {capture.snapshot_stats}")
+
+    if server:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
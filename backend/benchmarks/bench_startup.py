@@ -0,0 +1,66 @@
+"""
+Startup cost per process role: wall time to import main.py and peak resident memory.
+
+    python benchmarks/bench_startup.py            # all roles, 5 runs each
+    python benchmarks/bench_startup.py --runs 10 --roles api scan
+
+Each run is a fresh interpreter so module caches don't leak between samples.
+The scan role pre-warms the Gemini client; without network access the pre-warm
+call fails fast and is still counted.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time, resource, json, sys
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+heavy = [m for m in ('cv2', 'numpy', 'google.genai') if m in sys.modules]
+print(json.dumps({
+    "import_seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": heavy,
+}))
+"""
+
+def run_once(role, monitors_file):
+    env = dict(os.environ)
+    env.update({
+        "CAMAI_ROLE": role,
+        "MONITORS_FILE": monitors_file, # Empty fleet: the scheduler thread has nothing to scan
+        "GEMINI_API_KEY": env.get("GEMINI_API_KEY", "bench"),
+    })
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--roles", nargs="+", default=["api", "all", "scan"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        monitors_file = os.path.join(tmp, "monitors.json")
+        with open(monitors_file, "w") as f: f.write("[]")
+
+        print(f"{'role':<6} {'import (ms) median':>20} {'max':>8} {'RSS (MB) median':>17}  heavy modules loaded")
+        for role in args.roles:
+            samples = [run_once(role, monitors_file) for _ in range(args.runs)]
+            times = [s["import_seconds"] * 1000 for s in samples]
+            rss = [s["max_rss_mb"] for s in samples]
+            print(f"{role:<6} {statistics.median(times):>20.1f} {max(times):>8.1f} "
+                  f"{statistics.median(rss):>17.1f}  {', '.join(samples[-1]['heavy_modules']) or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Time to first byte for rule previews: blocking /trigger-scan vs /trigger-scan/stream (SSE).
+
+    python benchmarks/bench_trigger_ttfb.py --image shelf.jpg --rule "Count the bottles"
+    python benchmarks/bench_trigger_ttfb.py --url http://localhost:5000 --image shelf.jpg --runs 10
+    python benchmarks/bench_trigger_ttfb.py --simulate          # no API key: fake model timing
+
+Without --url the app is served in-process on a free port. --simulate swaps the
+Gemini client for one that waits --first-token seconds and then emits --chunks
+chunks --chunk-delay apart. That shows the shape of the win without network access;
+use a real key for real numbers.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CAMAI_ROLE", "api") # no scheduler in the benchmark process
+
+import requests
+
+
+class SimulatedModels:
+    def __init__(self, first_token, chunks, chunk_delay):
+        self.first_token, self.chunks, self.chunk_delay = first_token, chunks, chunk_delay
+        self.body = json.dumps({"class": "DETECTOR", "compliance_status": "PASS", "detections": []})
+
+    def _pieces(self):
+        size = max(1, len(self.body) // self.chunks)
+        return [self.body[i:i + size] for i in range(0, len(self.body), size)]
+
+    def generate_content(self, **kwargs):
+        time.sleep(self.first_token + self.chunk_delay * (self.chunks - 1))
+        return type("Response", (), {"text": self.body})()
+
+    def generate_content_stream(self, **kwargs):
+        time.sleep(self.first_token)
+        for i, piece in enumerate(self._pieces()):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield type("Chunk", (), {"text": piece})()
+
+def serve_in_process(args):
+    import main
+    from werkzeug.serving import make_server
+    if args.simulate:
+        models = SimulatedModels(args.first_token, args.chunks, args.chunk_delay)
+        main.gemini = main.gemini_pool.GeminiPool(["simulated"], factory=lambda entry: type("Client", (), {"models": models})())
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def timed_post(url, files, data):
+    started = time.perf_counter()
+    with requests.post(url, files=files, data=data, stream=True) as response:
+        first_byte = None
+        for _ in response.iter_content(chunk_size=1):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+        total = time.perf_counter() - started
+    return first_byte * 1000, total * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url")
+    parser.add_argument("--image")
+    parser.add_argument("--mode", default="DETECTOR")
+    parser.add_argument("--rule", default="Everyone wears a helmet")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--simulate", action="store_true")
+    parser.add_argument("--first-token", type=float, default=0.8)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        import cv2
+        import numpy as np
+        image = cv2.imencode(".jpg", np.full((480, 640, 3), 128, np.uint8))[1].tobytes()
+
+    server, base = (None, args.url.rstrip("/")) if args.url else serve_in_process(args)
+    data = {"mode": args.mode, "rule": args.rule}
+    print(f"{base}, {args.runs} runs{' (simulated model)' if args.simulate else ''}")
+    print(f"{'endpoint':<22} {'TTFB median (ms)':>17} {'total median (ms)':>18}")
+    for path in ("/trigger-scan", "/trigger-scan/stream"):
+        samples = [timed_post(base + path, {"image": ("frame.jpg", image, "image/jpeg")}, data) for _ in range(args.runs)]
+        print(f"{path:<22} {statistics.median(s[0] for s in samples):>17.1f} {statistics.median(s[1] for s in samples):>18.1f}")
+
+    if server:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
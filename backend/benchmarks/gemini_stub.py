@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Gemini REST API, for benchmarks and offline testing.
+
+    python benchmarks/gemini_stub.py --port 8089 --latency 1.5
+    GEMINI_BASE_URL=http://127.0.0.1:8089 GEMINI_API_KEY=stub python main.py
+
+Answers generateContent and streamGenerateContent (SSE) for any model after a fixed
+latency, with a canned JSON body that parses for every monitor type, models.get
+(used by the pre-warm) and countTokens (immediately, ~4 characters per text token,
+258 per image). Usage metadata is filled in so token accounting has numbers.
+
+--key-quota N answers 429 RESOURCE_EXHAUSTED (with a RetryInfo delay) once a key has
+made N generate calls in the current --quota-window, like a per-key rate limit, so
+the client pool's rotation and failover can be exercised. Requests per key and TCP
+connections opened are counted for connection-reuse checks.
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CANNED = {
+    "class": "STUB",
+    "overall_status": "OK",
+    "compliance_status": "PASS",
+    "detections": [{"rule_checked": "stub", "is_compliant": True, "confidence": 0.99, "evidence": "stub"}],
+    "anomalies_detected": [],
+    "sections": [],
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024 # benchmarks open hundreds of connections at once
+
+
+class StubGemini:
+    def __init__(self, latency=1.0, first_token=None, chunks=8, port=0, key_quota=0, quota_window=60.0):
+        self.latency = latency
+        self.first_token = latency if first_token is None else first_token
+        self.chunks = max(1, chunks)
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.key_quota = key_quota # generate calls per key per window, 0 = unlimited
+        self.quota_window = quota_window
+        self.requests_by_key = {}
+        self.throttled = 0
+        self.connections = 0
+        self._windows = {} # key -> (window start, calls)
+        self._lock = threading.Lock()
+        self.server = _Server(("127.0.0.1", port), self._handler())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _response(self, text):
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": 1290, "candidatesTokenCount": 60, "totalTokenCount": 1350,
+                "promptTokensDetails": [{"modality": "TEXT", "tokenCount": 1032}, {"modality": "IMAGE", "tokenCount": 258}],
+            },
+        }
+
+    def _over_quota(self, key):
+        """Counts a generate call for key; seconds until its window resets if it is over quota."""
+        with self._lock:
+            self.requests_by_key[key] = self.requests_by_key.get(key, 0) + 1
+            if not self.key_quota:
+                return None
+            now = time.time()
+            start, calls = self._windows.get(key, (now, 0))
+            if now - start >= self.quota_window:
+                start, calls = now, 0
+            self._windows[key] = (start, calls + 1)
+            if calls < self.key_quota:
+                return None
+            self.throttled += 1
+            return max(1, round(start + self.quota_window - now))
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def _send(self, status, body, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # models.get (pre-warm)
+                name = self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+                self._send(200, json.dumps({"name": f"models/{name}"}).encode())
+
+            def _count_tokens(self, body):
+                parts = [p for c in json.loads(body or b"{}").get("contents", []) for p in c.get("parts", [])]
+                tokens = sum(258 if "inlineData" in p else max(1, len(p.get("text", "")) // 4) for p in parts)
+                self._send(200, json.dumps({"totalTokens": tokens}).encode())
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if ":countTokens" in self.path:
+                    return self._count_tokens(body)
+                key = self.headers.get("x-goog-api-key") or self.path.partition("key=")[2] or "-"
+                retry_after = stub._over_quota(key)
+                if retry_after:
+                    return self._send(429, json.dumps({"error": {
+                        "code": 429, "message": "Resource has been exhausted (stub quota).", "status": "RESOURCE_EXHAUSTED",
+                        "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_after}s"}],
+                    }}).encode())
+                with stub._lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                try:
+                    text = json.dumps(CANNED)
+                    if ":streamGenerateContent" in self.path:
+                        self._stream(text)
+                    else:
+                        time.sleep(stub.latency)
+                        self._send(200, json.dumps(stub._response(text)).encode())
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _stream(self, text):
+                size = max(1, len(text) // stub.chunks)
+                pieces = [text[i:i + size] for i in range(0, len(text), size)]
+                gap = max(0.0, stub.latency - stub.first_token) / max(1, len(pieces) - 1)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(stub.first_token)
+                for i, piece in enumerate(pieces):
+                    if i:
+                        time.sleep(gap)
+                    event = f"data: {json.dumps(stub._response(piece))}\r\n\r\n".encode()
+                    self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--first-token", type=float)
+    parser.add_argument("--key-quota", type=int, default=0)
+    parser.add_argument("--quota-window", type=float, default=60.0)
+    args = parser.parse_args()
+    stub = StubGemini(args.latency, args.first_token, port=args.port, key_quota=args.key_quota,
+                      quota_window=args.quota_window).start()
+    print(f"Gemini stub on {stub.url} ({args.latency}s per call)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+import storage
+
+# --- CONFIGURATION ---
+# Gemini calls, tokens and latency per monitor, per monitor type and for the whole deployment,
+# for the current day and month. One file shared by every worker/node, like monitors.json.
+USAGE_FILE = os.getenv("USAGE_FILE", "usage.json")
+
+# Deployment-wide budgets. Per monitor: budget_calls_day, budget_calls_month, budget_tokens_day,
+# budget_tokens_month. 0 / empty = unlimited.
+DEPLOYMENT_LIMITS = {
+    "calls_day": float(os.getenv("BUDGET_CALLS_DAY", 0)),
+    "calls_month": float(os.getenv("BUDGET_CALLS_MONTH", 0)),
+    "tokens_day": float(os.getenv("BUDGET_TOKENS_DAY", 0)),
+    "tokens_month": float(os.getenv("BUDGET_TOKENS_MONTH", 0)),
+}
+LIMITS = tuple(DEPLOYMENT_LIMITS)
+FIELDS = tuple(f"budget_{key}" for key in LIMITS)
+
+# Share of a budget used at which a monitor degrades one more step; all of it pauses the monitor
+BUDGET_DEGRADE_AT = tuple(sorted(float(x) for x in os.getenv("BUDGET_DEGRADE_AT", "0.6,0.75,0.9").split(",")))
+BUDGET_INTERVAL_FACTOR = float(os.getenv("BUDGET_INTERVAL_FACTOR", 2)) # step 1: interval x this
+BUDGET_MOTION_FACTOR = float(os.getenv("BUDGET_MOTION_FACTOR", 2))     # step 2: motion threshold x this
+BUDGET_MODEL_POLICY = os.getenv("BUDGET_MODEL_POLICY", "fast")         # step 3: routing policy (no escalation)
+STEPS = ("interval", "motion", "model")
+PAUSED = len(STEPS) + 1
+
+# What one analysis (or a whole period) costs. prompt = text + image (+ anything cached)
+COUNTERS = ("calls", "tokens", "prompt_tokens", "text_tokens", "image_tokens", "cached_tokens",
+            "output_tokens", "thought_tokens", "latency_ms", "queue_ms")
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000) # + one overflow bucket
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+def normalize(data):
+    """The budget fields present in `data`: positive numbers, or None for unlimited. Raises ValueError."""
+    fields = {}
+    for field in FIELDS:
+        if field not in data:
+            continue
+        value = data[field]
+        if value in (None, ""):
+            fields[field] = None
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number")
+        if value < 0:
+            raise ValueError(f"{field} must be >= 0")
+        fields[field] = value or None
+    return fields
+
+def add_usage(usage, response, seconds=None, waited=None):
+    """
+    Adds one model response (or the last chunk of a stream) to a usage tally (COUNTERS, plus
+    "call_ms": each call's duration). `seconds` is the call itself, `waited` its time in the lane queue.
+    """
+    meta = getattr(response, "usage_metadata", None)
+    count = lambda name: int(getattr(meta, name, 0) or 0)
+    by_modality = {}
+    for detail in getattr(meta, "prompt_tokens_details", None) or []:
+        modality = str(getattr(detail.modality, "value", detail.modality)).upper()
+        by_modality[modality] = by_modality.get(modality, 0) + int(detail.token_count or 0)
+    image = by_modality.get("IMAGE", 0)
+    added = {
+        "calls": 1,
+        "tokens": count("total_token_count"),
+        "prompt_tokens": count("prompt_token_count"),
+        "image_tokens": image,
+        # Without a breakdown the whole prompt counts as text
+        "text_tokens": by_modality.get("TEXT", count("prompt_token_count") - image),
+        "cached_tokens": count("cached_content_token_count"),
+        "output_tokens": count("candidates_token_count"),
+        "thought_tokens": count("thoughts_token_count"),
+        "latency_ms": round(seconds * 1000, 1) if seconds is not None else 0,
+        "queue_ms": round(waited * 1000, 1) if waited is not None else 0,
+    }
+    for key, value in added.items():
+        usage[key] = round(usage.get(key, 0) + value, 1)
+    if seconds is not None:
+        usage.setdefault("call_ms", []).append(added["latency_ms"])
+    return usage
+
+def _zero():
+    return {"calls": 0, "tokens": 0}
+
+def _bucket():
+    return {**{key: 0 for key in COUNTERS}, "scans": 0, "latency_hist": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+
+def _add(bucket, usage):
+    for key in COUNTERS:
+        bucket[key] = round(bucket.get(key, 0) + usage.get(key, 0), 1)
+    bucket["scans"] = bucket.get("scans", 0) + 1
+    hist = bucket.setdefault("latency_hist", [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    for ms in usage.get("call_ms", []):
+        hist[sum(1 for bound in LATENCY_BUCKETS_MS if ms > bound)] += 1
+
+def _latency_percentile(hist, q):
+    """Upper bound of the histogram bucket holding the q-th call (None past the last bound)."""
+    total = sum(hist)
+    if not total:
+        return None
+    seen = 0
+    for i, n in enumerate(hist):
+        seen += n
+        if seen >= q * total:
+            return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+def summarize(bucket):
+    """Totals of a ledger bucket plus per-scan averages and latency percentiles."""
+    scans, calls = bucket.get("scans", 0), bucket.get("calls", 0)
+    summary = {key: bucket.get(key, 0) for key in COUNTERS}
+    summary["scans"] = scans
+    summary["per_scan"] = {key: round(bucket.get(key, 0) / scans, 1) for key in COUNTERS if key != "calls"} if scans else None
+    summary["calls_per_scan"] = round(calls / scans, 2) if scans else None
+    summary["latency_avg_ms"] = round(bucket.get("latency_ms", 0) / calls, 1) if calls else None
+    summary["latency_p50_ms"] = _latency_percentile(bucket.get("latency_hist", []), 0.5)
+    summary["latency_p95_ms"] = _latency_percentile(bucket.get("latency_hist", []), 0.95)
+    return summary
+
+def _periods(now):
+    return now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+
+def _pressure(usage, limits):
+    """(share of the tightest budget used, its name)."""
+    worst = (0.0, None)
+    for key, limit in limits.items():
+        metric, period = key.split("_")
+        share = usage[period][metric] / limit
+        if share > worst[0]:
+            worst = (share, key)
+    return worst
+
+
+class Budgets:
+    """
+    Usage ledger + budget evaluation. record() after every model call; level(m) says how far
+    the monitor is degraded: 0 normal, 1..3 = STEPS applied cumulatively, PAUSED = no calls.
+    """
+
+    def __init__(self, path=USAGE_FILE, deployment_limits=None):
+        self.path = path
+        self.deployment_limits = {k: v for k, v in (deployment_limits or DEPLOYMENT_LIMITS).items() if v}
+        self._lock = threading.Lock()
+        self._data = None
+        self._mtime = None
+        self._levels = {} # monitor id -> last level seen here, to log changes once
+
+    # --- ledger ---
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _rolled(self, data):
+        """Starts new day/month buckets when the period changed."""
+        day, month = _periods(datetime.now())
+        if data.get("month") != month:
+            data = {"monitors": {}, "types": {}, "deployment": {"day": _bucket(), "month": _bucket()}}
+        elif data.get("day") != day:
+            for bucket in [data["deployment"], *data["monitors"].values(), *data.setdefault("types", {}).values()]:
+                bucket["day"] = _bucket()
+        data["day"], data["month"] = day, month
+        return data
+
+    def _snapshot(self):
+        """The ledger as last written by any process (re-read only when the file changed)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._data is None or mtime != self._mtime:
+                self._data, self._mtime = self._read(), mtime
+            self._data = self._rolled(self._data)
+            return self._data
+
+    def record(self, monitor_id, usage, monitor_type=None):
+        """Adds one analysis' usage tally to the deployment and (when given) the monitor and its type."""
+        if not usage or not usage.get("calls"):
+            return
+        with self._lock, storage.file_lock(self.path):
+            data = self._rolled(self._read())
+            buckets = [data["deployment"]]
+            if monitor_id:
+                buckets.append(data["monitors"].setdefault(monitor_id, {"day": _bucket(), "month": _bucket()}))
+            if monitor_type:
+                buckets.append(data.setdefault("types", {}).setdefault(monitor_type, {"day": _bucket(), "month": _bucket()}))
+            for bucket in buckets:
+                for period in ("day", "month"):
+                    _add(bucket[period], usage)
+            storage.atomic_write(self.path, json.dumps(data))
+            self._data, self._mtime = data, os.stat(self.path).st_mtime_ns
+
+    def usage(self, monitor_id=None):
+        data = self._snapshot()
+        bucket = data["deployment"] if monitor_id is None else data["monitors"].get(monitor_id)
+        if not bucket:
+            return {"day": _zero(), "month": _zero()}
+        return {period: {"calls": bucket[period]["calls"], "tokens": bucket[period]["tokens"]} for period in ("day", "month")}
+
+    def rollups(self, period="month"):
+        """Summaries for `period` ("day" or "month"): {"deployment", "monitors": {id: ...}, "types": {type: ...}}."""
+        data = json.loads(json.dumps(self._snapshot()))
+        return {
+            "period": data[period],
+            "deployment": summarize(data["deployment"][period]),
+            "monitors": {key: summarize(b[period]) for key, b in data["monitors"].items()},
+            "types": {key: summarize(b[period]) for key, b in data.get("types", {}).items()},
+        }
+
+    # --- evaluation ---
+    def limits(self, m):
+        return {key: float(m[f"budget_{key}"]) for key in LIMITS if m.get(f"budget_{key}")}
+
+    def state(self, m):
+        """Budget state of monitor m (deployment budgets apply to every monitor)."""
+        limits = self.limits(m)
+        usage = self.usage(m["id"])
+        own = _pressure(usage, limits)
+        shared = _pressure(self.usage(), self.deployment_limits) if self.deployment_limits else (0.0, None)
+        pressure, limited_by = own if own[0] >= shared[0] else (shared[0], f"deployment.{shared[1]}")
+        level = PAUSED if pressure >= 1 else sum(1 for at in BUDGET_DEGRADE_AT[:len(STEPS)] if pressure >= at)
+        return {
+            "level": level,
+            "state": "paused" if level == PAUSED else "degraded" if level else "ok",
+            "steps": list(STEPS[:min(level, len(STEPS))]),
+            "pressure": round(min(pressure, 1.0), 4),
+            "limited_by": limited_by if level else None,
+            "usage": usage,
+            "limits": limits,
+        }
+
+    def level(self, m):
+        level = self.state(m)["level"]
+        if self._levels.get(m["id"], 0) != level:
+            self._levels[m["id"]] = level
+            step = "paused" if level == PAUSED else ", ".join(STEPS[:level]) or "normal"
+            print(f"   [$] {m.get('name', m['id'])}: budget level {level} ({step})")
+        return level
+
+    def interval_factor(self, level):
+        return BUDGET_INTERVAL_FACTOR if level >= 1 else 1.0
+
+    def motion_threshold(self, threshold, level):
+        return min(1.0, threshold * BUDGET_MOTION_FACTOR) if level >= 2 else threshold
+
+    def routing_policy(self, m, level):
+        return BUDGET_MODEL_POLICY if level >= 3 else m.get("routing_policy")
+
+    def deployment(self):
+        usage = self.usage()
+        pressure, limited_by = _pressure(usage, self.deployment_limits)
+        return {
+            "usage": usage,
+            "limits": dict(self.deployment_limits),
+            "pressure": round(min(pressure, 1.0), 4),
+            "limited_by": limited_by,
+            "exhausted": pressure >= 1,
+        }
@@ -0,0 +1,416 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+
+import imaging
+
+# --- CONFIGURATION ---
+# Long-lived capture processes. A capture that blows its deadline gets its process killed.
+# 0 = capture on the calling thread (only OpenCV's own FFmpeg timeouts apply).
+CAPTURE_WORKERS = int(os.getenv("CAPTURE_WORKERS", 4))
+CAPTURE_OPEN_TIMEOUT = float(os.getenv("CAPTURE_OPEN_TIMEOUT", 10)) # seconds
+CAPTURE_READ_TIMEOUT = float(os.getenv("CAPTURE_READ_TIMEOUT", 5))  # seconds
+
+# Circuit breaker: after BREAKER_THRESHOLD consecutive failures the camera is OFFLINE and
+# only probed again after an exponential backoff (base * 2^n, capped).
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", 3))
+BREAKER_BASE_BACKOFF = float(os.getenv("BREAKER_BASE_BACKOFF", 30))
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", 1800))
+
+# HTTP cameras that serve a still JPEG are fetched directly with a pooled keep-alive session
+# instead of going through FFmpeg. Per monitor: capture_driver = auto | snapshot | stream.
+SNAPSHOT_TIMEOUT = float(os.getenv("SNAPSHOT_TIMEOUT", 5)) # seconds, connect and read each
+SNAPSHOT_POOL_SIZE = int(os.getenv("SNAPSHOT_POOL_SIZE", 16))
+SNAPSHOT_URL_HINTS = ("snapshot", "snap", "still", "image", "picture", ".jpg", ".jpeg")
+
+CLOSED, OPEN, HALF_OPEN = "CLOSED", "OPEN", "HALF_OPEN"
+DRIVERS = ("auto", "snapshot", "stream")
+
+
+# --- RAW CAPTURE ---
+def _open(cam_input):
+    import cv2
+    if isinstance(cam_input, str):
+        # Network stream: let FFmpeg give up on its own before our hard deadline hits
+        return cv2.VideoCapture(cam_input, cv2.CAP_ANY, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(CAPTURE_OPEN_TIMEOUT * 1000),
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(CAPTURE_READ_TIMEOUT * 1000),
+        ])
+    return cv2.VideoCapture(cam_input)
+
+def grab(cam_input):
+    """
+    Opens the camera and reads one frame.
+    Returns (frame, open_seconds); frame is None if the camera gave nothing.
+    """
+    started = time.perf_counter()
+    cap = _open(cam_input)
+    try:
+        opened = cap.isOpened()
+        open_seconds = time.perf_counter() - started
+        if not opened:
+            return None, open_seconds
+        ret, frame = cap.read()
+        return (frame if ret else None), open_seconds
+    finally:
+        cap.release() # CRITICAL: Prevent Zombie Camera
+
+def _grab_encoded(cam_input):
+    # Already in a capture process here, so encode in place rather than shipping the raw frame out
+    frame, open_seconds = grab(cam_input)
+    if frame is None:
+        return None, None, open_seconds
+    buffer, thumb = imaging._encode_with_thumbnail(frame)
+    return (buffer.tobytes() if buffer is not None else None), thumb, open_seconds
+
+def _worker_main(conn):
+    while True:
+        try:
+            cam_input = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            conn.send(("ok", _grab_encoded(cam_input)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class CaptureTimeout(Exception):
+    pass
+
+
+class CaptureWorker:
+    """One capture process. Killed and replaced if a capture overruns its deadline."""
+
+    def __init__(self):
+        ctx = mp.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def capture(self, cam_input, deadline):
+        self.conn.send(cam_input)
+        if not self.conn.poll(deadline):
+            raise CaptureTimeout(f"capture exceeded {deadline:.0f}s")
+        status, payload = self.conn.recv()
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+_idle_workers = queue.Queue()
+_worker_slots = threading.BoundedSemaphore(max(1, CAPTURE_WORKERS))
+
+def _capture_isolated(cam_input):
+    deadline = CAPTURE_OPEN_TIMEOUT + CAPTURE_READ_TIMEOUT + 5 # slack for the process' own startup
+    with _worker_slots:
+        try:
+            worker = _idle_workers.get_nowait()
+        except queue.Empty:
+            worker = CaptureWorker()
+        try:
+            result = worker.capture(cam_input, deadline)
+        except Exception:
+            worker.kill() # Could be wedged inside FFmpeg; never reuse it
+            raise
+        if worker.alive():
+            _idle_workers.put(worker)
+        return result
+
+
+# --- HTTP SNAPSHOTS ---
+class NotASnapshot(Exception):
+    pass
+
+
+_session = None
+_session_lock = threading.Lock()
+_snapshots = {}         # camera -> {"etag", "last_modified", "frame"} for conditional requests
+_not_snapshots = set()  # auto-detected URLs that turned out not to serve a still image
+snapshot_stats = {"fetches": 0, "not_modified": 0, "bytes": 0, "fallbacks": 0}
+
+def _http():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=SNAPSHOT_POOL_SIZE, pool_maxsize=SNAPSHOT_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def is_snapshot_url(cam_input):
+    if not isinstance(cam_input, str) or not cam_input.lower().startswith(("http://", "https://")):
+        return False
+    path = cam_input.lower().split("://", 1)[1].split("?", 1)[0]
+    return any(hint in path for hint in SNAPSHOT_URL_HINTS)
+
+def select_driver(cam_input, driver=None):
+    driver = driver or "auto"
+    if driver == "auto":
+        if cam_input in _not_snapshots or not is_snapshot_url(cam_input):
+            return "stream"
+        return "snapshot"
+    return driver
+
+def fetch_snapshot(cam_input):
+    """
+    GETs a still JPEG, conditionally when the camera gave us an ETag/Last-Modified before.
+    Returns (frame, seconds). A 304 hands back the previous Frame (thumbnail, crops and all).
+    The JPEG is never decoded here; later stages decode it only if they need pixels.
+    """
+    import imaging
+    cached = _snapshots.get(cam_input)
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    started = time.perf_counter()
+    with _http().get(cam_input, headers=headers, timeout=SNAPSHOT_TIMEOUT) as response:
+        seconds = time.perf_counter() - started
+        snapshot_stats["fetches"] += 1
+        if response.status_code == 304 and cached:
+            snapshot_stats["not_modified"] += 1
+            return cached["frame"], seconds
+        response.raise_for_status()
+        if not response.headers.get("Content-Type", "image/jpeg").startswith("image/"):
+            raise NotASnapshot(f"{response.headers.get('Content-Type')} is not a still image")
+        jpeg_bytes = response.content
+    if not jpeg_bytes:
+        return None, seconds
+
+    snapshot_stats["bytes"] += len(jpeg_bytes)
+    frame = imaging.Frame.from_jpeg(cam_input, jpeg_bytes)
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if etag or last_modified:
+        _snapshots[cam_input] = {"etag": etag, "last_modified": last_modified, "frame": frame}
+    else:
+        _snapshots.pop(cam_input, None)
+    return frame, seconds
+
+
+# --- CAMERA HEALTH ---
+class CameraHealth:
+    """Per-camera health and circuit breaker state."""
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+        self.mean_open_latency = None
+        self.next_attempt = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self, now=None):
+        """Whether a capture may be attempted now. An OPEN breaker lets one half-open probe through once its backoff expires."""
+        now = now or time.time()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now >= self.next_attempt:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def ready(self, now=None):
+        """allow() without taking the half-open probe: whether a capture would be attempted now."""
+        now = now or time.time()
+        with self._lock:
+            return self.state == CLOSED or (self.state == OPEN and now >= self.next_attempt)
+
+    def _observe_latency(self, seconds):
+        if seconds is None:
+            return
+        if self.mean_open_latency is None:
+            self.mean_open_latency = seconds
+        else:
+            self.mean_open_latency = 0.8 * self.mean_open_latency + 0.2 * seconds
+
+    def record_success(self, open_seconds):
+        with self._lock:
+            self._observe_latency(open_seconds)
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.total_successes += 1
+            self.last_success = time.time()
+
+    def record_failure(self, error, open_seconds=None):
+        with self._lock:
+            self._observe_latency(open_seconds)
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            self.last_failure = time.time()
+            self.last_error = error
+            if self.state == HALF_OPEN or self.consecutive_failures >= BREAKER_THRESHOLD:
+                exponent = max(0, self.consecutive_failures - BREAKER_THRESHOLD)
+                backoff = min(BREAKER_MAX_BACKOFF, BREAKER_BASE_BACKOFF * (2 ** exponent))
+                self.state = OPEN
+                self.next_attempt = self.last_failure + backoff
+
+    _PERSISTED = ("state", "consecutive_failures", "total_successes", "total_failures",
+                  "last_success", "last_failure", "last_error", "mean_open_latency", "next_attempt")
+
+    def dump(self):
+        with self._lock:
+            state = {k: getattr(self, k) for k in self._PERSISTED}
+        if state["state"] == HALF_OPEN: # probe was in flight; probe again straight away
+            state.update(state=OPEN, next_attempt=0.0)
+        return state
+
+    def load(self, state):
+        with self._lock:
+            for k in self._PERSISTED:
+                if k in state:
+                    setattr(self, k, state[k])
+
+    @property
+    def online(self):
+        return self.state == CLOSED
+
+    def to_dict(self):
+        def iso(ts):
+            return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts)) if ts else None
+        with self._lock:
+            return {
+                "camera": str(self.camera),
+                "status": "OK" if self.online else "OFFLINE",
+                "breaker": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_successes": self.total_successes,
+                "total_failures": self.total_failures,
+                "last_success": iso(self.last_success),
+                "last_failure": iso(self.last_failure),
+                "last_error": self.last_error,
+                "mean_open_latency": round(self.mean_open_latency, 3) if self.mean_open_latency is not None else None,
+                "next_attempt": iso(self.next_attempt) if self.state == OPEN else None,
+            }
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+# Rough per-camera footprint of a CameraHealth entry, for memory accounting
+HEALTH_ENTRY_BYTES = 1024
+
+def health_for(cam_input):
+    key = str(cam_input)
+    with _health_lock:
+        if key not in _health:
+            _health[key] = CameraHealth(cam_input)
+        return _health[key]
+
+def cameras():
+    with _health_lock:
+        return list(_health)
+
+def state_nbytes(camera):
+    """Approximate memory held for a camera (health entry plus any cached snapshot)."""
+    cached = _snapshots.get(camera)
+    return HEALTH_ENTRY_BYTES + (cached["frame"].nbytes if cached else 0)
+
+def forget(camera):
+    with _health_lock:
+        _health.pop(str(camera), None)
+    for key in list(_snapshots):
+        if str(key) == str(camera):
+            _snapshots.pop(key, None)
+
+def dump_health():
+    with _health_lock:
+        entries = list(_health.items())
+    return {key: h.dump() for key, h in entries}
+
+def load_health(states):
+    """Restores breaker state from a snapshot; cameras already seen by this process keep theirs."""
+    restored = 0
+    for key, state in states.items():
+        with _health_lock:
+            if key in _health:
+                continue
+            health = _health[key] = CameraHealth(int(key) if key.isdigit() else key)
+        health.load(state)
+        restored += 1
+    return restored
+
+def all_health():
+    with _health_lock:
+        entries = list(_health.values())
+    return [h.to_dict() for h in entries]
+
+
+# --- PUBLIC API ---
+def capture(cam_input, driver=None):
+    """
+    Captures one frame under the camera's circuit breaker.
+    Returns an imaging.Frame, or None if the breaker is open or the capture failed.
+    """
+    health = health_for(cam_input)
+    if not health.allow():
+        return None
+
+    if select_driver(cam_input, driver) == "snapshot":
+        try:
+            frame, seconds = fetch_snapshot(cam_input)
+        except NotASnapshot as e:
+            if driver == "snapshot":
+                health.record_failure(str(e))
+                return None
+            # Guessed wrong from the URL (e.g. an MJPEG stream): use the stream path from now on
+            print(f"   [i] {cam_input}: {e}, falling back to stream capture")
+            snapshot_stats["fallbacks"] += 1
+            _not_snapshots.add(cam_input)
+            # Straight to the stream path: allow() already let this attempt through (and moved an
+            # OPEN breaker to HALF_OPEN), asking again would refuse it and leave the probe unrecorded
+            return _capture_stream(cam_input, health)
+        except Exception as e:
+            print(f"   [!] Snapshot Error ({cam_input}): {e}")
+            health.record_failure(str(e))
+            return None
+        if frame is None:
+            health.record_failure("empty snapshot")
+            return None
+        health.record_success(seconds)
+        return frame
+    return _capture_stream(cam_input, health)
+
+def _capture_stream(cam_input, health):
+    """OpenCV/FFmpeg capture, result recorded on the camera's breaker. The caller has checked allow()."""
+    open_seconds = None
+    try:
+        if CAPTURE_WORKERS > 0:
+            jpeg_bytes, thumb, open_seconds = _capture_isolated(cam_input)
+        else:
+            frame, open_seconds = grab(cam_input)
+            jpeg_bytes, thumb = imaging.encode_frame(cam_input, frame) if frame is not None else (None, None)
+    except Exception as e:
+        print(f"   [!] Capture Error ({cam_input}): {e}")
+        health.record_failure(str(e), open_seconds)
+        return None
+
+    if not jpeg_bytes:
+        health.record_failure("no frame", open_seconds)
+        return None
+    health.record_success(open_seconds)
+    return imaging.Frame(cam_input, jpeg=jpeg_bytes, thumbnail=thumb)
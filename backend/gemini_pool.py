@@ -0,0 +1,263 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+# --- CONFIGURATION ---
+# One client per key (or Vertex AI project); calls go to the least-loaded one that isn't cooling down.
+#   GEMINI_API_KEYS="key1,key2,vertex:my-project@europe-west4"   (GEMINI_API_KEY alone still works)
+# vertex:<project>[@<location>] entries use application default credentials.
+# Keys and GEMINI_BASE_URL (e.g. a local stub server for benchmarks) are read when the pool is built,
+# after main.py has loaded .env.
+def configured_keys():
+    return [k.strip() for k in (os.getenv("GEMINI_API_KEYS") or os.getenv("GEMINI_API_KEY") or "").split(",") if k.strip()]
+
+# Connection reuse, per client. HTTP/2 multiplexes every call over one connection (needs the h2 package).
+GEMINI_HTTP2 = os.getenv("GEMINI_HTTP2", "false").lower() in ("1", "true", "yes")
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", 100))
+GEMINI_MAX_KEEPALIVE = int(os.getenv("GEMINI_MAX_KEEPALIVE", 20))
+GEMINI_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", 30)) # seconds an idle connection is kept
+
+# Health: a throttled key (429) rests for the server's retry delay, or KEY_COOLDOWN doubling up to
+# KEY_MAX_COOLDOWN; KEY_FAILURE_THRESHOLD server/connection errors in a row take a key out the same way.
+KEY_COOLDOWN = float(os.getenv("KEY_COOLDOWN", 10))
+KEY_MAX_COOLDOWN = float(os.getenv("KEY_MAX_COOLDOWN", 300))
+KEY_FAILURE_THRESHOLD = int(os.getenv("KEY_FAILURE_THRESHOLD", 3))
+
+_LATENCY_WINDOW = 500
+
+
+def label(entry):
+    """Printable name for a pool entry: never the key itself."""
+    if entry is None:
+        return "default"
+    if entry.startswith("vertex:"):
+        return entry
+    return f"key…{entry[-4:]}"
+
+@lru_cache(maxsize=None)
+def http2_enabled():
+    if not GEMINI_HTTP2:
+        return False
+    try:
+        import h2 # noqa: F401
+        return True
+    except ImportError:
+        print("   [!] GEMINI_HTTP2 needs the h2 package (pip install httpx[http2]); using HTTP/1.1")
+        return False
+
+def http_options(base_url=None):
+    """HttpOptions for every client: the connection limits apply to its sync and async httpx clients."""
+    import httpx
+    client_args = {
+        "http2": http2_enabled(),
+        "limits": httpx.Limits(max_connections=GEMINI_MAX_CONNECTIONS,
+                               max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+                               keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY),
+    }
+    options = {"client_args": client_args, "async_client_args": dict(client_args)}
+    if base_url:
+        options["base_url"] = base_url
+    return options
+
+def make_client(entry, base_url=None):
+    from google import genai
+    if entry and entry.startswith("vertex:"):
+        project, _, location = entry[len("vertex:"):].partition("@")
+        return genai.Client(vertexai=True, project=project, location=location or "global",
+                            http_options=http_options(base_url))
+    # No entry: the SDK falls back to its own environment variables
+    return genai.Client(api_key=entry, http_options=http_options(base_url))
+
+def classify(error):
+    """"throttled", "unhealthy" (the key/endpoint's fault, try another) or None (the request's own fault)."""
+    code = getattr(error, "code", None)
+    if code == 429:
+        return "throttled"
+    if isinstance(code, int) and code >= 500:
+        return "unhealthy"
+    try:
+        import httpx
+        if isinstance(error, httpx.TransportError):
+            return "unhealthy"
+    except ImportError:
+        pass
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return "unhealthy"
+    return None
+
+def retry_delay(error):
+    """Seconds from a 429's RetryInfo detail ("retryDelay": "13s"), if the server sent one."""
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details", [])
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("RetryInfo"):
+            try:
+                return float(str(detail.get("retryDelay", "")).rstrip("s")) or None
+            except ValueError:
+                return None
+    return None
+
+
+class _Member:
+    def __init__(self, entry):
+        self.entry = entry
+        self.label = label(entry)
+        self.client = None
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.failures = 0 # consecutive unhealthy errors
+        self.cooldown = 0.0
+        self.cooldown_until = 0.0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+
+
+class GeminiPool:
+    """
+    Clients for several keys/projects. call()/acall() run fn(client) on the least-loaded client
+    that isn't cooling down and fail over to the next one on throttling or server errors;
+    lease() hands out a client for streams (no failover once the stream has started).
+    """
+
+    def __init__(self, entries=None, base_url=None, factory=None):
+        entries = configured_keys() if entries is None else entries
+        base_url = base_url or os.getenv("GEMINI_BASE_URL")
+        self._members = [_Member(entry) for entry in entries] or [_Member(None)]
+        self._factory = factory or (lambda entry: make_client(entry, base_url))
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.failovers = 0
+
+    def __len__(self):
+        return len(self._members)
+
+    def _client(self, member):
+        if member.client is None:
+            with self._lock:
+                if member.client is None:
+                    member.client = self._factory(member.entry)
+        return member.client
+
+    def clients(self):
+        return [self._client(member) for member in self._members]
+
+    def _acquire(self, exclude=()):
+        with self._lock:
+            now = time.time()
+            candidates = [m for m in self._members if m not in exclude]
+            healthy = [m for m in candidates if m.cooldown_until <= now]
+            # Everyone cooling down: the one that recovers first is still better than failing outright
+            member = (min(healthy, key=lambda m: (m.in_flight, m.calls)) if healthy
+                      else min(candidates, key=lambda m: m.cooldown_until))
+            member.in_flight += 1
+            member.calls += 1
+            return member
+
+    def _release(self, member, seconds, error=None):
+        """Books the call; returns True when the error says another client could succeed."""
+        kind = classify(error) if error is not None else None
+        with self._lock:
+            member.in_flight -= 1
+            member.busy_seconds += seconds
+            member.latencies.append(seconds)
+            if error is not None:
+                member.errors += 1
+            if kind == "throttled":
+                member.throttled += 1
+                self._cool_down(member, retry_delay(error))
+            elif kind == "unhealthy":
+                member.failures += 1
+                if member.failures >= KEY_FAILURE_THRESHOLD:
+                    self._cool_down(member)
+            elif error is None:
+                member.failures = 0
+                member.cooldown = 0.0
+        return kind is not None
+
+    def _cool_down(self, member, delay=None):
+        member.cooldown = delay or min(KEY_MAX_COOLDOWN, member.cooldown * 2 or KEY_COOLDOWN)
+        member.cooldown_until = time.time() + member.cooldown
+        print(f"   [!] Gemini {member.label}: resting {member.cooldown:.0f}s")
+
+    def _failover(self, member, tried, error):
+        tried.append(member)
+        if len(tried) >= len(self._members):
+            return False
+        self.failovers += 1
+        print(f"   [~] Gemini {member.label} failed ({error.__class__.__name__}), retrying on another key")
+        return True
+
+    def call(self, fn):
+        tried = []
+        while True:
+            member = self._acquire(tried)
+            started = time.perf_counter()
+            try:
+                result = fn(self._client(member))
+            except Exception as e:
+                if not (self._release(member, time.perf_counter() - started, e) and self._failover(member, tried, e)):
+                    raise
+                continue
+            self._release(member, time.perf_counter() - started)
+            return result
+
+    async def acall(self, fn):
+        """call() for a coroutine function fn(client)."""
+        tried = []
+        while True:
+            member = self._acquire(tried)
+            started = time.perf_counter()
+            try:
+                result = await fn(self._client(member))
+            except Exception as e:
+                if not (self._release(member, time.perf_counter() - started, e) and self._failover(member, tried, e)):
+                    raise
+                continue
+            self._release(member, time.perf_counter() - started)
+            return result
+
+    @contextmanager
+    def lease(self):
+        """A client for the duration of the block (sync or async code); its outcome counts toward the key's health."""
+        member = self._acquire()
+        started = time.perf_counter()
+        try:
+            yield self._client(member)
+        except BaseException as e:
+            self._release(member, time.perf_counter() - started, e if isinstance(e, Exception) else None)
+            raise
+        self._release(member, time.perf_counter() - started)
+
+    def stats(self):
+        uptime = max(1e-9, time.time() - self._started)
+        with self._lock:
+            now = time.time()
+            total = sum(m.calls for m in self._members) or 1
+            keys = {}
+            for m in self._members:
+                latencies = sorted(m.latencies)
+                keys[m.label] = {
+                    "state": "cooling_down" if m.cooldown_until > now else "healthy",
+                    "cooldown_remaining": round(max(0.0, m.cooldown_until - now), 1),
+                    "in_flight": m.in_flight,
+                    "calls": m.calls,
+                    "share": round(m.calls / total, 4),
+                    "errors": m.errors,
+                    "throttled": m.throttled,
+                    # average calls in flight since start: how busy the key has been
+                    "utilization": round(m.busy_seconds / uptime, 3),
+                    "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                }
+            return {
+                "keys": keys,
+                "failovers": self.failovers,
+                "http2": http2_enabled(),
+                "max_connections": GEMINI_MAX_CONNECTIONS,
+                "max_keepalive": GEMINI_MAX_KEEPALIVE,
+            }
@@ -0,0 +1,406 @@
+import os
+import time
+import zlib
+import atexit
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+# cv2 / numpy are imported inside the functions that need them, so API-only
+# processes can import this module without paying for OpenCV.
+
+# --- CONFIGURATION ---
+# Number of image worker processes. 0 = run everything inline on the calling thread.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", os.cpu_count() or 1))
+IMAGE_TASK_TIMEOUT = float(os.getenv("IMAGE_TASK_TIMEOUT", 30))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 95))
+
+# Size of the grayscale thumbnail used for motion comparison
+THUMB_SIZE = (100, 100)
+
+
+# --- CORE IMAGE OPS (run inside a worker, or inline) ---
+def _thumbnail_from_gray(gray):
+    import cv2
+    return cv2.resize(gray, THUMB_SIZE)
+
+def _thumbnail_from_jpeg(jpeg_view):
+    import cv2
+    import numpy as np
+    nparr = np.frombuffer(jpeg_view, np.uint8)
+    gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    return _thumbnail_from_gray(gray)
+
+def _encode_with_thumbnail(frame):
+    """Encodes a BGR frame to JPEG and builds its thumbnail from the raw pixels (no decode round-trip)."""
+    import cv2
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    thumb = _thumbnail_from_gray(gray)
+    return (buffer if ok else None), thumb
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+# --- WORKER TASKS (frames arrive through shared memory, not pickling) ---
+def _pin_worker(lane):
+    """Pins a lane's process to one core so a camera's frames keep hitting the same caches."""
+    if not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpus[lane % len(cpus)]})
+    except OSError:
+        pass
+
+def _thumbnail_task(shm_name, size):
+    started = time.perf_counter()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        thumb = _thumbnail_from_jpeg(shm.buf[:size])
+    finally:
+        shm.close()
+    return thumb, time.perf_counter() - started
+
+def _encode_task(shm_name, shape, dtype):
+    """Encodes the frame held in shared memory and writes the JPEG back into the same segment."""
+    import numpy as np
+    started = time.perf_counter()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        buffer, thumb = _encode_with_thumbnail(frame)
+        del frame
+        if buffer is None:
+            return (0, None, thumb), time.perf_counter() - started
+        buffer = buffer.reshape(-1)
+        if buffer.nbytes > shm.size:
+            # Pathological case (tiny/noisy frame): fall back to returning the bytes
+            return (buffer.nbytes, buffer.tobytes(), thumb), time.perf_counter() - started
+        shm.buf[:buffer.nbytes] = buffer.data
+        return (buffer.nbytes, None, thumb), time.perf_counter() - started
+    finally:
+        shm.close()
+
+
+# --- POOL ---
+class ImagePool:
+    """
+    A set of single-process lanes. Work for the same key (camera URL / monitor id)
+    always lands on the same lane, so that lane's core keeps the camera's data warm.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(0, workers)
+        self._executors = [None] * self.workers
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._stats = [self._empty_stats() for _ in range(max(1, self.workers))]
+
+    @staticmethod
+    def _empty_stats():
+        return {"submitted": 0, "completed": 0, "failed": 0, "in_flight": 0, "busy_seconds": 0.0}
+
+    def lane_for(self, key):
+        if self.workers == 0:
+            return 0
+        return zlib.crc32(str(key).encode()) % self.workers
+
+    def _executor(self, lane):
+        with self._lock:
+            if self._executors[lane] is None:
+                self._executors[lane] = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=mp.get_context("spawn"),
+                    initializer=_pin_worker,
+                    initargs=(lane,),
+                )
+            return self._executors[lane]
+
+    def _reset(self, lane):
+        with self._lock:
+            executor, self._executors[lane] = self._executors[lane], None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, key, task, *args):
+        """Runs a worker task on the key's lane and returns its result."""
+        lane = self.lane_for(key)
+        stats = self._stats[lane]
+        with self._lock:
+            stats["submitted"] += 1
+            stats["in_flight"] += 1
+        try:
+            if self.workers == 0:
+                result, busy = task(*args)
+            else:
+                try:
+                    result, busy = self._executor(lane).submit(task, *args).result(timeout=IMAGE_TASK_TIMEOUT)
+                except BrokenProcessPool:
+                    print(f"   [!] Image lane {lane} crashed, restarting it")
+                    self._reset(lane)
+                    result, busy = task(*args)
+            with self._lock:
+                stats["completed"] += 1
+                stats["busy_seconds"] += busy
+            return result
+        except Exception:
+            with self._lock:
+                stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                stats["in_flight"] -= 1
+
+    def stats(self):
+        elapsed = max(time.time() - self._started, 1e-9)
+        with self._lock:
+            lanes = []
+            for i, s in enumerate(self._stats):
+                lane = dict(s)
+                lane["lane"] = i
+                lane["busy_seconds"] = round(s["busy_seconds"], 3)
+                lane["utilization"] = round(s["busy_seconds"] / elapsed, 4)
+                lanes.append(lane)
+        busy = sum(l["busy_seconds"] for l in lanes)
+        return {
+            "workers": self.workers,
+            "mode": "process" if self.workers else "inline",
+            "uptime_seconds": round(elapsed, 1),
+            "utilization": round(busy / (elapsed * max(1, self.workers)), 4),
+            "lanes": lanes,
+        }
+
+    def shutdown(self):
+        for lane in range(self.workers):
+            self._reset(lane)
+
+
+pool = ImagePool(IMAGE_WORKERS)
+atexit.register(pool.shutdown)
+
+
+# --- PUBLIC API ---
+def _shared_copy(data_view, nbytes):
+    shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+    shm.buf[:nbytes] = data_view
+    return shm
+
+def thumbnail_from_jpeg(key, jpeg_bytes):
+    """Decodes JPEG bytes into the grayscale motion thumbnail. Returns None if undecodable."""
+    if pool.workers == 0:
+        return pool.run(key, _timed, _thumbnail_from_jpeg, jpeg_bytes)
+    view = memoryview(jpeg_bytes).cast("B")
+    shm = _shared_copy(view, view.nbytes)
+    try:
+        return pool.run(key, _thumbnail_task, shm.name, view.nbytes)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def encode_frame(key, frame):
+    """
+    Encodes a captured BGR frame to JPEG bytes and builds its motion thumbnail in one trip.
+    Returns (jpeg_bytes, thumbnail); jpeg_bytes is None if encoding failed.
+    """
+    if pool.workers == 0:
+        buffer, thumb = pool.run(key, _timed, _encode_with_thumbnail, frame)
+        return (buffer.tobytes() if buffer is not None else None), thumb
+
+    import numpy as np
+    frame = np.ascontiguousarray(frame)
+    shm = _shared_copy(frame.reshape(-1).data, frame.nbytes)
+    try:
+        size, overflow, thumb = pool.run(key, _encode_task, shm.name, frame.shape, frame.dtype.str)
+        if overflow is not None:
+            return overflow, thumb
+        return (bytes(shm.buf[:size]) if size else None), thumb
+    finally:
+        shm.close()
+        shm.unlink()
+
+def stats():
+    return pool.stats()
+
+
+# --- FRAME ---
+class Frame:
+    """
+    One captured or uploaded image shared by every stage of a scan (motion gate, Gemini
+    upload, log/dead-letter write). Each view is computed at most once, on first use:
+      pixels     - decoded BGR ndarray
+      jpeg_view  - memoryview over the encoded JPEG (no copy)
+      jpeg_bytes - the same JPEG as `bytes`, for APIs that insist on it
+      thumbnail  - grayscale motion thumbnail
+    """
+
+    def __init__(self, key, jpeg=None, pixels=None, thumbnail=None):
+        if jpeg is None and pixels is None:
+            raise ValueError("Frame needs JPEG data or pixels")
+        self.key = key
+        self._jpeg = jpeg
+        self._pixels = pixels
+        self._thumbnail = thumbnail
+        self._regions = {}
+        self.views_built = []
+
+    @classmethod
+    def from_jpeg(cls, key, data):
+        return cls(key, jpeg=data)
+
+    @classmethod
+    def from_pixels(cls, key, pixels):
+        return cls(key, pixels=pixels)
+
+    @property
+    def jpeg_bytes(self):
+        if self._jpeg is None:
+            self._jpeg, thumb = encode_frame(self.key, self._pixels)
+            self.views_built.append("jpeg")
+            if self._thumbnail is None:
+                self._thumbnail = thumb
+        elif not isinstance(self._jpeg, bytes):
+            # e.g. an ndarray straight out of cv2.imencode: materialise once
+            self._jpeg = memoryview(self._jpeg).cast("B").tobytes()
+            self.views_built.append("jpeg_bytes")
+        return self._jpeg
+
+    @property
+    def jpeg_view(self):
+        if self._jpeg is None:
+            self.jpeg_bytes
+        return memoryview(self._jpeg).cast("B")
+
+    @property
+    def pixels(self):
+        if self._pixels is None:
+            import cv2
+            import numpy as np
+            self._pixels = cv2.imdecode(np.frombuffer(self.jpeg_view, np.uint8), cv2.IMREAD_COLOR)
+            self.views_built.append("pixels")
+        return self._pixels
+
+    @property
+    def thumbnail(self):
+        if self._thumbnail is None:
+            if self._pixels is not None:
+                import cv2
+                gray = cv2.cvtColor(self._pixels, cv2.COLOR_BGR2GRAY) if self._pixels.ndim == 3 else self._pixels
+                self._thumbnail = _thumbnail_from_gray(gray)
+            else:
+                self._thumbnail = thumbnail_from_jpeg(self.key, self.jpeg_view)
+            self.views_built.append("thumbnail")
+        return self._thumbnail
+
+    @property
+    def nbytes(self):
+        return self.jpeg_view.nbytes
+
+    def regions(self, rois, tiles=False):
+        """
+        Cropped/masked views of this frame for a monitor's regions of interest.
+        Returns (gate_frame, upload_frames, report):
+          gate_frame    - union of the ROIs, outside pixels masked; used for motion gating
+          upload_frames - [gate_frame], or one masked crop per ROI when `tiles` is set
+          report        - pixels/bytes removed compared with sending the whole frame
+        Without ROIs the frame itself is returned. Cached per ROI set, so monitors sharing a
+        camera and ROI only crop once.
+        """
+        if not rois:
+            return self, [self], None
+        cache_key = (repr(rois), bool(tiles))
+        if cache_key not in self._regions:
+            self._regions[cache_key] = _crop_regions(self, rois, tiles)
+            self.views_built.append("regions")
+        return self._regions[cache_key]
+
+
+# --- REGIONS OF INTEREST ---
+# ROIs use coordinates normalised to 0..1 so they survive camera resolution changes:
+#   {"type": "rect", "x": 0.1, "y": 0.2, "w": 0.5, "h": 0.3}
+#   {"type": "polygon", "points": [[0.1, 0.1], [0.6, 0.1], [0.4, 0.7]]}
+def normalize_rois(rois):
+    """Validates ROI definitions (list or JSON string). Raises ValueError on bad input."""
+    import json
+    if rois in (None, "", []):
+        return []
+    if isinstance(rois, str):
+        rois = json.loads(rois)
+    if not isinstance(rois, list):
+        raise ValueError("rois must be a list")
+
+    clean = []
+    for roi in rois:
+        kind = roi.get("type", "rect")
+        if kind == "rect":
+            x, y, w, h = (float(roi[k]) for k in ("x", "y", "w", "h"))
+            if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > 1.0001 or y + h > 1.0001:
+                raise ValueError(f"rect ROI out of bounds: {roi}")
+            clean.append({"type": "rect", "x": x, "y": y, "w": w, "h": h})
+        elif kind == "polygon":
+            points = [[float(px), float(py)] for px, py in roi["points"]]
+            if len(points) < 3 or any(not (0 <= v <= 1) for pt in points for v in pt):
+                raise ValueError(f"polygon ROI needs >= 3 points within 0..1: {roi}")
+            clean.append({"type": "polygon", "points": points})
+        else:
+            raise ValueError(f"Unknown ROI type: {kind}")
+    return clean
+
+def _roi_polygon(roi, width, height):
+    import numpy as np
+    if roi["type"] == "rect":
+        x0, y0 = roi["x"] * width, roi["y"] * height
+        x1, y1 = x0 + roi["w"] * width, y0 + roi["h"] * height
+        points = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+    else:
+        points = [[px * width, py * height] for px, py in roi["points"]]
+    return np.round(np.array(points)).astype(np.int32)
+
+def _masked_crop(pixels, polygons):
+    import cv2
+    import numpy as np
+    height, width = pixels.shape[:2]
+    stacked = np.concatenate(polygons)
+    x0, y0 = np.clip(stacked.min(axis=0), 0, [width - 1, height - 1])
+    x1, y1 = np.clip(stacked.max(axis=0), 1, [width, height])
+    x1, y1 = max(x1, x0 + 1), max(y1, y0 + 1)
+    crop = pixels[y0:y1, x0:x1]
+    mask = np.zeros(crop.shape[:2], np.uint8)
+    cv2.fillPoly(mask, [(p - [x0, y0]).astype(np.int32) for p in polygons], 255)
+    if cv2.countNonZero(mask) == mask.size:
+        return np.ascontiguousarray(crop) # Plain rectangles need no masking
+    return cv2.bitwise_and(crop, crop, mask=mask)
+
+def _crop_regions(frame, rois, tiles):
+    pixels = frame.pixels
+    if pixels is None:
+        return frame, [frame], None # Undecodable frame: nothing to crop, let the AI path deal with it
+    height, width = pixels.shape[:2]
+    polygons = [_roi_polygon(roi, width, height) for roi in rois]
+
+    gate = Frame.from_pixels(f"{frame.key}:roi", _masked_crop(pixels, polygons))
+    if tiles:
+        uploads = [Frame.from_pixels(f"{frame.key}:roi{i}", _masked_crop(pixels, [p])) for i, p in enumerate(polygons)]
+    else:
+        uploads = [gate]
+
+    pixels_in = width * height
+    pixels_out = sum(f.pixels.shape[0] * f.pixels.shape[1] for f in uploads)
+    bytes_in = frame.nbytes
+    bytes_out = sum(f.nbytes for f in uploads)
+    report = {
+        "pixels_in": pixels_in,
+        "pixels_removed": pixels_in - pixels_out,
+        "bytes_in": bytes_in,
+        "bytes_removed": bytes_in - bytes_out,
+        "tiles": len(uploads),
+    }
+    return gate, uploads, report
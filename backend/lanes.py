@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+# --- CONFIGURATION ---
+# Gemini calls in flight per process (0 = unlimited). Callers beyond it queue in their lane.
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", 16))
+# The same cap for an asgi.py process, which replaces MODEL_CONCURRENCY there: one event loop holds
+# hundreds of awaiting calls where a threaded worker holds one per thread, so its cap is much higher.
+ASYNC_MODEL_CONCURRENCY = int(os.getenv("ASYNC_MODEL_CONCURRENCY", 512))
+
+# interactive: rule previews and replays someone is watching
+# triggered:   /monitors/<id>/trigger (POS signals, bridge pushes)
+# background:  scheduler interval scans
+INTERACTIVE, TRIGGERED, BACKGROUND = "interactive", "triggered", "background"
+LANES = (INTERACTIVE, TRIGGERED, BACKGROUND)
+
+# Share of freed slots each lane gets while several are queued (weighted fair)
+LANE_WEIGHTS = {INTERACTIVE: 8.0, TRIGGERED: 4.0, BACKGROUND: 1.0}
+LANE_WEIGHTS.update({k.strip(): float(v) for k, v in (
+    pair.split("=") for pair in os.getenv("LANE_WEIGHTS", "").split(",") if "=" in pair)})
+# Starvation protection: a call queued this long (seconds) goes next, whatever its lane
+LANE_MAX_WAIT = float(os.getenv("LANE_MAX_WAIT", 30))
+
+_WAIT_WINDOW = 500
+
+
+class _Waiter:
+    __slots__ = ("lane", "enqueued", "grant")
+
+    def __init__(self, lane, grant):
+        self.lane = lane
+        self.enqueued = time.perf_counter()
+        self.grant = grant
+
+
+class LaneScheduler:
+    """
+    Admission control for model calls. Up to `capacity` calls run at once; when a slot frees,
+    the next caller is picked by stride scheduling over the lanes' weights, except that anyone
+    who has waited max_wait seconds goes first. Works for threads (slot) and coroutines
+    (async_slot) sharing the same capacity.
+    """
+
+    def __init__(self, capacity=MODEL_CONCURRENCY, weights=None, max_wait=LANE_MAX_WAIT):
+        self.capacity = capacity
+        self.weights = {lane: max(0.01, (weights or LANE_WEIGHTS).get(lane, 1.0)) for lane in LANES}
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queues = {lane: deque() for lane in LANES}
+        self._pass = {lane: 0.0 for lane in LANES}
+        self._vtime = 0.0
+        self._in_flight = 0
+        self._stats = {lane: {"admitted": 0, "queued": 0, "promoted": 0, "in_flight": 0,
+                              "waits": deque(maxlen=_WAIT_WINDOW)} for lane in LANES}
+
+    def _has_room(self):
+        return not self.capacity or self._in_flight < self.capacity
+
+    def _admit(self, lane, waited, promoted=False):
+        stats = self._stats[lane]
+        stats["admitted"] += 1
+        stats["in_flight"] += 1
+        stats["promoted"] += int(promoted)
+        stats["waits"].append(waited)
+        self._in_flight += 1
+        self._vtime = self._pass[lane]
+        self._pass[lane] += 1.0 / self.weights[lane]
+
+    def _enter(self, lane, grant):
+        """Admits right away (returns None) or queues a waiter that grant() will wake."""
+        if lane not in self._queues:
+            raise ValueError(f"unknown lane '{lane}' (one of {', '.join(LANES)})")
+        with self._lock:
+            if self._has_room() and not any(self._queues.values()):
+                self._admit(lane, 0.0)
+                return None
+            if not self._queues[lane]:
+                # A lane coming back from idle doesn't get to spend credit it banked meanwhile
+                self._pass[lane] = max(self._pass[lane], self._vtime)
+            waiter = _Waiter(lane, grant)
+            self._queues[lane].append(waiter)
+            self._stats[lane]["queued"] += 1
+            return waiter
+
+    def _pick(self, now):
+        waiting = [lane for lane in LANES if self._queues[lane]]
+        oldest = min(waiting, key=lambda lane: self._queues[lane][0].enqueued)
+        if now - self._queues[oldest][0].enqueued >= self.max_wait:
+            return oldest, True
+        return min(waiting, key=lambda lane: (self._pass[lane], LANES.index(lane))), False
+
+    def _release(self, lane):
+        granted = []
+        with self._lock:
+            self._in_flight -= 1
+            self._stats[lane]["in_flight"] -= 1
+            now = time.perf_counter()
+            while self._has_room() and any(self._queues.values()):
+                next_lane, promoted = self._pick(now)
+                waiter = self._queues[next_lane].popleft()
+                self._admit(next_lane, now - waiter.enqueued, promoted)
+                granted.append(waiter)
+        for waiter in granted:
+            waiter.grant()
+
+    def _cancel(self, waiter):
+        """Drops a waiter that gave up. False if it was already admitted (the caller owns a slot)."""
+        with self._lock:
+            try:
+                self._queues[waiter.lane].remove(waiter)
+                return True
+            except ValueError:
+                return False
+
+    @contextmanager
+    def slot(self, lane):
+        event = threading.Event()
+        if self._enter(lane, event.set):
+            event.wait()
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    @asynccontextmanager
+    async def async_slot(self, lane):
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(None))
+
+        waiter = self._enter(lane, grant)
+        if waiter:
+            try:
+                await admitted
+            except asyncio.CancelledError:
+                if not self._cancel(waiter):
+                    self._release(lane)
+                raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self):
+        def ms(value):
+            return round(value * 1000, 1)
+        with self._lock:
+            lanes = {}
+            for lane in LANES:
+                stats = self._stats[lane]
+                waits = sorted(stats["waits"])
+                lanes[lane] = {
+                    "weight": self.weights[lane],
+                    "waiting": len(self._queues[lane]),
+                    "in_flight": stats["in_flight"],
+                    "admitted": stats["admitted"],
+                    "queued": stats["queued"],
+                    "promoted": stats["promoted"],
+                    "wait_p50_ms": ms(waits[len(waits) // 2]) if waits else None,
+                    "wait_p95_ms": ms(waits[min(len(waits) - 1, int(len(waits) * 0.95))]) if waits else None,
+                    "wait_max_ms": ms(waits[-1]) if waits else None,
+                }
+            return {"capacity": self.capacity, "in_flight": self._in_flight, "max_wait": self.max_wait, "lanes": lanes}
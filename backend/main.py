@@ -2,31 +2,150 @@ import os
 import json
 import time
 import threading
-import cv2
 import uuid
 import base64
+import zlib
+import atexit
+import tempfile
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-import numpy as np
+import imaging
+import sharding
+import capture
+import motion
+import memory_budget
+import warm_state
+import routing
+import result_cache
+import schedules
+import budgets
+import lanes
+import gemini_pool
+import storage
 
 # 1. CONFIGURATION
 load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MONITORS_FILE = os.getenv("MONITORS_FILE", 'monitors.json')
 LOGS_FILE = os.getenv("LOGS_FILE", 'logs.json')
+DEAD_LETTERS_FILE = os.getenv("DEAD_LETTERS_FILE", 'dead_letters.json')
 STATIC_FOLDER = os.path.join("static", "captures")
+DEAD_LETTER_FOLDER = os.path.join("static", "dead_letters")
+
+# Analysis retry policy (per-monitor `max_retries` / `retry_backoff` override these)
+DEFAULT_MAX_RETRIES = int(os.getenv("DEFAULT_MAX_RETRIES", 3))
+DEFAULT_RETRY_BACKOFF = float(os.getenv("DEFAULT_RETRY_BACKOFF", 60)) # seconds, doubles per attempt
+# Quota/server/network errors aren't the monitor's fault: they back off up to this, never dead-letter
+TRANSIENT_MAX_BACKOFF = float(os.getenv("TRANSIENT_MAX_BACKOFF", 900))
+
+# Process role:
+#   all  - API + scheduler in one process (default, matches `gunicorn main:app`)
+#   api  - API only; OpenCV, NumPy and google-genai load on first use
+#   scan - scheduler only (`python main.py`); pre-warms the Gemini client
+ROLE = os.getenv("CAMAI_ROLE", "all").lower()
+
+# Spawned image/capture workers re-import this module as __mp_main__ under `python main.py`;
+# they must not start schedulers or touch cluster membership of their own
+IS_SPAWNED_WORKER = __name__ == '__mp_main__'
+
+# One Gemini client per configured key (GEMINI_API_KEYS, see gemini_pool.py), each built on first use;
+# importing google.genai is slow and memory-hungry
+gemini = gemini_pool.GeminiPool()
+
+def prewarm():
+    """Scan workers pay the import/connect cost up front instead of on the first due monitor."""
+    started = time.time()
+    import cv2, numpy # noqa: F401
+    from google.genai import types # noqa: F401
+    for client in gemini.clients():
+        try:
+            # Cheap metadata call: opens the TLS connection the first scan will reuse
+            client.models.get(model=routing.FAST_MODEL)
+        except Exception as e:
+            print(f"   [!] Gemini pre-warm call failed (continuing): {e}")
+    print(f"--- Pre-warmed in {time.time() - started:.2f}s ---")
+
+# Motion reference thumbnail for each monitor, all in one array. By default the array lives in
+# an mmap'd file shared by every worker process on the host; MOTION_STORE=memory keeps it per process.
+_shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+_motion_file = f"camai-motion-{zlib.crc32(os.path.abspath(MONITORS_FILE).encode()):08x}.bin"
+MOTION_STORE = os.getenv("MOTION_STORE", os.path.join(_shm_dir, _motion_file))
+motion_engine = motion.MotionEngine() if MOTION_STORE == 'memory' else motion.SharedMotionEngine(MOTION_STORE)
+
+# Byte budget (LRU) over all per-monitor in-memory state; see /metrics -> memory
+memory = memory_budget.MemoryBudget()
+memory.register("motion", motion_engine.remove)
+# The shared store's size is fixed when its file is created: evicting from it frees nothing and only
+# drops references every worker relies on, so only per-process references count toward the budget
+MOTION_BUDGETED = MOTION_STORE == 'memory'
+
+def touch_motion(monitor_id, nbytes):
+    if MOTION_BUDGETED:
+        memory.touch("motion", monitor_id, nbytes)
+memory.register("camera_health", capture.forget)
+
+# Warm state checkpointed by the scheduler so a restart doesn't re-scan every camera
+warm = warm_state.WarmState()
+restored_due = {} # monitor id -> epoch seconds, for monitors the snapshot had scheduled but never scanned
+
+def dump_motion():
+    refs = {}
+    for monitor_id in motion_engine.monitor_ids():
+        thumb = motion_engine.get(monitor_id)
+        if thumb is not None:
+            refs[monitor_id] = base64.b64encode(thumb.tobytes()).decode()
+    return {"shape": list(motion_engine.shape), "refs": refs}
+
+def load_motion(data):
+    import numpy as np
+    if tuple(data["shape"]) != motion_engine.shape:
+        return 0
+    restored = 0
+    for monitor_id, encoded in data["refs"].items():
+        # A shared store that outlived the process already has fresher references
+        if motion_engine.get(monitor_id) is not None:
+            continue
+        thumb = np.frombuffer(base64.b64decode(encoded), np.uint8).reshape(motion_engine.shape)
+        motion_engine.set(monitor_id, thumb)
+        touch_motion(monitor_id, thumb.nbytes)
+        restored += 1
+    return restored
+
+def dump_schedule():
+    now = datetime.now()
+    due = {}
+    for m in load_monitors():
+        remaining = seconds_until_due(m, now)
+        if remaining is not None:
+            due[m['id']] = now.timestamp() + remaining
+    return due
+
+def load_schedule(data):
+    restored_due.update(data)
+    return len(data)
+
+warm.register("motion", dump_motion, load_motion)
+warm.register("camera_health", capture.dump_health, capture.load_health)
+warm.register("schedule", dump_schedule, load_schedule)
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+# Rule-authoring previews: content-addressed results (see result_cache.py)
+trigger_cache = result_cache.ResultCache(on_store=lambda key, nbytes: memory.touch("trigger_cache", key, nbytes),
+                                         on_drop=lambda key: memory.discard("trigger_cache", key))
+memory.register("trigger_cache", trigger_cache.discard)
+warm.register("trigger_cache", trigger_cache.dump, trigger_cache.load)
 
-# Memory to store the last frame for each monitor (RAM only)
-last_seen_frames = {}
+def trigger_cache_key(mode, user_rule, image_bytes, ideal_bytes):
+    return result_cache.content_key(mode, result_cache.normalize_rule(user_rule), routing.FAST_MODEL, image_bytes, ideal_bytes)
+
+# This node's slice of the fleet (owns everything unless CLUSTER_STORE is set).
+# API-only processes scan nothing: they read the ring the scanning nodes maintain without joining it.
+shard = sharding.Shard(member=ROLE in ('all', 'scan'))
+if not IS_SPAWNED_WORKER:
+    atexit.register(shard.leave)
 
 # --- STORAGE HELPERS ---
 def load_monitors():
@@ -36,46 +155,81 @@ def load_monitors():
     except: return []
 
 def save_monitors(data):
-    with open(MONITORS_FILE, 'w') as f: json.dump(data, f, indent=2)
+    storage.atomic_write(MONITORS_FILE, json.dumps(data, indent=2))
+
+def monitors_lock():
+    """Cross-process lock for read-modify-write of the monitors file."""
+    return storage.file_lock(MONITORS_FILE)
+
+def update_monitor(monitor_id, **fields):
+    """
+    Re-reads the monitors file and patches a single monitor.
+    Several nodes scan disjoint shards of the same file, so saving a stale full copy would
+    clobber their updates.
+    """
+    with monitors_lock():
+        monitors = load_monitors()
+        for m in monitors:
+            if m['id'] == monitor_id:
+                m.update(fields)
+                save_monitors(monitors)
+                return m
+    return None
 
-def has_significant_change(monitor_id, current_frame_bytes, threshold=0.02):
+def has_significant_change(monitor_id, frame, threshold=None):
     """
     Returns True if the image changed significantly since last scan.
-    threshold=0.02 means 2% of pixels changed.
+    threshold=0.02 means 2% of pixels changed (default: MOTION_THRESHOLD).
+    `frame` is an imaging.Frame; its thumbnail is built once and shared with the rest of the scan.
     """
-    # Decode bytes to OpenCV Image
-    nparr = np.frombuffer(current_frame_bytes, np.uint8)
-    current_img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    
-    # Resize to small thumbnail for fast comparison (e.g., 100x100)
-    current_small = cv2.resize(current_img, (100, 100))
-    
-    # Get last frame
-    last_small = last_seen_frames.get(monitor_id)
-    
-    # If no history, it's a "Change" (First run)
-    if last_small is None:
-        last_seen_frames[monitor_id] = current_small
-        return True
-        
-    # Calculate Absolute Difference
-    diff = cv2.absdiff(current_small, last_small)
-    
-    # Count pixels that changed intensity by more than 25 (out of 255)
-    # This filters out minor lighting noise
-    non_zero_count = np.count_nonzero(diff > 25)
-    total_pixels = current_small.shape[0] * current_small.shape[1]
-    
-    change_ratio = non_zero_count / total_pixels
-    
-    if change_ratio > threshold:
-        # Update history only if change occurred
-        last_seen_frames[monitor_id] = current_small
-        print(f"   [Diff: {change_ratio:.2%}] Motion Detected -> Triggering AI")
-        return True
-    
-    print(f"   [Diff: {change_ratio:.2%}] No Motion -> Skipping AI")
-    return False
+    return motion_gate([(monitor_id, frame, threshold)])[monitor_id]
+
+def motion_gate(items):
+    """
+    Batched motion check. items: list of (monitor_id, frame, threshold or None).
+    Every thumbnail is diffed against its reference in one vectorized pass.
+    Returns {monitor_id: changed}.
+    """
+    changed = {}
+    batch, thresholds = [], []
+    for monitor_id, frame, threshold in items:
+        # Small grayscale thumbnail (100x100), straight from the raw pixels when the capture had them
+        thumb = frame.thumbnail
+        if thumb is None:
+            changed[monitor_id] = True # Undecodable frame: let the AI path deal with it
+            continue
+        batch.append((monitor_id, thumb))
+        thresholds.append(motion.MOTION_THRESHOLD if threshold is None else float(threshold))
+
+    results = motion_engine.compare(batch, thresholds)
+    for monitor_id, thumb in batch:
+        touch_motion(monitor_id, thumb.nbytes)
+
+    for monitor_id, (moved, change_ratio) in results.items():
+        if moved:
+            print(f"   [Diff: {change_ratio:.2%}] Motion Detected -> Triggering AI")
+        else:
+            print(f"   [Diff: {change_ratio:.2%}] No Motion -> Skipping AI")
+        changed[monitor_id] = moved
+    return changed
+
+def capture_frame(cam_input, driver=None):
+    """
+    Grabs a single frame from a camera (bounded by capture deadlines and the camera's circuit breaker).
+    `driver` is the monitor's capture_driver (auto/snapshot/stream).
+    Returns an imaging.Frame, or None if the camera gave nothing.
+    """
+    return capture.capture(cam_input, driver)
+
+def sync_camera_status(m, cam_input):
+    """Persists OFFLINE/OK transitions so every worker (and the dashboard) sees the camera state."""
+    status = "OK" if capture.health_for(cam_input).online else "OFFLINE"
+    if status == "OFFLINE" and m.get('status') != "OFFLINE":
+        print(f"   [!] Cam {cam_input} marked OFFLINE")
+        update_monitor(m['id'], status="OFFLINE", last_update=datetime.now().isoformat())
+    elif status == "OK" and m.get('status') == "OFFLINE":
+        print(f"   [+] Cam {cam_input} back ONLINE")
+        update_monitor(m['id'], status="OK", last_update=datetime.now().isoformat())
 
 def load_logs():
     if not os.path.exists(LOGS_FILE): return []
@@ -83,7 +237,7 @@ def load_logs():
         with open(LOGS_FILE, 'r') as f: return json.load(f)
     except: return []
 
-def save_log_entry(monitor_id, monitor_name, monitor_type, result_json, image_bytes):
+def save_log_entry(monitor_id, monitor_name, monitor_type, result_json, image_bytes, extra=None):
     timestamp = datetime.now().isoformat()
     log_id = str(uuid.uuid4())
     
@@ -103,6 +257,8 @@ def save_log_entry(monitor_id, monitor_name, monitor_type, result_json, image_by
         "image_url": f"http://127.0.0.1:5000/static/captures/{image_filename}",
         "result": result_json
     }
+    if extra:
+        new_log.update(extra)
     
     # Append to File
     logs = load_logs()
@@ -111,9 +267,55 @@ def save_log_entry(monitor_id, monitor_name, monitor_type, result_json, image_by
     with open(LOGS_FILE, 'w') as f: json.dump(logs, f, indent=2)
     return new_log
 
+def load_dead_letters():
+    if not os.path.exists(DEAD_LETTERS_FILE): return []
+    try:
+        with open(DEAD_LETTERS_FILE, 'r') as f: return json.load(f)
+    except: return []
+
+def save_dead_letters(data):
+    with open(DEAD_LETTERS_FILE, 'w') as f: json.dump(data, f, indent=2)
+
+def add_dead_letter(m, error, image_bytes, attempts):
+    """Parks a repeatedly failing scan (frame + error) until someone replays or discards it."""
+    letter_id = str(uuid.uuid4())
+    os.makedirs(DEAD_LETTER_FOLDER, exist_ok=True)
+    image_path = os.path.join(DEAD_LETTER_FOLDER, f"{letter_id}.jpg")
+    with open(image_path, "wb") as f:
+        f.write(image_bytes)
+
+    letter = {
+        "id": letter_id,
+        "monitor_id": m['id'],
+        "monitor_name": m['name'],
+        "type": m['type'],
+        "timestamp": datetime.now().isoformat(),
+        "attempts": attempts,
+        "error": error,
+        "image_path": image_path,
+    }
+    letters = load_dead_letters()
+    letters.insert(0, letter)
+    save_dead_letters(letters)
+    return letter
+
+
+# --- HELPER: Image parts ---
+def image_parts(types, image_bytes):
+    """One JPEG, or a list of ROI tiles each labelled so the model can refer to them."""
+    if not isinstance(image_bytes, (list, tuple)):
+        return [types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")]
+    parts = []
+    for i, tile in enumerate(image_bytes, start=1):
+        parts.append(types.Part.from_text(text=f"Region {i} of {len(image_bytes)}:"))
+        parts.append(types.Part.from_bytes(data=tile, mime_type="image/jpeg"))
+    return parts
 
 # --- HELPER: Logic for QUANTIFIER ---
-def analyze_quantifier(image_bytes, user_rule, ideal_image_bytes=None):
+def quantifier_request(image_bytes, user_rule, ideal_image_bytes=None):
+    """(contents, config) for a QUANTIFIER analysis."""
+    from google.genai import types
+
     if not user_rule or user_rule.strip() == "":
         user_rule = "Count the items and identify any low stock."
 
@@ -146,7 +348,7 @@ def analyze_quantifier(image_bytes, user_rule, ideal_image_bytes=None):
 
     prompt_parts = [
         types.Part.from_text(text=f"User Rule/Context: {user_rule}"),
-        types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
+        *image_parts(types, image_bytes),
     ]
     
     # If an Ideal Image is provided, add it to the prompt
@@ -154,18 +356,37 @@ def analyze_quantifier(image_bytes, user_rule, ideal_image_bytes=None):
         prompt_parts.insert(0, types.Part.from_bytes(data=ideal_image_bytes, mime_type="image/jpeg"))
         prompt_parts.insert(1, types.Part.from_text(text="Above is the IDEAL STATE image. Below is the CURRENT image."))
 
-    response = client.models.generate_content(
-        model="gemini-3-flash-preview", # Use 3.0 Flash for speed/cost, or "gemini-3-pro" for reasoning
-        contents=[types.Content(role="user", parts=prompt_parts)],
-        config=types.GenerateContentConfig(
-            system_instruction=sys_instruction,
-            response_mime_type="application/json" 
-        )
+    contents = [types.Content(role="user", parts=prompt_parts)]
+    config = types.GenerateContentConfig(
+        system_instruction=sys_instruction,
+        response_mime_type="application/json" 
     )
-    return response.text
+    return contents, config
+
+# Gemini capacity shared by previews, triggers and scheduler scans, by priority lane (see lanes.py)
+model_lanes = lanes.LaneScheduler()
+
+def generate(model, contents, config, usage=None, lane=lanes.BACKGROUND):
+    """One generate_content call; its tokens, duration and lane wait are added to `usage` when given (see budgets.py)."""
+    queued = time.perf_counter()
+    with model_lanes.slot(lane):
+        started = time.perf_counter()
+        response = gemini.call(lambda client: client.models.generate_content(model=model, contents=contents, config=config))
+    if usage is not None:
+        budgets.add_usage(usage, response, time.perf_counter() - started, started - queued)
+    return response
+
+def analyze_quantifier(image_bytes, user_rule, ideal_image_bytes=None, model=routing.FAST_MODEL, usage=None,
+                       lane=lanes.BACKGROUND):
+    contents, config = quantifier_request(image_bytes, user_rule, ideal_image_bytes)
+    # Fast tier by default; the router escalates to the strong model when needed
+    return generate(model, contents, config, usage, lane).text
 
 # --- HELPER: Logic for DETECTOR ---
-def analyze_detector(image_bytes, user_rule):
+def detector_request(image_bytes, user_rule):
+    """(contents, config) for a DETECTOR analysis."""
+    from google.genai import types
+
     # System Instruction from your uploaded file 
     sys_instruction = """You are a Safety & Compliance Officer. Detect presence/absence of objects based on User Rules.
     
@@ -185,26 +406,30 @@ def analyze_detector(image_bytes, user_rule):
     }
     If FAIL, count instances (e.g., 'detected persons not wearing PPE: 5')."""
 
-    response = client.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=[
-            types.Content(
-                role="user", 
-                parts=[
-                    types.Part.from_text(text=f"Rule to Check: {user_rule}"),
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
-                ]
-            )
-        ],
-        config=types.GenerateContentConfig(
-            system_instruction=sys_instruction,
-            response_mime_type="application/json"
+    contents = [
+        types.Content(
+            role="user", 
+            parts=[
+                types.Part.from_text(text=f"Rule to Check: {user_rule}"),
+                *image_parts(types, image_bytes)
+            ]
         )
+    ]
+    config = types.GenerateContentConfig(
+        system_instruction=sys_instruction,
+        response_mime_type="application/json"
     )
-    return response.text
+    return contents, config
+
+def analyze_detector(image_bytes, user_rule, model=routing.FAST_MODEL, usage=None, lane=lanes.BACKGROUND):
+    contents, config = detector_request(image_bytes, user_rule)
+    return generate(model, contents, config, usage, lane).text
 
 # --- HELPER: Logic for PROCESS MONITOR ---
-def analyze_process(image_bytes, user_rule):
+def process_request(image_bytes, user_rule):
+    """(contents, config) for a PROCESS analysis."""
+    from google.genai import types
+
     # System Instruction from your uploaded file 
     sys_instruction = """You are a Process Supervisor. Compare 'Current Image' with 'Start/Ideal/Previous State' implied in User Rules to estimate progress. If no 'Start/Ideal/Previous State' is provided, infer the stage based on standard industry expectations for this process.
     
@@ -218,23 +443,49 @@ def analyze_process(image_bytes, user_rule):
       "visual_reasoning": "String"
     }"""
 
-    response = client.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=[
-            types.Content(
-                role="user", 
-                parts=[
-                    types.Part.from_text(text=f"Process Context: {user_rule}"),
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
-                ]
-            )
-        ],
-        config=types.GenerateContentConfig(
-            system_instruction=sys_instruction,
-            response_mime_type="application/json"
+    contents = [
+        types.Content(
+            role="user", 
+            parts=[
+                types.Part.from_text(text=f"Process Context: {user_rule}"),
+                *image_parts(types, image_bytes)
+            ]
         )
+    ]
+    config = types.GenerateContentConfig(
+        system_instruction=sys_instruction,
+        response_mime_type="application/json"
     )
-    return response.text
+    return contents, config
+
+def analyze_process(image_bytes, user_rule, model=routing.FAST_MODEL, usage=None, lane=lanes.BACKGROUND):
+    contents, config = process_request(image_bytes, user_rule)
+    return generate(model, contents, config, usage, lane).text
+
+# --- HELPER: Streaming analysis (interactive previews) ---
+def analysis_request(mode, image_bytes, user_rule, ideal_image_bytes=None):
+    if mode == 'QUANTIFIER':
+        return quantifier_request(image_bytes, user_rule, ideal_image_bytes)
+    if mode == 'DETECTOR':
+        return detector_request(image_bytes, user_rule)
+    if mode == 'PROCESS':
+        return process_request(image_bytes, user_rule)
+    raise ValueError(f"Unknown mode: {mode}")
+
+def stream_analysis(mode, image_bytes, user_rule, ideal_image_bytes=None, model=routing.FAST_MODEL, usage=None,
+                    lane=lanes.INTERACTIVE):
+    """Same analysis as analyze_<mode>, but yields the model's text chunks as they are generated."""
+    contents, config = analysis_request(mode, image_bytes, user_rule, ideal_image_bytes)
+    last = None
+    queued = time.perf_counter()
+    with model_lanes.slot(lane), gemini.lease() as client:
+        started = time.perf_counter()
+        for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+            last = chunk # usage metadata is cumulative; the last chunk has the totals
+            if chunk.text:
+                yield chunk.text
+    if usage is not None and last is not None:
+        budgets.add_usage(usage, last, time.perf_counter() - started, started - queued)
 
 def send_notification(integrations, message):
     """
@@ -262,142 +513,490 @@ def send_notification(integrations, message):
         print(f"\n[EXCEL LOG {timestamp}] 📊 Row Added.")
 
 
+# --- SCAN PIPELINE (shared by scheduler, triggers and replays) ---
+# Running totals of what ROI cropping saved
+roi_stats = {"scans": 0, "pixels_removed": 0, "bytes_removed": 0}
+
+def monitor_regions(m, frame):
+    """(gate_frame, upload_frames, report) for the monitor's ROIs; the whole frame if it has none."""
+    return frame.regions(m.get('rois'), tiles=m.get('roi_mode') == 'tiles')
+
+# Model tiers: cheap model first, escalate on doubtful answers (see routing.py)
+router = routing.Router()
+
+# Calls/tokens per monitor and deployment, and the degradation they trigger (see budgets.py)
+budget = budgets.Budgets()
+
+def budget_view(m, level=None):
+    """Monitor m with its budget degradation applied (stricter motion gate, cheaper model)."""
+    level = budget.level(m) if level is None else level
+    if not level:
+        return m
+    threshold = m.get('motion_threshold')
+    threshold = motion.MOTION_THRESHOLD if threshold is None else float(threshold)
+    return {**m, 'motion_threshold': budget.motion_threshold(threshold, level),
+            'routing_policy': budget.routing_policy(m, level)}
+
+def prepare_scan(m, frame):
+    """
+    What a scan of m sends, shared by analyze_monitor and asgi.py's: (m with its budget degradation
+    applied, image bytes or one per ROI tile, ideal image bytes or None). Reads files: off the event loop.
+    """
+    m = budget_view(m)
+
+    # Load Ideal Image Bytes if it exists
+    ideal_bytes = None
+    if m.get('ideal_image_path') and os.path.exists(m['ideal_image_path']):
+        with open(m['ideal_image_path'], 'rb') as f:
+            ideal_bytes = f.read()
+
+    # Only the monitor's regions of interest are uploaded (one image, or one tile per ROI)
+    _, uploads, _ = monitor_regions(m, frame)
+    image = uploads[0].jpeg_bytes if len(uploads) == 1 else [u.jpeg_bytes for u in uploads]
+    return m, image, ideal_bytes
+
+def parse_result(result_text):
+    """A tier's JSON answer. Raises ValueError (malformed: the router escalates) when it doesn't parse."""
+    try:
+        return json.loads(result_text)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unparseable model output: {str(result_text)[:500]}")
+
+def analyze_monitor(m, frame, lane=lanes.BACKGROUND):
+    """
+    Routes a frame to the monitor's AI agent through its model tiers, in the given priority lane.
+    Returns (result, route); route names the model that answered and any escalations.
+    Raises on API errors, or on unparseable output from the last tier.
+    """
+    m, image, ideal_bytes = prepare_scan(m, frame)
+    rule = m.get('rule', "")
+    usage = {}
+
+    def run(model):
+        # Select the correct AI Agent
+        result_text = "{}"
+        if m['type'] == 'QUANTIFIER':
+            result_text = analyze_quantifier(image, rule, ideal_bytes, model=model, usage=usage, lane=lane)
+        elif m['type'] == 'DETECTOR':
+            result_text = analyze_detector(image, rule, model=model, usage=usage, lane=lane)
+        elif m['type'] == 'PROCESS':
+            result_text = analyze_process(image, rule, model=model, usage=usage, lane=lane)
+        return parse_result(result_text)
+
+    try:
+        result, route = router.analyze(m, run, lambda result: result_status(m, result))
+    finally:
+        # Failed and escalated calls cost tokens too
+        budget.record(m['id'], usage, m['type'])
+    route["usage"] = usage
+    return result, route
+
+def result_status(m, result_json):
+    status = "OK"
+    if m['type'] == 'QUANTIFIER':
+        status = result_json.get('overall_status', 'OK')
+    elif m['type'] == 'DETECTOR':
+        status = "FAIL" if result_json.get('compliance_status') == 'FAIL' else "OK"
+    elif m['type'] == 'PROCESS':
+        if result_json.get('anomalies_detected'): status = "ALERT"
+    return status
+
+def record_scan_success(m, status=None):
+    update_monitor(m['id'], last_check_time=datetime.now().isoformat(), failed_attempts=0, transient_failures=0,
+                   next_retry_time=None, **adapt_interval(m, status))
+
+def record_scan_failure(m, error, frame):
+    """
+    Applies the monitor's retry policy: exponential backoff between attempts, then the
+    dead-letter queue. A dead-lettered monitor makes no API calls until it is replayed or discarded.
+    Only failures that would repeat (unparseable output, 4xx) count toward max_retries; throttling,
+    5xx and network errors just back off (capped at TRANSIENT_MAX_BACKOFF) until Gemini recovers.
+    """
+    backoff = float(m.get('retry_backoff', DEFAULT_RETRY_BACKOFF))
+    if gemini_pool.classify(error):
+        failures = int(m.get('transient_failures', 0)) + 1
+        delay = min(TRANSIENT_MAX_BACKOFF, backoff * (2 ** (failures - 1)))
+        next_retry = datetime.now() + timedelta(seconds=delay)
+        print(f"   [!] Transient failure #{failures} ({error.__class__.__name__}), retrying in {delay:.0f}s")
+        update_monitor(m['id'], transient_failures=failures, next_retry_time=next_retry.isoformat())
+        return
+
+    attempts = int(m.get('failed_attempts', 0)) + 1
+    max_retries = int(m.get('max_retries', DEFAULT_MAX_RETRIES))
+
+    if attempts > max_retries:
+        letter = add_dead_letter(m, str(error), frame.jpeg_view, attempts)
+        print(f"   [!] {m['name']} failed {attempts}x -> dead letter {letter['id']}")
+        update_monitor(m['id'], failed_attempts=attempts, next_retry_time=None, dead_letter_id=letter['id'])
+        return
+
+    delay = backoff * (2 ** (attempts - 1))
+    next_retry = datetime.now() + timedelta(seconds=delay)
+    print(f"   [!] Attempt {attempts}/{max_retries} failed, retrying in {delay:.0f}s")
+    update_monitor(m['id'], failed_attempts=attempts, next_retry_time=next_retry.isoformat())
+
+
+# --- ADAPTIVE INTERVALS ---
+# schedule_mode=adaptive: the interval moves between min_interval and max_interval (minutes),
+# shorter while the scene is busy, longer while nothing changes
+ADAPTIVE_SHRINK = float(os.getenv("ADAPTIVE_SHRINK", 0.5))             # on motion
+ADAPTIVE_GROW = float(os.getenv("ADAPTIVE_GROW", 1.5))                 # on a quiet/unchanged scan
+ADAPTIVE_STABLE_SCANS = int(os.getenv("ADAPTIVE_STABLE_SCANS", 3))    # same result this often = settled, motion or not
+SCHEDULE_MODES = ("fixed", "adaptive")
+
+def interval_bounds(m):
+    base = float(m.get('interval', 60))
+    low = float(m.get('min_interval') or base / 4)
+    high = float(m.get('max_interval') or base * 4)
+    return min(low, high), max(low, high)
+
+def effective_interval(m):
+    """Minutes between scans right now: `interval`, or the adapted one within the monitor's bounds."""
+    if m.get('schedule_mode') != 'adaptive':
+        return float(m.get('interval', 60))
+    low, high = interval_bounds(m)
+    return min(high, max(low, float(m.get('effective_interval') or m.get('interval', 60))))
+
+def adapt_interval(m, status=None):
+    """
+    Monitor fields to persist after a scan. `status` is the analysis result, or None when the
+    motion gate skipped the scan. A changed result drops to min_interval; motion shortens the
+    interval unless the result has been the same ADAPTIVE_STABLE_SCANS times; quiet lengthens it.
+    """
+    if m.get('schedule_mode') != 'adaptive':
+        return {}
+    low, high = interval_bounds(m)
+    current = effective_interval(m)
+    stable = int(m.get('stable_scans', 0))
+    previous = m.get('last_result_status')
+
+    if status is None:
+        interval = current * ADAPTIVE_GROW
+    elif previous is None:
+        interval = current # first result: just the baseline
+    elif status != previous:
+        interval, stable = low, 0
+    else:
+        stable += 1
+        interval = current * (ADAPTIVE_GROW if stable >= ADAPTIVE_STABLE_SCANS else ADAPTIVE_SHRINK)
+
+    interval = round(min(high, max(low, interval)), 2)
+    if interval != current:
+        print(f"   [~] {m['name']}: interval {current:g} -> {interval:g} min")
+    fields = {"effective_interval": interval, "stable_scans": stable}
+    if status is not None:
+        fields["last_result_status"] = status
+    return fields
+
+
 # --- SCHEDULER ---
+# Monitors on the same camera that fall due within this many seconds of each other
+# share one capture (0 = only monitors that are already due share it)
+FANOUT_ALIGN_SECONDS = float(os.getenv("FANOUT_ALIGN_SECONDS", 0))
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", 10)) # longest sleep between scheduler passes (seconds)
+
+# Camera opens vs monitor scans served from them (the difference is captures saved by fan-out)
+fanout_stats = {"captures": 0, "monitor_scans": 0}
+
+def camera_input(m):
+    cam_id = m.get('connection_url', 0)
+    try: return int(cam_id)
+    except: return cam_id
+
+def next_due(m, now):
+    """
+    (when the monitor is next due, scans its cron/window/blackout rules skip before then);
+    (None, 0) if it must not run (parked, backing off, out of budget, or its rules never allow it).
+    """
+    # Parked in the dead-letter queue: no API calls until someone acts on it
+    if m.get('dead_letter_id'):
+        return None, 0
+
+    # Backing off after a failed analysis
+    if m.get('next_retry_time'):
+        try:
+            if datetime.fromisoformat(m['next_retry_time']) > now:
+                return None, 0
+        except ValueError:
+            pass
+
+    # Over budget: degraded monitors scan less often, exhausted ones not at all until the period rolls over
+    level = budget.level(m)
+    if level == budgets.PAUSED:
+        return None, 0
+    interval_minutes = effective_interval(m) * budget.interval_factor(level)
+    last_check_str = m.get('last_check_time')
+    try:
+        last_check = datetime.fromisoformat(last_check_str) if last_check_str else None
+    except ValueError:
+        return now, 0 # Corrupted time, reset
+    if m.get('cron'):
+        # Fires after the last check (or creation): a fire missed while down runs once, not per missed fire
+        anchor = last_check or datetime.fromisoformat(m.get('last_update') or now.isoformat())
+        return schedules.plan(m, None, interval_minutes, anchor=anchor)
+    if last_check is None:
+        # First run, unless the snapshot from before a restart had it scheduled later
+        candidate = datetime.fromtimestamp(max(now.timestamp(), restored_due.get(m['id'], 0)))
+    else:
+        candidate = last_check + timedelta(minutes=interval_minutes)
+    return schedules.plan(m, candidate, interval_minutes)
+
+def seconds_until_due(m, now):
+    """0 when the monitor is due, otherwise seconds until it is; None if it must not run."""
+    due, _ = next_due(m, now)
+    if due is None:
+        return None
+    return max(0.0, (due - now).total_seconds())
+
+def record_deferral(m, due, skipped):
+    """Counts the scans a monitor's schedule rules avoided, once per deferral."""
+    if not skipped or m.get('deferred_until') == due.isoformat():
+        return
+    update_monitor(m['id'], deferred_until=due.isoformat(), scans_avoided=int(m.get('scans_avoided', 0)) + skipped)
+    print(f"   [z] {m['name']}: outside its schedule, next run {due:%Y-%m-%d %H:%M} ({skipped} scans avoided)")
+
+def is_scannable(m):
+    # 1. FILTER: Only process Active RTSP/Interval streams
+    if m.get('source') != 'RTSP Stream':
+        return False
+
+    # Another node owns this monitor
+    if not shard.owns(m['id']):
+        return False
+
+    # 2. THE FIX: Check if this is a "Local Device" (0, 1) or a "Network Stream"
+    # CRITICAL: If on Cloud, DO NOT touch local devices.
+    # We assume a "Bridge" script is handling them.
+    # But DO NOT try cv2.VideoCapture(0) here.
+    if isinstance(camera_input(m), int):
+        return False
+    return True
+
+def due_groups(monitors, now):
+    """
+    Groups due monitors by camera so each camera is opened once per tick.
+    With FANOUT_ALIGN_SECONDS, monitors that are almost due ride along, which snaps
+    their schedules together over time.
+    """
+    groups = {}
+    almost_due = {}
+    for m in monitors:
+        if not is_scannable(m):
+            continue
+        due, skipped = next_due(m, now)
+        if due is None:
+            continue
+        record_deferral(m, due, skipped)
+        remaining = max(0.0, (due - now).total_seconds())
+        key = str(camera_input(m))
+        if remaining == 0:
+            groups.setdefault(key, []).append(m)
+        elif remaining <= FANOUT_ALIGN_SECONDS:
+            almost_due.setdefault(key, []).append(m)
+    for key, riders in almost_due.items():
+        if key in groups:
+            groups[key].extend(riders)
+    return groups
+
+def needs_motion_gate(m):
+    # A pending retry always goes through, its reference frame was already taken
+    return int(m.get('failed_attempts', 0)) == 0 and not int(m.get('transient_failures', 0))
+
+def scan_monitor(m, frame, moved=None):
+    """
+    Motion gate + analysis + alerts for one monitor on an already captured frame.
+    `moved` is the result of a batched motion_gate() when the caller already ran one.
+    Returns {"result", "status", "log_id"}, or None if nothing was analysed.
+    """
+    # --- A2. MOTION GATE ---
+    # Nothing moved since the last analysed frame: count it as checked, skip the AI call
+    try:
+        gate_frame, _, roi_report = monitor_regions(m, frame)
+    except Exception as e:
+        # Treated like a failed capture: the monitor stays due and is tried again next tick
+        print(f"   [!] Cropping regions of {m['name']} failed: {e}")
+        return None
+    if moved is None and needs_motion_gate(m):
+        moved = has_significant_change(m['id'], gate_frame, budget_view(m).get('motion_threshold'))
+    if moved is False:
+        update_monitor(m['id'], last_check_time=datetime.now().isoformat(), **adapt_interval(m))
+        return None
+
+    # --- B. ROUTING & ANALYSIS ---
+    try:
+        result_json, route = analyze_monitor(m, frame)
+        
+        # --- C. SAVE ---
+        # Save Log & Image
+        if roi_report:
+            roi_stats["scans"] += 1
+            roi_stats["pixels_removed"] += roi_report["pixels_removed"]
+            roi_stats["bytes_removed"] += roi_report["bytes_removed"]
+            print(f"   [ROI] -{roi_report['pixels_removed']} px, -{roi_report['bytes_removed']} bytes")
+        extra = {"routing": route}
+        if roi_report:
+            extra["roi"] = roi_report
+        log_entry = save_log_entry(m['id'], m['name'], m['type'], result_json, frame.jpeg_view, extra=extra)
+        
+        # --- D. ALERTS ---
+        status = result_status(m, result_json)
+
+        if status != 'OK':
+            print(f"   [!] ALERT: {status}")
+            send_notification(m.get('integrations', []), f"Alert on {m['name']}: {status}")
+        else:
+            print(f"   [+] {m['type']} Analysis OK")
+        
+        # --- E. UPDATE TIMESTAMP ---
+        record_scan_success(m, status)
+        return {"result": result_json, "status": status, "log_id": log_entry['id']}
+        
+    except Exception as e:
+        print(f"   [!] Analysis Failed: {e}")
+        # Retry with backoff, then dead-letter (never retried forever)
+        record_scan_failure(m, e, frame)
+        return None
+
+# --- SINGLE-FLIGHT SCANS ---
+# Scheduler, bridge pushes and /trigger signals for the same monitor share one scan; a result
+# also answers requests arriving up to SCAN_FRESHNESS seconds after it (0 = only while running).
+# Per process: run the API and scheduler in one process (CAMAI_ROLE=all) to coalesce across them.
+SCAN_FRESHNESS = float(os.getenv("SCAN_FRESHNESS", 30))
+monitor_scans = result_cache.SingleFlight(fresh_for=SCAN_FRESHNESS)
+dedup_stats = {"scans": 0, "attached": 0, "fresh": 0, "attached_failed": 0, "captures_saved": 0, "api_calls_saved": 0}
+
+def single_flight_scan(m, scan, captures=False, fresh=True):
+    """
+    Runs scan() for monitor m unless another scan of m is running or just finished, in which
+    case that one's outcome is returned. `captures`: scan() would have grabbed its own frame;
+    fresh=False: a finished scan's outcome is not reused, only a running one is joined.
+    Returns (outcome, source) with source "leader", "attached" or "fresh". A joined scan that
+    raised gives (None, "attached"): no shared outcome, the caller decides whether to scan itself.
+    """
+    ran = []
+    def lead():
+        ran.append(True)
+        return scan()
+    try:
+        outcome, source = monitor_scans.do(m['id'], lead, fresh=fresh)
+    except Exception as e:
+        if ran:
+            raise
+        print(f"   [!] {m['name']}: the scan this one joined failed ({e})")
+        dedup_stats["attached_failed"] += 1
+        return None, "attached"
+    if source == "leader":
+        dedup_stats["scans"] += 1
+    else:
+        dedup_stats[source] += 1
+        dedup_stats["api_calls_saved"] += 1
+        dedup_stats["captures_saved"] += int(captures)
+        print(f"   [=] {m['name']}: reusing {source} scan result")
+    return outcome, source
+
+def capture_group(group):
+    """Captures once for every monitor on the camera. Returns the Frame, or None."""
+    cam_input = camera_input(group[0])
+    # --- A. CAPTURE ---
+    # Dead cameras are skipped by their circuit breaker until the next half-open probe
+    if not capture.health_for(cam_input).ready():
+        return None
+    names = ", ".join(m['name'] for m in group)
+    print(f"⏰ Time to check: {cam_input} -> {names}")
+
+    # One attempt on behalf of every monitor in the group, whether or not it yields a frame
+    fanout_stats["captures"] += 1
+    fanout_stats["monitor_scans"] += len(group)
+    frame = capture_frame(cam_input, group[0].get('capture_driver'))
+    memory.touch("camera_health", str(cam_input), capture.state_nbytes(cam_input))
+    for m in group:
+        sync_camera_status(m, cam_input)
+
+    # CHECK: Did we actually get a valid image?
+    if frame is None:
+        if capture.health_for(cam_input).state != capture.OPEN:
+            print(f"   [!] Cam {cam_input} failed (No Frame). Skipping analysis.")
+    return frame
+
+def gate_items(captured):
+    """motion_gate() input for every monitor of every captured frame that goes through the gate."""
+    items = []
+    for group, frame in captured:
+        for m in group:
+            if not needs_motion_gate(m):
+                continue
+            try:
+                items.append((m['id'], monitor_regions(m, frame)[0], budget_view(m).get('motion_threshold')))
+            except Exception as e:
+                # One bad frame or ROI must not cost the other monitors their tick; scan_monitor reports it
+                print(f"   [!] {m['name']}: region/motion setup failed: {e}")
+    return items
+
+def release_stale_state(monitors):
+    """Frees in-memory state of monitors/cameras that no longer exist (e.g. deleted by another worker)."""
+    memory.retain("motion", motion_engine.monitor_ids(), {m['id'] for m in monitors})
+    memory.retain("camera_health", capture.cameras(), {str(camera_input(m)) for m in monitors})
+
+def seconds_to_next_scan(monitors, now):
+    upcoming = [seconds_until_due(m, now) for m in monitors if is_scannable(m)]
+    # Monitors still due right after a tick (e.g. their camera failed) wait for the next full tick
+    upcoming = [r for r in upcoming if r]
+    return max(1.0, min([SCHEDULER_TICK, *upcoming]))
+
 def run_scheduler():
     print("--- Scheduler Started (Smart Polling) ---")
     while True:
         try:
+            shard.refresh() # the ring as of this tick; the heartbeat thread keeps the node alive during it
             monitors = load_monitors()
-            for m in monitors:
-                # 1. FILTER: Only process Active RTSP/Interval streams
-                if m.get('source') != 'RTSP Stream':
-                    continue
-
-# 2. THE FIX: Check if this is a "Local Device" (0, 1) or a "Network Stream"
-                cam_id = m.get('connection_url', 0)
-                is_local_device = False
-                try:
-                    int(cam_id) # If it converts to int (0, 1), it's a local USB cam
-                    is_local_device = True
-                except:
-                    is_local_device = False # It's a string (rtsp://...)
-
-                # CRITICAL: If on Cloud, DO NOT touch local devices. 
-                # We assume a "Bridge" script is handling them.
-                if is_local_device:
-                    # Optional: Check if we haven't heard from the bridge in a while (Health check)
-                    # But DO NOT try cv2.VideoCapture(0) here.
-                    continue 
-
-                # 3. Handle Network Streams (RTSP)
-                # Only proceed if it looks like a real URL (rtsp:// or http://)
-                if isinstance(cam_id, str) and (cam_id.startswith('rtsp') or cam_id.startswith('http')):
-                    print(f"⏰ Checking Network Cam: {m['name']}...")
-
-                # 2. TIME CHECK LOGIC
-                interval_minutes = float(m.get('interval', 60))
-                last_check_str = m.get('last_check_time')
-                should_run = False
-                
-                if not last_check_str:
-                    should_run = True # First run
-                else:
-                    try:
-                        last_check = datetime.fromisoformat(last_check_str)
-                        diff = datetime.now() - last_check
-                        diff_minutes = diff.total_seconds() / 60
-                        if diff_minutes >= interval_minutes:
-                            should_run = True
-                    except ValueError:
-                        should_run = True # Corrupted time, reset
-
-                # 3. EXECUTION BLOCK
-                if should_run:
-                    print(f"⏰ Time to check: {m['name']} (Interval: {interval_minutes}m)")
-                    
-                    # --- A. CAPTURE ---
-                    cam_id = m.get('connection_url', 0)
-                    try: cam_input = int(cam_id)
-                    except: cam_input = cam_id
-                    
-                    frame_bytes = None
-                    cap = cv2.VideoCapture(cam_input)
-                    
-                    try:
-                        if cap.isOpened():
-                            ret, frame = cap.read()
-                            if ret:
-                                _, buffer = cv2.imencode('.jpg', frame)
-                                frame_bytes = buffer.tobytes()
-                    except Exception as e:
-                        print(f"   [!] Capture Error: {e}")
-                    finally:
-                        cap.release() # CRITICAL: Prevent Zombie Camera
-
-                    # CHECK: Did we actually get a valid image?
-                    if not frame_bytes:
-                        print(f"   [!] Cam {cam_input} failed (No Frame). Skipping analysis.")
-                        continue 
-
-                    # --- B. ROUTING & ANALYSIS ---
-                    try:
-                        rule = m.get('rule', "")
-                        result_text = "{}"
-    # Load Ideal Image Bytes if it exists
-                        ideal_bytes = None
-                        if m.get('ideal_image_path') and os.path.exists(m['ideal_image_path']):
-                            with open(m['ideal_image_path'], 'rb') as f:
-                                ideal_bytes = f.read()                        
-                        
-                        # Select the correct AI Agent
-                        if m['type'] == 'QUANTIFIER':
-                            result_text = analyze_quantifier(frame_bytes, rule, ideal_bytes)
-                        elif m['type'] == 'DETECTOR':
-                            result_text = analyze_detector(frame_bytes, rule)
-                        elif m['type'] == 'PROCESS':
-                            result_text = analyze_process(frame_bytes, rule)
-                            
-                        # --- C. PARSE & SAVE ---
-                        result_json = json.loads(result_text)
-                        
-                        # Save Log & Image
-                        save_log_entry(m['id'], m['name'], m['type'], result_json, frame_bytes)
-                        
-                        # --- D. ALERTS ---
-                        status = "OK"
-                        if m['type'] == 'QUANTIFIER':
-                            status = result_json.get('overall_status', 'OK')
-                        elif m['type'] == 'DETECTOR':
-                            status = "FAIL" if result_json.get('compliance_status') == 'FAIL' else "OK"
-                        elif m['type'] == 'PROCESS':
-                            if result_json.get('anomalies_detected'): status = "ALERT"
-
-                        if status != 'OK':
-                            print(f"   [!] ALERT: {status}")
-                            send_notification(m.get('integrations', []), f"Alert on {m['name']}: {status}")
-                        else:
-                            print(f"   [+] {m['type']} Analysis OK")
-                        
-                        # --- E. UPDATE TIMESTAMP ---
-                        # Only update if successful, so we don't skip a retry if it was a glitch
-                        # (But be careful: if it crashes 100% of the time, this loop will retry forever)
-                        m['last_check_time'] = datetime.now().isoformat()
-                        save_monitors(monitors)
-                        
-                    except Exception as e:
-                        print(f"   [!] Analysis Failed: {e}")
-                        # Optional: Update timestamp here anyway to prevent infinite retry loops on bad data
-                        # m['last_check_time'] = datetime.now().isoformat()
-                        # save_monitors(monitors)
-
-            # Sleep briefly to reduce CPU usage
-            time.sleep(10) 
+            release_stale_state(monitors)
+
+            # 1. Capture each due camera once
+            captured = []
+            for group in due_groups(monitors, datetime.now()).values():
+                frame = capture_group(group)
+                if frame is not None:
+                    captured.append((group, frame))
+
+            # 2. One vectorized motion pass over every due monitor
+            moved = motion_gate(gate_items(captured))
+
+            # 3. Fan each frame out to its monitors
+            for group, frame in captured:
+                for m in group:
+                    scan = lambda m=m, frame=frame: scan_monitor(m, frame, moved.get(m['id'], True))
+                    # Only a scan still running is shared: a finished one (a trigger's, or this monitor's
+                    # own last tick) predates this frame, and motion_gate() has already moved the reference
+                    outcome, source = single_flight_scan(m, scan, fresh=False)
+                    if source != "leader" and outcome:
+                        # A trigger is scanning it right now: that counts as this interval's check
+                        record_scan_success(m, outcome['status'])
+                    elif source != "leader":
+                        scan() # the trigger it joined failed or captured nothing: use this tick's frame
+
+            warm.checkpoint()
+
+            # Sleep until the next monitor falls due (at most SCHEDULER_TICK, so new monitors and edits are seen)
+            time.sleep(seconds_to_next_scan(load_monitors(), datetime.now()))
             
         except Exception as e:
             print(f"Scheduler Crash: {e}")
             time.sleep(60)
 
-threading.Thread(target=run_scheduler, daemon=True).start()
+scheduler_thread = None
+
+def start_scheduler():
+    global scheduler_thread
+    if ROLE == 'scan':
+        prewarm()
+    warm.restore()
+    atexit.register(warm.checkpoint, force=True)
+    shard.start_heartbeat()
+    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+    scheduler_thread.start()
+
+if ROLE in ('all', 'scan') and not IS_SPAWNED_WORKER:
+    start_scheduler()
 
 # --- API ROUTES ---
 @app.route('/', methods=['GET'])
@@ -405,15 +1004,260 @@ def health_check():
     return "Camai Backend is Running", 200
 
 @app.route('/monitors', methods=['GET'])
-def get_monitors(): return jsonify(load_monitors())
+def get_monitors():
+    # Always the full fleet, whichever node answers; annotate who scans what when sharded
+    monitors = load_monitors()
+    now = datetime.now()
+    for m in monitors:
+        if shard.enabled:
+            m['assigned_node'] = shard.owner(m['id'])
+        # What adaptive scheduling is doing, and the scans per day it saves (negative = extra)
+        m['effective_interval'] = effective_interval(m)
+        if m.get('schedule_mode') == 'adaptive':
+            m['scans_saved_per_day'] = round(1440 / float(m.get('interval', 60)) - 1440 / m['effective_interval'], 1)
+        # Cron / active windows / blackouts: when it runs next and the scans they have avoided so far
+        if schedules.is_restricted(m):
+            due, _ = next_due(m, now)
+            m['next_run'] = due.isoformat() if due else None
+            m['scans_avoided'] = int(m.get('scans_avoided', 0))
+        # Today's / this month's calls and tokens against its budgets, and the degradation applied
+        m['budget'] = budget.state(m)
+    return jsonify(monitors)
 
 @app.route('/logs', methods=['GET'])
 def get_logs(): return jsonify(load_logs())
 
+@app.route('/cameras', methods=['GET'])
+def get_cameras():
+    # Health as seen by this process (the scan worker owns the authoritative view)
+    return jsonify(capture.all_health())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    monitors = load_monitors()
+    restricted = [m for m in monitors if schedules.is_restricted(m)]
+    return jsonify({
+        "image_pool": imaging.stats(),
+        "memory": memory.usage(),
+        "motion_store": motion_engine.stats(),
+        "warm_state": warm.stats,
+        "snapshot": capture.snapshot_stats,
+        "routing": router.stats(),
+        "trigger_cache": trigger_cache.usage(),
+        "single_flight": dedup_stats,
+        "shard": shard.stats(monitors),
+        "roi": dict(roi_stats),
+        "fanout": dict(fanout_stats, captures_saved=fanout_stats["monitor_scans"] - fanout_stats["captures"]),
+        "schedule": {
+            "restricted_monitors": len(restricted),
+            "cron_monitors": sum(1 for m in restricted if m.get('cron')),
+            "scans_avoided": sum(int(m.get('scans_avoided', 0)) for m in restricted),
+        },
+        "budget": budget.deployment(),
+        "lanes": model_lanes.stats(),
+        "gemini_pool": gemini.stats(),
+    })
+
+# --- TOKEN ACCOUNTING ---
+# The part of every call's prompt that never changes for a monitor (system instruction, ideal image)
+# is what context caching would serve; below CONTEXT_CACHE_MIN_TOKENS caching isn't available.
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", 1024))
+IMAGE_TILE_TOKENS = 258 # Gemini's charge per image tile (768x768), or per image up to 384x384
+_fixed_tokens = {} # content key -> token count
+
+def estimate_image_tokens(jpeg_bytes):
+    pixels = imaging.Frame.from_jpeg("estimate", jpeg_bytes).pixels
+    if pixels is None:
+        return IMAGE_TILE_TOKENS
+    height, width = pixels.shape[:2]
+    if width <= 384 and height <= 384:
+        return IMAGE_TILE_TOKENS
+    return IMAGE_TILE_TOKENS * -(-width // 768) * -(-height // 768)
+
+def fixed_tokens(model, content, estimate):
+    """count_tokens for a text or image part, once per distinct content; `estimate()` if the call fails."""
+    from google.genai import types
+    data = content if isinstance(content, bytes) else content.encode()
+    key = result_cache.content_key(model, data)
+    if key not in _fixed_tokens:
+        part = types.Part.from_bytes(data=content, mime_type="image/jpeg") if isinstance(content, bytes) else content
+        try:
+            _fixed_tokens[key] = gemini.call(lambda client: client.models.count_tokens(model=model, contents=part)).total_tokens
+        except Exception as e:
+            print(f"   [!] count_tokens failed, estimating: {e}")
+            _fixed_tokens[key] = estimate()
+    return _fixed_tokens[key]
+
+def fixed_overhead(mode, ideal_image_path=None, model=routing.FAST_MODEL):
+    """Tokens every call of this kind repeats: {"system_instruction_tokens", "ideal_image_tokens", "tokens_per_call"}."""
+    if mode not in ('QUANTIFIER', 'DETECTOR', 'PROCESS'):
+        return None
+    _, config = analysis_request(mode, b"", "")
+    instruction = config.system_instruction
+    system = fixed_tokens(model, instruction, lambda: len(instruction) // 4)
+    ideal = 0
+    if mode == 'QUANTIFIER' and ideal_image_path and os.path.exists(ideal_image_path):
+        with open(ideal_image_path, 'rb') as f:
+            ideal_bytes = f.read()
+        ideal = fixed_tokens(model, ideal_bytes, lambda: estimate_image_tokens(ideal_bytes))
+    return {"system_instruction_tokens": system, "ideal_image_tokens": ideal, "tokens_per_call": system + ideal}
+
+def with_overhead(summary, overhead):
+    """Adds the fixed overhead, its share of the prompt and whether caching it is worth a look."""
+    if overhead is None:
+        return summary
+    prompt_per_call = summary["prompt_tokens"] / summary["calls"] if summary["calls"] else None
+    return {**summary, "fixed_overhead": {
+        **overhead,
+        "share_of_prompt": round(min(1.0, overhead["tokens_per_call"] / prompt_per_call), 3) if prompt_per_call else None,
+        "tokens": overhead["tokens_per_call"] * summary["calls"],
+        "cache_candidate": overhead["tokens_per_call"] >= CONTEXT_CACHE_MIN_TOKENS,
+    }}
+
+@app.route('/usage', methods=['GET'])
+def get_usage():
+    """
+    Token and latency rollups from the usage ledger, per monitor (most expensive first) and per
+    monitor type. ?period=month (default) or day. Each rollup names its fixed per-call overhead.
+    """
+    period = request.args.get('period', 'month')
+    if period not in ('day', 'month'):
+        return jsonify({"error": "period must be one of day, month"}), 400
+    rollups = budget.rollups(period)
+    monitors = {m['id']: m for m in load_monitors()}
+
+    per_monitor = []
+    for id, summary in rollups["monitors"].items():
+        m = monitors.get(id, {})
+        overhead = fixed_overhead(m.get('type'), m.get('ideal_image_path')) if m else None
+        per_monitor.append({"id": id, "name": m.get('name'), "type": m.get('type'), "rule": m.get('rule'),
+                            **with_overhead(summary, overhead)})
+    per_monitor.sort(key=lambda r: r["tokens"], reverse=True)
+
+    return jsonify({
+        "period": rollups["period"],
+        "deployment": rollups["deployment"],
+        "monitors": per_monitor,
+        "types": {mode: with_overhead(summary, fixed_overhead(mode)) for mode, summary in rollups["types"].items()},
+        "context_cache_min_tokens": CONTEXT_CACHE_MIN_TOKENS,
+    })
+
+# --- MONITOR FIELDS (shared by the single and bulk endpoints) ---
+def parse_list(value):
+    return value if isinstance(value, list) else str(value or '').split(',')
+
+def validate_monitor_fields(data):
+    """Checks the enumerated/structured fields. Returns {"rois", "escalate_on", "schedule", "budget"} parsed; raises ValueError."""
+    parsed = {}
+    try:
+        parsed['rois'] = imaging.normalize_rois(data.get('rois')) if 'rois' in data else None
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid rois: {e}")
+    if data.get('capture_driver', 'auto') not in capture.DRIVERS:
+        raise ValueError(f"capture_driver must be one of {', '.join(capture.DRIVERS)}")
+    if data.get('schedule_mode', 'fixed') not in SCHEDULE_MODES:
+        raise ValueError(f"schedule_mode must be one of {', '.join(SCHEDULE_MODES)}")
+    if data.get('routing_policy', routing.ROUTING_POLICY) not in routing.POLICIES:
+        raise ValueError(f"routing_policy must be one of {', '.join(routing.POLICIES)}")
+    try:
+        parsed['escalate_on'] = routing.normalize_escalate_on(data.get('escalate_on'))
+    except ValueError as e:
+        raise ValueError(f"Invalid escalate_on: {e}")
+    try:
+        parsed['schedule'] = schedules.normalize(data)
+    except ValueError as e:
+        raise ValueError(f"Invalid schedule: {e}")
+    try:
+        parsed['budget'] = budgets.normalize(data)
+    except ValueError as e:
+        raise ValueError(f"Invalid budget: {e}")
+    return parsed
+
+def new_monitor(data, ideal_image_path=None):
+    """Monitor record from request fields. Raises ValueError on invalid input."""
+    parsed = validate_monitor_fields(data)
+    optional_float = lambda key: float(data[key]) if data.get(key) not in (None, '') else None
+    try:
+        return {
+            "id": str(data.get('id') or uuid.uuid4()),
+            "name": data.get('name'),
+            "type": data.get('type'),
+            "source": data.get('source'),
+            "connection_url": data.get('connection_url', '0'),
+            "rule": data.get('rule'),
+            "interval": float(data.get('interval', 60)),
+            "integrations": parse_list(data.get('integrations', '')),
+            "status": "OK",
+            "ideal_image_path": ideal_image_path or data.get('ideal_image_path'),
+            "max_retries": int(data.get('max_retries', DEFAULT_MAX_RETRIES)),
+            "retry_backoff": float(data.get('retry_backoff', DEFAULT_RETRY_BACKOFF)),
+            "rois": parsed['rois'] or [],
+            "roi_mode": data.get('roi_mode', 'crop'),
+            "capture_driver": data.get('capture_driver', 'auto'),
+            "schedule_mode": data.get('schedule_mode', 'fixed'),
+            "min_interval": optional_float('min_interval'),
+            "max_interval": optional_float('max_interval'),
+            "routing_policy": data.get('routing_policy', routing.ROUTING_POLICY),
+            "escalate_on": parsed['escalate_on'],
+            "confidence_threshold": optional_float('confidence_threshold'),
+            "motion_threshold": optional_float('motion_threshold'),
+            "cron": parsed['schedule'].get('cron'),
+            "active_windows": parsed['schedule'].get('active_windows', []),
+            "blackout_dates": parsed['schedule'].get('blackout_dates', []),
+            "timezone": parsed['schedule'].get('timezone'),
+            **{field: parsed['budget'].get(field) for field in budgets.FIELDS},
+            "last_update": datetime.now().isoformat()
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid field value: {e}")
+
+def apply_monitor_update(m, data):
+    """Applies the fields present in `data` to monitor m in place. Raises ValueError (m untouched)."""
+    parsed = validate_monitor_fields(data)
+    try:
+        changes = {
+            'name': data.get('name', m['name']),
+            'type': data.get('type', m['type']),
+            'source': data.get('source', m['source']),
+            'connection_url': data.get('connection_url', m.get('connection_url')),
+            'rule': data.get('rule', m['rule']),
+            'interval': float(data.get('interval', m.get('interval', 60))),
+        }
+        if 'integrations' in data:
+            changes['integrations'] = parse_list(data['integrations'])
+        if 'max_retries' in data:
+            changes['max_retries'] = int(data['max_retries'])
+        if 'retry_backoff' in data:
+            changes['retry_backoff'] = float(data['retry_backoff'])
+        if parsed['rois'] is not None:
+            changes['rois'] = parsed['rois']
+        for field in ('roi_mode', 'capture_driver', 'routing_policy'):
+            if field in data:
+                changes[field] = data[field]
+        if 'schedule_mode' in data and data['schedule_mode'] != m.get('schedule_mode'):
+            changes['schedule_mode'] = data['schedule_mode']
+            changes['effective_interval'] = None # start over from `interval`
+        for field in ('min_interval', 'max_interval', 'confidence_threshold', 'motion_threshold'):
+            if field in data:
+                changes[field] = float(data[field]) if data[field] not in (None, '') else None
+        if 'escalate_on' in data:
+            changes['escalate_on'] = parsed['escalate_on']
+        if parsed['schedule']:
+            changes.update(parsed['schedule'])
+            changes['deferred_until'] = None # re-plan under the new rules
+        changes.update(parsed['budget'])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid field value: {e}")
+    m.update(changes)
+    return m
+
 @app.route('/monitors', methods=['POST'])
 def create_monitor():
     data = request.form.to_dict()
-    monitors = load_monitors()
+    try:
+        validate_monitor_fields(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # 1. Handle Ideal Image Upload
     ideal_image_path = None
@@ -428,51 +1272,172 @@ def create_monitor():
             file.save(path)
             ideal_image_path = path
 
-    new_m = {
-        "id": str(uuid.uuid4()),
-        "name": data.get('name'),
-        "type": data.get('type'),
-        "source": data.get('source'),
-        "connection_url": data.get('connection_url', '0'),
-        "rule": data.get('rule'),
-        "interval": float(data.get('interval', 60)),
-        "integrations": data.get('integrations', '').split(','),
-        "status": "OK",
-        "ideal_image_path": ideal_image_path,
-        "last_update": datetime.now().isoformat()
-    }
-    monitors.append(new_m)
-    save_monitors(monitors)
+    data.pop('id', None) # ids are always generated here
+    try:
+        new_m = new_monitor(data, ideal_image_path)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with monitors_lock():
+        monitors = load_monitors()
+        monitors.append(new_m)
+        save_monitors(monitors)
     return jsonify(new_m)
 
 @app.route('/monitors/<id>', methods=['PUT'])
 def update_monitor_endpoint(id): 
     data = request.form.to_dict()
-    monitors = load_monitors()
     updated = None
     
-    for m in monitors:
-        if m['id'] == id:
-            m['name'] = data.get('name', m['name'])
-            m['type'] = data.get('type', m['type'])
-            m['source'] = data.get('source', m['source'])
-            m['connection_url'] = data.get('connection_url', m.get('connection_url'))
-            m['rule'] = data.get('rule', m['rule'])
-            m['interval'] = float(data.get('interval', m.get('interval', 60)))
-            if 'integrations' in data:
-                m['integrations'] = data['integrations'].split(',')
-            updated = m
-            break
-            
+    with monitors_lock():
+        monitors = load_monitors()
+        for m in monitors:
+            if m['id'] == id:
+                try:
+                    updated = apply_monitor_update(m, data)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                break
+                
+        if updated:
+            save_monitors(monitors)
     if updated:
-        save_monitors(monitors)
         return jsonify(updated)
     return jsonify({"error": "Not found"}), 404
 
+# --- BULK ---
+# One request, one lock, one rewrite of monitors.json (vs one full rewrite per monitor)
+BULK_OPS = ("create", "update", "upsert", "delete")
+EXPORT_BATCH = 500 # monitors serialized per yielded chunk
+
+def bulk_operations():
+    """The request body as a list of operations: a JSON list, {"operations": [...]}, or NDJSON."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        lines = request.get_data(as_text=True).splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+    body = request.get_json(force=True)
+    if isinstance(body, dict):
+        body = body.get('operations')
+    if not isinstance(body, list):
+        raise ValueError("expected a list of operations")
+    return body
+
+def apply_bulk_operation(monitors, index, op):
+    """Applies one operation to the in-memory list (and its id index). Returns the item result; raises ValueError."""
+    if not isinstance(op, dict):
+        raise ValueError("operation must be an object")
+    # Fields may be nested under "monitor" or sit next to "op"
+    data = op.get('monitor') if isinstance(op.get('monitor'), dict) else {k: v for k, v in op.items() if k != 'op'}
+    id = str(op.get('id') or data.get('id') or '')
+    kind = op.get('op', 'upsert' if id else 'create') # exported records carry their id: re-importing them upserts
+    if kind not in BULK_OPS:
+        raise ValueError(f"op must be one of {', '.join(BULK_OPS)}")
+    if kind == 'upsert':
+        kind = 'update' if id in index else 'create'
+
+    if kind == 'create':
+        if id and id in index:
+            raise ValueError(f"monitor {id} already exists")
+        m = new_monitor({**data, 'id': id} if id else data)
+        monitors.append(m)
+        index[m['id']] = m
+        return {"op": "create", "id": m['id']}
+    if not id:
+        raise ValueError("id is required")
+    if id not in index:
+        raise KeyError(id)
+    if kind == 'update':
+        apply_monitor_update(index[id], {k: v for k, v in data.items() if k != 'id'})
+        index[id]['last_update'] = datetime.now().isoformat()
+        return {"op": "update", "id": id}
+    monitors.remove(index.pop(id))
+    return {"op": "delete", "id": id}
+
+@app.route('/monitors/bulk', methods=['POST'])
+def bulk_monitors():
+    """
+    Create / update / upsert / delete many monitors in one transaction.
+    Body: JSON list (or {"operations": [...]}) or NDJSON, each item {"op": ..., "id": ..., <fields>}.
+    Items without "op" are upserts when they carry an id (e.g. /monitors/export lines), creates otherwise.
+    ?atomic=true (default) persists nothing if any item fails; ?atomic=false applies the valid ones.
+    """
+    atomic = request.args.get('atomic', 'true').lower() not in ('0', 'false', 'no')
+    try:
+        operations = bulk_operations()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid bulk body: {e}"}), 400
+
+    results = []
+    with monitors_lock():
+        monitors = load_monitors()
+        before = {m['id'] for m in monitors}
+        # Atomic batches work on a copy so a failure leaves the stored list untouched
+        working = json.loads(json.dumps(monitors)) if atomic else monitors
+        index = {m['id']: m for m in working}
+        for i, op in enumerate(operations):
+            try:
+                results.append({"index": i, **apply_bulk_operation(working, index, op), "status": "ok"})
+            except KeyError as e:
+                results.append({"index": i, "status": "error", "error": f"monitor {e.args[0]} not found"})
+            except ValueError as e:
+                results.append({"index": i, "status": "error", "error": str(e)})
+        failed = sum(1 for r in results if r['status'] == 'error')
+        commit = not (atomic and failed)
+        if commit and len(results) > failed:
+            save_monitors(working)
+
+    if commit:
+        removed = before - set(index)
+        for id in removed:
+            memory.forget(id)
+        if removed:
+            release_stale_state(working)
+    else:
+        for r in results:
+            if r['status'] == 'ok':
+                r['status'] = 'rolled_back'
+    return jsonify({
+        "success": failed == 0,
+        "atomic": atomic,
+        "applied": len(results) - failed if commit else 0,
+        "failed": failed,
+        "results": results,
+    }), 200 if commit else 422
+
+@app.route('/monitors/export', methods=['GET'])
+def export_monitors():
+    """
+    Streams the stored monitor records (POST them back to /monitors/bulk as they are: they upsert).
+    ?format=ndjson (default) one monitor per line, ?format=json one streamed array.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'json'):
+        return jsonify({"error": "format must be one of ndjson, json"}), 400
+    monitors = load_monitors()
+
+    def generate():
+        if fmt == 'json':
+            yield '['
+        for start in range(0, len(monitors), EXPORT_BATCH):
+            batch = monitors[start:start + EXPORT_BATCH]
+            if fmt == 'json':
+                yield (',' if start else '') + ','.join(json.dumps(m) for m in batch)
+            else:
+                yield ''.join(json.dumps(m) + '\n' for m in batch)
+        if fmt == 'json':
+            yield ']'
+
+    mimetype = 'application/json' if fmt == 'json' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=monitors.{fmt}"})
+
 @app.route('/monitors/<id>', methods=['DELETE'])
 def delete_monitor(id):
-    monitors = [m for m in load_monitors() if m['id'] != id]
-    save_monitors(monitors)
+    with monitors_lock():
+        monitors = [m for m in load_monitors() if m['id'] != id]
+        save_monitors(monitors)
+    # Drop everything held in memory for it (and its camera, if nothing else uses it)
+    memory.forget(id)
+    release_stale_state(monitors)
     return jsonify({"success": True})
 
 @app.route('/monitors/<id>/download-bridge', methods=['GET'])
@@ -583,71 +1548,114 @@ def trigger_existing_monitor(id):
             return jsonify({"error": "Monitor not found"}), 404
 
         print(f"⚡ EXTERNAL TRIGGER RECEIVED: {monitor['name']}")
+        state = budget.state(monitor)
+        if state['level'] == budgets.PAUSED:
+            return jsonify({"error": "Monitor budget exhausted", "budget": state}), 429
         
-        # Scenario A: The external app sent an IMAGE (e.g., Mobile App upload)
-        # We look for 'image' in request.files
-        frame_bytes = None
-        if 'image' in request.files:
-            print("   [+] Using uploaded image from request")
-            file = request.files['image']
-            frame_bytes = file.read()
+        def scan():
+            # Scenario A: The external app sent an IMAGE (e.g., Mobile App upload)
+            # We look for 'image' in request.files
+            frame = None
+            if 'image' in request.files:
+                print("   [+] Using uploaded image from request")
+                file = request.files['image']
+                frame = imaging.Frame.from_jpeg(monitor['id'], file.read())
             
-        # Scenario B: The external app sent a SIGNAL (e.g., Billing POS)
-        # We must grab the frame from the configured RTSP/Camera ourselves
-        elif monitor.get('connection_url'):
-            print(f"   [+] Capturing from configured source: {monitor['connection_url']}")
+            # Scenario B: The external app sent a SIGNAL (e.g., Billing POS)
+            # We must grab the frame from the configured RTSP/Camera ourselves
+            elif monitor.get('connection_url'):
+                print(f"   [+] Capturing from configured source: {monitor['connection_url']}")
             
-            cam_id = monitor.get('connection_url')
-            try: cam_input = int(cam_id)
-            except: cam_input = cam_id
+                cam_id = monitor.get('connection_url')
+                try: cam_input = int(cam_id)
+                except: cam_input = cam_id
             
-            cap = cv2.VideoCapture(cam_input)
-            try:
-                if cap.isOpened():
-                    ret, frame = cap.read()
-                    if ret:
-                        _, buffer = cv2.imencode('.jpg', frame)
-                        frame_bytes = buffer.tobytes()
-            finally:
-                cap.release()
+                frame = capture_frame(cam_input, monitor.get('capture_driver'))
         
-        if not frame_bytes:
-            return jsonify({"error": "No image provided and camera capture failed"}), 400
+            if frame is None:
+                return None
 
-        # --- RUN ANALYSIS ---
-        # (Reuse logic from scheduler)
-        rule = monitor.get('rule', "")
-        result_text = "{}"
-        
-        if monitor['type'] == 'QUANTIFIER':
-            result_text = analyze_quantifier(frame_bytes, rule)
-        elif monitor['type'] == 'DETECTOR':
-            result_text = analyze_detector(frame_bytes, rule)
-        elif monitor['type'] == 'PROCESS':
-            result_text = analyze_process(frame_bytes, rule)
+            # --- RUN ANALYSIS ---
+            # (Reuse logic from scheduler, ahead of its interval scans)
+            result_json, route = analyze_monitor(monitor, frame, lane=lanes.TRIGGERED)
             
-        result_json = json.loads(result_text)
-        
-        # Save to logs
-        log_entry = save_log_entry(
-            monitor['id'], 
-            monitor['name'], 
-            monitor['type'], 
-            result_json, 
-            frame_bytes
-        )
+            # Save to logs
+            log_entry = save_log_entry(
+                monitor['id'], 
+                monitor['name'], 
+                monitor['type'], 
+                result_json, 
+                frame.jpeg_view,
+                extra={"routing": route}
+            )
+            return {"result": result_json, "status": result_status(monitor, result_json), "log_id": log_entry['id']}
+
+        # A scan of this monitor that is already running (scheduler, bridge, another signal),
+        # or finished less than SCAN_FRESHNESS seconds ago, answers this trigger as well
+        outcome, source = single_flight_scan(monitor, scan, captures='image' not in request.files)
+        if outcome is None and source != "leader":
+            outcome = scan() # the scan it joined analysed nothing (no motion, or it failed)
+        if outcome is None:
+            return jsonify({"error": "No image provided and camera capture failed"}), 400
         
         return jsonify({
             "success": True, 
             "message": "Scan completed", 
-            "result": result_json,
-            "log_id": log_entry['id']
+            "result": outcome['result'],
+            "log_id": outcome['log_id'],
+            "shared": source != "leader"
         })
 
     except Exception as e:
         print(f"Trigger Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/dead-letters', methods=['GET'])
+def get_dead_letters(): return jsonify(load_dead_letters())
+
+@app.route('/dead-letters/<id>/replay', methods=['POST'])
+def replay_dead_letter(id):
+    """Re-runs a parked scan with the monitor's current rule. On success the monitor resumes."""
+    letter = next((d for d in load_dead_letters() if d['id'] == id), None)
+    if not letter:
+        return jsonify({"error": "Dead letter not found"}), 404
+    monitor = next((m for m in load_monitors() if m['id'] == letter['monitor_id']), None)
+    if not monitor:
+        return jsonify({"error": "Monitor not found"}), 404
+    if not os.path.exists(letter['image_path']):
+        return jsonify({"error": "Dead letter frame is missing"}), 410
+
+    with open(letter['image_path'], 'rb') as f:
+        frame = imaging.Frame.from_jpeg(monitor['id'], f.read())
+    try:
+        result_json, route = analyze_monitor(monitor, frame, lane=lanes.INTERACTIVE)
+    except Exception as e:
+        print(f"Replay Error: {e}")
+        return jsonify({"error": str(e)}), 502
+
+    log_entry = save_log_entry(monitor['id'], monitor['name'], monitor['type'], result_json, frame.jpeg_view,
+                               extra={"routing": route})
+    discard_dead_letter(letter)
+    return jsonify({"success": True, "result": result_json, "log_id": log_entry['id']})
+
+@app.route('/dead-letters/<id>', methods=['DELETE'])
+def delete_dead_letter(id):
+    """Discards a parked scan and lets the monitor resume its normal schedule."""
+    letter = next((d for d in load_dead_letters() if d['id'] == id), None)
+    if not letter:
+        return jsonify({"error": "Dead letter not found"}), 404
+    discard_dead_letter(letter)
+    return jsonify({"success": True})
+
+def discard_dead_letter(letter):
+    save_dead_letters([d for d in load_dead_letters() if d['id'] != letter['id']])
+    if os.path.exists(letter['image_path']):
+        os.remove(letter['image_path'])
+    monitor = next((m for m in load_monitors() if m['id'] == letter['monitor_id']), None)
+    if monitor and monitor.get('dead_letter_id') == letter['id']:
+        update_monitor(monitor['id'], dead_letter_id=None, failed_attempts=0, transient_failures=0, next_retry_time=None,
+                       last_check_time=datetime.now().isoformat())
+
 @app.route('/trigger-scan', methods=['POST'])
 def test_monitor_logic():
     try:
@@ -667,21 +1675,93 @@ def test_monitor_logic():
             ideal_bytes = request.files['ideal_image'].read()
 
         # 3. Route to AI Logic (Stateless)
-        result_text = "{}"
-        if mode == 'QUANTIFIER':
-            result_text = analyze_quantifier(image_bytes, user_rule, ideal_bytes)
-        elif mode == 'DETECTOR':
-            result_text = analyze_detector(image_bytes, user_rule)
-        elif mode == 'PROCESS':
-            result_text = analyze_process(image_bytes, user_rule)
+        def analyze():
+            # Previews count against the deployment budget only
+            if budget.deployment()['exhausted']:
+                raise budgets.BudgetExhausted("Deployment budget exhausted")
+            usage = {}
+            result_text = "{}"
+            try:
+                if mode == 'QUANTIFIER':
+                    result_text = analyze_quantifier(image_bytes, user_rule, ideal_bytes, usage=usage, lane=lanes.INTERACTIVE)
+                elif mode == 'DETECTOR':
+                    result_text = analyze_detector(image_bytes, user_rule, usage=usage, lane=lanes.INTERACTIVE)
+                elif mode == 'PROCESS':
+                    result_text = analyze_process(image_bytes, user_rule, usage=usage, lane=lanes.INTERACTIVE)
+            finally:
+                budget.record(None, usage)
+            return json.loads(result_text)
+
+        # Same image + rule (up to whitespace) is answered from the cache; identical
+        # requests in flight at the same time share one model call
+        result, cached = trigger_cache.get_or_compute(trigger_cache_key(mode, user_rule, image_bytes, ideal_bytes), analyze)
             
         # 4. Return Result directly
-        return jsonify(json.loads(result_text))
+        return jsonify({**result, "cached": cached})
 
+    except budgets.BudgetExhausted as e:
+        return jsonify({"error": str(e), "budget": budget.deployment()}), 429
     except Exception as e:
         print(f"Test Scan Error: {e}")
         return jsonify({"error": str(e)}), 500
     
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/trigger-scan/stream', methods=['POST'])
+def stream_test_scan():
+    """
+    /trigger-scan as Server-Sent Events, for interactive rule authoring:
+      chunk  - {"text": ...} partial model output, as soon as Gemini produces it
+      result - the parsed JSON once the output is complete (or `error`)
+      done   - {"first_chunk_ms", "total_ms"} server-side timings
+    """
+    mode = request.form.get('mode', 'QUANTIFIER')
+    user_rule = request.form.get('rule', '')
+    if 'image' not in request.files:
+        return jsonify({"error": "No image uploaded"}), 400
+    image_bytes = request.files['image'].read()
+    ideal_bytes = request.files['ideal_image'].read() if 'ideal_image' in request.files else None
+
+    cache_key = trigger_cache_key(mode, user_rule, image_bytes, ideal_bytes)
+
+    def events():
+        started = time.perf_counter()
+        first_chunk = None
+        cached = trigger_cache.get(cache_key)
+        if cached is not None:
+            trigger_cache.stats["hits"] += 1
+            yield sse("result", {**cached, "cached": True})
+        elif budget.deployment()['exhausted']:
+            yield sse("error", {"error": "Deployment budget exhausted"})
+        else:
+            text = []
+            usage = {}
+            try:
+                for chunk in stream_analysis(mode, image_bytes, user_rule, ideal_bytes, usage=usage):
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                    text.append(chunk)
+                    yield sse("chunk", {"text": chunk})
+                result = json.loads("".join(text))
+                trigger_cache.stats["misses"] += 1
+                trigger_cache.put(cache_key, result)
+                yield sse("result", {**result, "cached": False})
+            except Exception as e:
+                print(f"Test Scan Stream Error: {e}")
+                yield sse("error", {"error": str(e)})
+            finally:
+                budget.record(None, usage)
+        yield sse("done", {
+            "cached": cached is not None,
+            "first_chunk_ms": round(first_chunk * 1000, 1) if first_chunk is not None else None,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    # No proxy buffering, or the chunks arrive all at once at the end
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route('/test-rule', methods=['POST'])
 def test_rule_endpoint():
     try:
@@ -696,4 +1776,7 @@ def test_rule_endpoint():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
+    if ROLE == 'scan':
+        scheduler_thread.join() # Headless scan worker, no HTTP server
+    else:
+        app.run(port=5000, debug=True)
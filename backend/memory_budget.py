@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+# Upper bound for all per-monitor in-memory state (motion references, caches, ...). 0 = unlimited.
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", 128))
+
+
+class MemoryBudget:
+    """
+    Byte accounting for per-monitor in-memory state, by category.
+
+    Owners register a category with an evict callback, then touch() entries as they use them.
+    When the total (or a category's own limit) goes over budget the least recently used
+    entries are evicted through their owner's callback. forget() drops a key from every
+    category, e.g. when its monitor is deleted.
+    """
+
+    def __init__(self, limit_bytes=MEMORY_BUDGET_MB * 1024 * 1024):
+        self.limit_bytes = int(limit_bytes)
+        self._lock = threading.RLock()
+        self._lru = OrderedDict() # (category, key) -> nbytes, oldest first
+        self._categories = {}
+
+    def register(self, category, evict, limit_bytes=None):
+        with self._lock:
+            self._categories[category] = {
+                "evict": evict,
+                "limit_bytes": limit_bytes,
+                "bytes": 0,
+                "entries": 0,
+                "evictions": 0,
+            }
+
+    def touch(self, category, key, nbytes):
+        """Records that an entry was used (and its current size); may evict older entries."""
+        with self._lock:
+            cat = self._categories[category]
+            old = self._lru.pop((category, key), None)
+            if old is None:
+                cat["entries"] += 1
+            else:
+                cat["bytes"] -= old
+            self._lru[(category, key)] = nbytes
+            cat["bytes"] += nbytes
+            self._enforce(protect=(category, key))
+
+    def discard(self, category, key):
+        """The owner already freed the entry; just stop counting it."""
+        with self._lock:
+            nbytes = self._lru.pop((category, key), None)
+            if nbytes is not None:
+                cat = self._categories[category]
+                cat["bytes"] -= nbytes
+                cat["entries"] -= 1
+
+    def evict(self, category, key):
+        """Frees the entry through its owner, tracked or not."""
+        with self._lock:
+            self.discard(category, key)
+            evict = self._categories[category]["evict"]
+        evict(key)
+
+    def forget(self, key):
+        """Drops `key` from every category (monitor deleted)."""
+        with self._lock:
+            categories = list(self._categories)
+        for category in categories:
+            self.evict(category, key)
+
+    def retain(self, category, keys, live_keys):
+        """Evicts entries of `category` among `keys` that are no longer in `live_keys`."""
+        for key in keys:
+            if key not in live_keys:
+                self.evict(category, key)
+
+    def _total(self):
+        return sum(c["bytes"] for c in self._categories.values())
+
+    def _enforce(self, protect):
+        """Evicts least recently used entries until the total and `protect`'s category fit again."""
+        category = protect[0]
+        cat = self._categories[category]
+        for victim in list(self._lru):
+            total_over = bool(self.limit_bytes) and self._total() > self.limit_bytes
+            category_over = bool(cat["limit_bytes"]) and cat["bytes"] > cat["limit_bytes"]
+            if not (total_over or category_over):
+                return
+            if victim == protect or (not total_over and victim[0] != category):
+                continue
+            victim_category, victim_key = victim
+            self.discard(victim_category, victim_key)
+            self._categories[victim_category]["evictions"] += 1
+            self._categories[victim_category]["evict"](victim_key)
+
+    def usage(self):
+        with self._lock:
+            return {
+                "limit_bytes": self.limit_bytes,
+                "total_bytes": self._total(),
+                "categories": {
+                    name: {k: v for k, v in cat.items() if k != "evict"}
+                    for name, cat in self._categories.items()
+                },
+            }
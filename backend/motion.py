@@ -0,0 +1,373 @@
+import os
+import time
+import threading
+
+from imaging import THUMB_SIZE
+import storage
+
+# --- CONFIGURATION ---
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", 0.02)) # fraction of pixels that must change
+PIXEL_DELTA = int(os.getenv("MOTION_PIXEL_DELTA", 25))        # intensity change that counts (filters lighting noise)
+INITIAL_SLOTS = int(os.getenv("MOTION_INITIAL_SLOTS", 64))
+
+
+class MotionEngine:
+    """
+    Motion references for every monitor in one preallocated (N, H, W) uint8 array.
+    compare() diffs each camera against its reference straight into a reusable batch buffer,
+    then thresholds and counts the whole batch in one pass each.
+    Slots are recycled on remove() and the array doubles when full, so adding monitors
+    doesn't reallocate every time.
+    """
+
+    def __init__(self, capacity=INITIAL_SLOTS, shape=THUMB_SIZE):
+        self.shape = (shape[1], shape[0]) # cv2 sizes are (w, h), arrays are (h, w)
+        self.capacity = max(1, capacity)
+        self._refs = None  # allocated on first use, keeps numpy out of API-only processes
+        self._ref_views = [] # self._refs[slot] for every slot, built once instead of per compare()
+        self._valid = None
+        self._diff = None    # compare() scratch, (batch, H, W), grows to the largest batch seen
+        self._diff_views = []
+        self._slots = {}
+        self._free = []
+        self._lock = threading.RLock()
+
+    # --- storage ---
+    def _allocate(self, capacity):
+        import numpy as np
+        return np.zeros((capacity, *self.shape), np.uint8), np.zeros(capacity, bool)
+
+    def _ensure(self):
+        if self._refs is None:
+            self._refs, self._valid = self._allocate(self.capacity)
+            self._ref_views = list(self._refs)
+            self._free = list(range(self.capacity - 1, -1, -1))
+
+    def _scratch(self, size):
+        if self._diff is None or len(self._diff) < size:
+            import numpy as np
+            self._diff = np.empty((max(size, 2 * len(self._diff_views)), *self.shape), np.uint8)
+            self._diff_views = list(self._diff)
+        return self._diff[:size]
+
+    def _grow(self):
+        old_capacity = self.capacity
+        old_refs, old_valid = self._refs, self._valid
+        self.capacity *= 2
+        self._refs, self._valid = self._allocate(self.capacity)
+        self._refs[:old_capacity] = old_refs
+        self._valid[:old_capacity] = old_valid
+        self._ref_views = list(self._refs)
+        self._free = list(range(self.capacity - 1, old_capacity - 1, -1)) + self._free
+
+    def _slot(self, monitor_id):
+        slot = self._slots.get(monitor_id)
+        if slot is not None:
+            return slot
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._slots[monitor_id] = slot
+        self._valid[slot] = False
+        return slot
+
+    def _slots_for(self, ids):
+        import numpy as np
+        get = self._slots.get
+        slots = [get(i) for i in ids]
+        if None in slots:
+            slots = [self._slot(i) if slot is None else slot for i, slot in zip(ids, slots)]
+        return np.array(slots, np.intp)
+
+    # --- public ---
+    def get(self, monitor_id):
+        with self._lock:
+            slot = self._slots.get(monitor_id)
+            if slot is None or self._refs is None or not self._valid[slot]:
+                return None
+            return self._refs[slot].copy()
+
+    def set(self, monitor_id, thumbnail):
+        with self._lock:
+            self._ensure()
+            slot = self._slot(monitor_id)
+            self._refs[slot] = thumbnail
+            self._valid[slot] = True
+
+    def remove(self, monitor_id):
+        with self._lock:
+            slot = self._slots.pop(monitor_id, None)
+            if slot is not None:
+                self._valid[slot] = False
+                self._free.append(slot)
+
+    def monitor_ids(self):
+        with self._lock:
+            return list(self._slots)
+
+    def nbytes(self):
+        with self._lock:
+            return 0 if self._refs is None else self._refs.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {"shared": False, "capacity": self.capacity, "monitors": len(self._slots), "bytes": self.nbytes()}
+
+    def _diff_into(self, thumbs, slots, out):
+        """|thumb - reference| of every item into out[i]; returns whether each slot had a reference."""
+        import cv2
+        refs = self._ref_views
+        for thumb, slot, dst in zip(thumbs, slots, out):
+            cv2.absdiff(thumb, refs[slot], dst)
+        return self._valid[slots]
+
+    def _store(self, slots, thumbs):
+        for slot, thumb in zip(slots, thumbs):
+            self._ref_views[slot][...] = thumb
+        self._valid[slots] = True
+
+    def compare(self, batch, threshold=MOTION_THRESHOLD, pixel_delta=PIXEL_DELTA):
+        """
+        batch: list of (monitor_id, thumbnail). threshold may be a scalar or one value per item.
+        Returns {monitor_id: (changed, change_ratio)}. Monitors without a reference count as
+        changed (first run). References are replaced only where change was detected.
+        """
+        import cv2
+        import numpy as np
+        if not batch:
+            return {}
+        h, w = self.shape
+        with self._lock:
+            self._ensure()
+            ids, thumbs = zip(*batch)
+            slots = self._slots_for(ids)
+            results = {}
+            if (slots < 0).any():
+                # No slot left for them (full shared store): without a reference they always count as changed
+                keep = np.flatnonzero(slots >= 0)
+                results = {ids[k]: (True, 1.0) for k in np.flatnonzero(slots < 0).tolist()}
+                threshold = np.broadcast_to(np.asarray(threshold, float), (len(batch),))[keep]
+                ids, thumbs, slots = [ids[k] for k in keep], [thumbs[k] for k in keep], slots[keep]
+                if not ids:
+                    return results
+            diff = self._scratch(len(ids))
+
+            # No stacking of the batch or gathering of its references: each camera is diffed in
+            # place (cv2.absdiff), then the batch is thresholded and counted in one pass each
+            valid = self._diff_into(thumbs, slots, self._diff_views)
+            flat = diff.reshape(-1, w)
+            cv2.threshold(flat, pixel_delta, 1, cv2.THRESH_BINARY, dst=flat)
+            counts = cv2.reduce(diff.reshape(len(ids), h * w), 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0]
+            ratios = counts / (h * w)
+            changed = ~valid | (ratios > np.asarray(threshold))
+
+            moved = np.flatnonzero(changed)
+            if len(moved):
+                self._store(slots[moved], [thumbs[k] for k in moved])
+        results.update((i, (bool(c), float(r))) for i, c, r in zip(ids, changed.tolist(), ratios.tolist()))
+        return results
+
+
+# --- CROSS-PROCESS STORE ---
+_MAGIC = b"CAMAIMOT"
+_HEADER_BYTES = 64
+_ID_BYTES = 64
+
+
+class SharedMotionEngine(MotionEngine):
+    """
+    MotionEngine backed by an mmap'd file (put it on /dev/shm), so every gunicorn worker and
+    the scheduler read and write the same references without copies or pickling.
+
+    Layout: header | seq: uint64[N] | ids: S64[N] | refs: uint8[N, H, W]
+    Writers take an flock and bump a slot's seq to odd, write, then bump it back to even.
+    Readers never lock: they copy, re-read the seqs and retry any slot that changed (seqlock).
+    Capacity is fixed when the file is created (MOTION_SHARED_SLOTS). Monitors beyond it get no
+    slot: they keep working, they just always count as changed (no motion gating) until one frees up.
+    """
+
+    def __init__(self, path, capacity=None, shape=THUMB_SIZE):
+        super().__init__(capacity or int(os.getenv("MOTION_SHARED_SLOTS", 4096)), shape)
+        self.path = path
+        self._file = None
+        self._unslotted = set() # monitors the full store turned away
+
+    # --- storage ---
+    def _ensure(self):
+        if self._refs is not None:
+            return
+        import mmap
+        import numpy as np
+        h, w = self.shape
+        size = _HEADER_BYTES + self.capacity * (8 + _ID_BYTES + h * w)
+
+        self._file = open(self.path, "a+b")
+        with self._exclusive():
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() == 0:
+                header = np.zeros(_HEADER_BYTES, np.uint8)
+                header[:8] = np.frombuffer(_MAGIC, np.uint8)
+                header[8:20] = np.frombuffer(np.array([self.capacity, h, w], np.uint32).tobytes(), np.uint8)
+                self._file.write(header.tobytes())
+                self._file.truncate(size)
+                self._file.flush()
+            else:
+                self._file.seek(0)
+                head = self._file.read(20)
+                if head[:8] != _MAGIC:
+                    raise RuntimeError(f"{self.path} is not a motion store")
+                capacity, file_h, file_w = (int(v) for v in np.frombuffer(head[8:20], np.uint32))
+                if (file_h, file_w) != (h, w):
+                    raise RuntimeError(f"{self.path} holds {file_w}x{file_h} thumbnails, expected {w}x{h}")
+                # Adopt whatever capacity the first process created it with
+                self.capacity = capacity
+                size = _HEADER_BYTES + self.capacity * (8 + _ID_BYTES + h * w)
+
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        offset = _HEADER_BYTES
+        self._seq = np.ndarray((self.capacity,), np.uint64, self._mmap, offset)
+        offset += self.capacity * 8
+        self._ids = np.ndarray((self.capacity,), f"S{_ID_BYTES}", self._mmap, offset)
+        offset += self.capacity * _ID_BYTES
+        self._refs = np.ndarray((self.capacity, h, w), np.uint8, self._mmap, offset)
+        self._ref_views = list(self._refs)
+
+    def _exclusive(self):
+        """Cross-process writer lock (threads are already serialised by self._lock)."""
+        return storage.flocked(self._file)
+
+    def _find(self, monitor_id):
+        """Slot for monitor_id, or None. The local id->slot cache is checked against the shared index."""
+        key = monitor_id.encode()[:_ID_BYTES]
+        slot = self._slots.get(monitor_id)
+        if slot is not None and self._ids[slot] == key:
+            return slot
+        self._slots.pop(monitor_id, None)
+        hits = (self._ids == key).nonzero()[0]
+        if len(hits):
+            self._slots[monitor_id] = int(hits[0])
+            return int(hits[0])
+        return None
+
+    def _slot(self, monitor_id):
+        slot = self._find(monitor_id)
+        if slot is not None:
+            return slot
+        with self._exclusive():
+            slot = self._find(monitor_id) # another worker may have just claimed it
+            if slot is None:
+                free = (self._ids == b"").nonzero()[0]
+                if not len(free):
+                    if not self._unslotted:
+                        print(f"   [!] Motion store full ({self.capacity} slots), raise MOTION_SHARED_SLOTS; "
+                              f"monitors without a slot skip the motion gate")
+                    self._unslotted.add(monitor_id)
+                    return None
+                slot = int(free[0])
+                self._write(slot_ids=[slot], ids=[monitor_id.encode()[:_ID_BYTES]])
+                self._slots[monitor_id] = slot
+                self._unslotted.discard(monitor_id)
+        return slot
+
+    def _slots_for(self, ids):
+        """Slots for a batch: the local cache is checked against the shared index in one comparison."""
+        import numpy as np
+        keys = np.array([i.encode()[:_ID_BYTES] for i in ids], f"S{_ID_BYTES}")
+        get = self._slots.get
+        slots = np.array([get(i, 0) for i in ids], np.intp)
+        missing = np.array([i not in self._slots for i in ids], bool) | (self._ids[slots] != keys)
+        for k in np.flatnonzero(missing).tolist():
+            slot = self._slot(ids[k])
+            slots[k] = -1 if slot is None else slot
+        return slots
+
+    def _write(self, slot_ids, refs=None, ids=None):
+        """Seqlock write; caller holds the flock."""
+        import numpy as np
+        slots = np.asarray(slot_ids, np.intp)
+        self._seq[slots] += 1 # odd: readers will retry
+        if ids is not None:
+            self._ids[slots] = ids
+        if refs is not None:
+            for slot, ref in zip(slots.tolist(), refs):
+                self._ref_views[slot][...] = ref
+        self._seq[slots] += 1
+
+    def _read(self, slots):
+        """Consistent copy of refs[slots] (plus whether each has ever been written) without locking."""
+        import numpy as np
+        slots = np.asarray(slots, np.intp)
+        for _ in range(100):
+            before = self._seq[slots].copy()
+            refs = self._refs[slots]
+            after = self._seq[slots]
+            if np.all((before == after) & (before % 2 == 0)):
+                # seq 2 = id claimed, never written; anything higher carries a reference
+                return refs, before > 2
+            time.sleep(0)
+        raise RuntimeError("Motion store busy")
+
+    # --- public ---
+    def get(self, monitor_id):
+        with self._lock:
+            self._ensure()
+            slot = self._find(monitor_id)
+            if slot is None:
+                return None
+            refs, valid = self._read([slot])
+            return refs[0] if valid[0] else None
+
+    def set(self, monitor_id, thumbnail):
+        with self._lock:
+            self._ensure()
+            slot = self._slot(monitor_id)
+            if slot is None:
+                return
+            with self._exclusive():
+                self._write([slot], refs=[thumbnail])
+
+    def remove(self, monitor_id):
+        with self._lock:
+            self._ensure()
+            with self._exclusive():
+                slot = self._find(monitor_id)
+                if slot is not None:
+                    self._write([slot], ids=[b""])
+                    self._seq[slot] = 0
+            self._slots.pop(monitor_id, None)
+            self._unslotted.discard(monitor_id)
+
+    def monitor_ids(self):
+        with self._lock:
+            self._ensure()
+            return [i.decode() for i in self._ids if i]
+
+    def stats(self):
+        with self._lock:
+            self._ensure()
+            return {"shared": True, "capacity": self.capacity, "monitors": sum(1 for i in self._ids if i),
+                    "unslotted": len(self._unslotted), "bytes": self._refs.nbytes}
+
+    def _diff_into(self, thumbs, slots, out):
+        """Diffs against the shared references in place; slots a writer touched meanwhile are redone (seqlock)."""
+        import cv2
+        import numpy as np
+        refs = self._ref_views
+        pending = np.arange(len(slots))
+        valid = np.zeros(len(slots), bool)
+        for _ in range(100):
+            before = self._seq[slots[pending]].copy()
+            for k in pending.tolist():
+                cv2.absdiff(thumbs[k], refs[slots[k]], out[k])
+            clean = (before == self._seq[slots[pending]]) & (before % 2 == 0)
+            # seq 2 = id claimed, never written; anything higher carries a reference
+            valid[pending[clean]] = before[clean] > 2
+            pending = pending[~clean]
+            if not len(pending):
+                return valid
+            time.sleep(0)
+        raise RuntimeError("Motion store busy")
+
+    def _store(self, slots, thumbs):
+        with self._exclusive():
+            self._write(slots, refs=thumbs)
@@ -0,0 +1,221 @@
+import os
+import time
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+TRIGGER_CACHE_ENTRIES = int(os.getenv("TRIGGER_CACHE_ENTRIES", 256))
+TRIGGER_CACHE_TTL = float(os.getenv("TRIGGER_CACHE_TTL", 600)) # seconds
+
+
+def normalize_rule(rule):
+    """Rules that differ only in whitespace are the same rule."""
+    return " ".join((rule or "").split())
+
+def content_key(*parts):
+    """Content address for a request: parts are str, bytes or None."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b"\x00none"
+        elif isinstance(part, str):
+            part = part.encode()
+        # Length-prefixed so ("ab", "c") and ("a", "bc") don't collide
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(hashlib.sha256(part).digest() if len(part) > 64 else part)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """
+    Concurrent calls for the same key share one execution and its result (or exception).
+    With `fresh_for`, a result also answers calls arriving up to that many seconds after it
+    completed. None results are never shared after the fact.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.error = None
+
+    def __init__(self, fresh_for=0):
+        self.fresh_for = fresh_for
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._recent = {} # key -> (finished_at, value)
+
+    def do(self, key, fn, fresh=True):
+        """
+        Returns (value, source): "leader" if fn ran here, "attached" or "fresh" if another call's result was reused.
+        fresh=False only joins a call that is still running, never a finished result.
+        """
+        with self._lock:
+            now = time.time()
+            recent = self._recent.get(key)
+            if fresh and recent and now - recent[0] <= self.fresh_for:
+                return recent[1], "fresh"
+            self._recent = {k: v for k, v in self._recent.items() if now - v[0] <= self.fresh_for}
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, "attached"
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if self.fresh_for and call.error is None and call.value is not None:
+                    self._recent[key] = (time.time(), call.value)
+            call.done.set()
+        return call.value, "leader"
+
+    def join(self, key):
+        """
+        (value, "fresh" | "attached") from a recent or running call for key, without starting one;
+        None if there is neither. A running call that raises gives (None, "attached"). Blocks while it runs.
+        """
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent and time.time() - recent[0] <= self.fresh_for:
+                return recent[1], "fresh"
+            call = self._calls.get(key)
+        if call is None:
+            return None
+        call.done.wait()
+        return (call.value if call.error is None else None), "attached"
+
+    def remember(self, key, value):
+        """Records a result computed elsewhere (e.g. by an AsyncSingleFlight) as fresh for key."""
+        if self.fresh_for and value is not None:
+            with self._lock:
+                self._recent[key] = (time.time(), value)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: waiters await the leader's task instead of blocking a thread."""
+
+    def __init__(self, fresh_for=0):
+        self.fresh_for = fresh_for
+        self._calls = {}
+        self._recent = {}
+
+    async def do(self, key, fn):
+        now = time.time()
+        recent = self._recent.get(key)
+        if recent and now - recent[0] <= self.fresh_for:
+            return recent[1], "fresh"
+        self._recent = {k: v for k, v in self._recent.items() if now - v[0] <= self.fresh_for}
+        task = self._calls.get(key)
+        if task is not None:
+            # shield: a waiter that disconnects must not cancel everyone else's call
+            return await asyncio.shield(task), "attached"
+
+        task = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            self._calls.pop(key, None)
+        if self.fresh_for and value is not None:
+            self._recent[key] = (time.time(), value)
+        return value, "leader"
+
+
+class ResultCache:
+    """
+    LRU + TTL cache of analysis results by content key. get_or_compute() coalesces
+    concurrent misses for the same key so only one of them calls the model.
+    """
+
+    def __init__(self, max_entries=TRIGGER_CACHE_ENTRIES, ttl=TRIGGER_CACHE_TTL, on_store=None, on_drop=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_store = on_store # (key, nbytes) after every store, e.g. memory accounting
+        self.on_drop = on_drop   # (key) when the cache itself drops an entry (LRU or TTL)
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expired = entry[0] < time.time()
+            if expired:
+                del self._entries[key]
+                self.stats["expired"] += 1
+            else:
+                self._entries.move_to_end(key)
+        if expired:
+            if self.on_drop:
+                self.on_drop(key)
+            return None
+        return entry[1]
+
+    def put(self, key, value, expires_at=None):
+        if not self.max_entries:
+            return
+        dropped = []
+        with self._lock:
+            self._entries[key] = (expires_at or time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                dropped.append(self._entries.popitem(last=False)[0])
+                self.stats["evictions"] += 1
+        if self.on_drop:
+            for old in dropped:
+                self.on_drop(old)
+        if self.on_store:
+            self.on_store(key, len(json.dumps(value)))
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_compute(self, key, compute):
+        """Returns (value, cached). Exceptions are never cached."""
+        value = self.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value, True
+
+        def fill():
+            result = compute()
+            self.put(key, result)
+            return result
+
+        value, source = self._flight.do(key, fill)
+        shared = source != "leader"
+        self.stats["coalesced" if shared else "misses"] += 1
+        return value, shared
+
+    # --- warm restart ---
+    def dump(self):
+        now = time.time()
+        with self._lock:
+            return [[key, expires_at, value] for key, (expires_at, value) in self._entries.items() if expires_at > now]
+
+    def load(self, entries):
+        now = time.time()
+        live = [(key, expires_at, value) for key, expires_at, value in entries if expires_at > now]
+        for key, expires_at, value in live:
+            self.put(key, value, expires_at)
+        return len(live)
+
+    def usage(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl}
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from collections import deque
+
+# --- CONFIGURATION ---
+# Scans go to FAST_MODEL first and only escalate to STRONG_MODEL when the answer is doubtful.
+FAST_MODEL = os.getenv("FAST_MODEL", "gemini-3-flash-preview")
+STRONG_MODEL = os.getenv("STRONG_MODEL", "gemini-3-pro-preview")
+ROUTING_POLICY = os.getenv("ROUTING_POLICY", "tiered")
+ESCALATE_CONFIDENCE = float(os.getenv("ESCALATE_CONFIDENCE", 0.6)) # DETECTOR confidence below this escalates
+ESCALATE_ON = ("low_confidence", "not_ok", "malformed")
+
+# Per monitor: routing_policy, escalate_on (comma separated subset of ESCALATE_ON), confidence_threshold.
+# Malformed output always escalates (or raises on the last tier); escalate_on can't accept it.
+POLICIES = {
+    "tiered": (FAST_MODEL, STRONG_MODEL),
+    "fast": (FAST_MODEL,),
+    "strong": (STRONG_MODEL,),
+}
+
+_LATENCY_WINDOW = 500
+
+
+def normalize_escalate_on(value):
+    """'low_confidence,not_ok' / list -> list of known reasons. Raises ValueError on unknown ones."""
+    if value is None or value == "":
+        return None
+    reasons = [r.strip() for r in (value.split(",") if isinstance(value, str) else value) if r.strip()]
+    unknown = set(reasons) - set(ESCALATE_ON)
+    if unknown:
+        raise ValueError(f"unknown escalation reasons: {', '.join(sorted(unknown))}")
+    return reasons
+
+def escalation_reason(m, result, status):
+    """Why this tier's answer isn't good enough, or None to accept it."""
+    allowed = m.get('escalate_on') or ESCALATE_ON
+    if result is None:
+        return "malformed" # There is no answer to accept, whatever escalate_on says
+    if "low_confidence" in allowed and m.get('type') == 'DETECTOR':
+        threshold = float(m.get('confidence_threshold') or ESCALATE_CONFIDENCE)
+        confidences = [d.get('confidence') for d in result.get('detections', []) if isinstance(d, dict)]
+        confidences = [c for c in confidences if isinstance(c, (int, float))]
+        if confidences and min(confidences) < threshold:
+            return "low_confidence"
+    if "not_ok" in allowed and status != "OK":
+        return "not_ok"
+    return None
+
+
+class Router:
+    """Runs a scan through the monitor's model tiers and keeps per-tier latency and escalation stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.escalations = {reason: 0 for reason in ESCALATE_ON}
+        self.tiers = {}
+
+    def _tier(self, model):
+        if model not in self.tiers:
+            self.tiers[model] = {"calls": 0, "errors": 0, "answered": 0, "latencies": deque(maxlen=_LATENCY_WINDOW)}
+        return self.tiers[model]
+
+    def _record(self, model, seconds, error=False):
+        with self._lock:
+            tier = self._tier(model)
+            tier["calls"] += 1
+            tier["errors"] += int(error)
+            tier["latencies"].append(seconds)
+
+    def _models(self, m):
+        return POLICIES.get(m.get('routing_policy') or ROUTING_POLICY, POLICIES["tiered"])
+
+    def _settle(self, m, models, i, result, route, judge):
+        """Accepts the answer of tier i (returns True) or records why it escalates."""
+        model = models[i]
+        last = i == len(models) - 1
+        reason = None if last else escalation_reason(m, result, result is not None and judge(result))
+        if reason is None:
+            with self._lock:
+                self.scans += 1
+                self._tier(model)["answered"] += 1
+            route["model"] = model
+            return True
+        with self._lock:
+            self.escalations[reason] += 1
+        route["escalations"].append({"from": model, "reason": reason})
+        print(f"   [^] {model}: {reason} -> escalating to {models[i + 1]}")
+        return False
+
+    def _tiers(self, m, judge, route):
+        """
+        The tier loop for analyze()/analyze_async(), which only differ in how they call run(model):
+        yields each model to try and is sent back (result, error) for it. Returns the accepted result.
+        """
+        models = self._models(m)
+        for i, model in enumerate(models):
+            started = time.perf_counter()
+            result, error = yield model
+            self._record(model, time.perf_counter() - started, error=error is not None)
+            # Malformed output (ValueError) escalates like a bad answer, except from the last tier
+            if error is not None and (not isinstance(error, ValueError) or i == len(models) - 1):
+                raise error
+            if self._settle(m, models, i, result, route, judge):
+                return result
+
+    def analyze(self, m, run, judge):
+        """
+        run(model) -> parsed result (raises ValueError when the output is malformed)
+        judge(result) -> status string
+        Returns (result, route) where route records the model that answered and why it escalated.
+        The last tier's answer is final; a malformed one there raises.
+        """
+        route = {"model": None, "escalations": []}
+        tiers = self._tiers(m, judge, route)
+        model = next(tiers)
+        while True:
+            try:
+                outcome = run(model), None
+            except Exception as e:
+                outcome = None, e
+            try:
+                model = tiers.send(outcome)
+            except StopIteration as done:
+                return done.value, route
+
+    async def analyze_async(self, m, run, judge):
+        """analyze() for an async run(model)."""
+        route = {"model": None, "escalations": []}
+        tiers = self._tiers(m, judge, route)
+        model = next(tiers)
+        while True:
+            try:
+                outcome = await run(model), None
+            except Exception as e:
+                outcome = None, e
+            try:
+                model = tiers.send(outcome)
+            except StopIteration as done:
+                return done.value, route
+
+    def stats(self):
+        def percentile(values, q):
+            return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else None
+        with self._lock:
+            escalated = sum(self.escalations.values())
+            tiers = {}
+            for model, tier in self.tiers.items():
+                latencies = sorted(tier["latencies"])
+                tiers[model] = {
+                    "calls": tier["calls"],
+                    "errors": tier["errors"],
+                    "answered": tier["answered"],
+                    "latency_p50_ms": percentile(latencies, 0.5),
+                    "latency_p95_ms": percentile(latencies, 0.95),
+                }
+            return {
+                "scans": self.scans,
+                "escalations": dict(self.escalations),
+                "escalation_rate": round(escalated / self.scans, 4) if self.scans else 0.0,
+                "tiers": tiers,
+            }
@@ -0,0 +1,259 @@
+import os
+import json
+from functools import lru_cache
+from datetime import datetime, date, time as dtime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# --- CONFIGURATION ---
+# Per monitor (all optional, any combination):
+#   cron            "*/15 8-20 * * mon-fri" (minute hour day-of-month month day-of-week) or @hourly/@daily/...
+#   active_windows  [{"days": "mon-fri", "start": "08:00", "end": "20:00"}] or "mon-fri 08:00-20:00; sat 10:00-14:00"
+#                   (end before start = overnight window)
+#   blackout_dates  ["2026-12-25", "2026-12-24..2026-12-26"]
+#   timezone        IANA name the rules are written in (default SCHEDULE_TIMEZONE, else server local time)
+# A cron monitor runs at its fire times instead of every `interval` minutes.
+SCHEDULE_TIMEZONE = os.getenv("SCHEDULE_TIMEZONE", "")
+SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", 366)) # no allowed run within this = never runs
+FIELDS = ("cron", "active_windows", "blackout_dates", "timezone")
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+MACROS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * sun",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+_MAX_SKIPPED_FIRES = 100000
+
+
+# --- PARSING / VALIDATION ---
+def _cron_values(field, low, high, names=()):
+    values = set()
+    for part in field.lower().split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f"bad step in '{field}'")
+        if part == "*":
+            start, end = low, high
+        else:
+            bounds = [names.index(b) + low if b in names else int(b) for b in part.split("-")]
+            if len(bounds) > 2:
+                raise ValueError(f"bad range '{part}'")
+            start, end = bounds[0], bounds[-1] if len(bounds) == 2 or step == 1 else high
+        if not (low <= start <= high and low <= end <= high) or start > end:
+            raise ValueError(f"'{part}' is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+def parse_cron(expr):
+    """Cron expression -> (minutes, hours, days_of_month, months, weekdays, dom_any, dow_any), weekdays Mon=0."""
+    fields = MACROS.get(expr.strip().lower(), expr).split()
+    if len(fields) != 5:
+        raise ValueError("cron needs 5 fields: minute hour day-of-month month day-of-week")
+    minutes = _cron_values(fields[0], 0, 59)
+    hours = _cron_values(fields[1], 0, 23)
+    doms = _cron_values(fields[2], 1, 31)
+    months = _cron_values(fields[3], 1, 12, MONTHS)
+    # cron counts Sunday as 0 (or 7), Python as 6
+    weekdays = tuple(sorted({(d - 1) % 7 for d in _cron_values(fields[4], 0, 7, ("sun",) + DAYS)}))
+    return minutes, hours, doms, months, weekdays, fields[2] == "*", fields[4] == "*"
+
+def _days(spec):
+    if isinstance(spec, (list, tuple)): # the stored form: ["mon", "tue", ...]
+        spec = ",".join(str(d) for d in spec)
+    spec = str(spec or "*").strip().lower()
+    if spec in ("*", "daily", "all"):
+        return DAYS
+    days = set()
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        if first not in DAYS or (last and last not in DAYS):
+            raise ValueError(f"unknown day in '{part}' (use {', '.join(DAYS)})")
+        i, j = DAYS.index(first), DAYS.index(last or first)
+        while True: # ranges may wrap: fri-mon
+            days.add(DAYS[i])
+            if i == j:
+                break
+            i = (i + 1) % 7
+    return tuple(d for d in DAYS if d in days)
+
+def _clock(value):
+    return dtime.fromisoformat(value.strip()).strftime("%H:%M")
+
+def normalize_windows(value):
+    """List of dicts or "mon-fri 08:00-20:00; sat 10:00-14:00" -> [{"days": [...], "start", "end"}]."""
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            value = json.loads(value)
+        else:
+            windows = []
+            for part in filter(None, (p.strip() for p in value.split(";"))):
+                days, _, hours = part.rpartition(" ")
+                start, _, end = hours.partition("-")
+                windows.append({"days": days or "*", "start": start, "end": end})
+            value = windows
+    return [{"days": list(_days(w.get("days"))), "start": _clock(w["start"]), "end": _clock(w["end"])} for w in value]
+
+def normalize_blackouts(value):
+    """List or comma separated "YYYY-MM-DD" / "YYYY-MM-DD..YYYY-MM-DD" entries."""
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = json.loads(value) if value.strip().startswith("[") else value.split(",")
+    entries = []
+    for entry in (str(v).strip() for v in value):
+        first, _, last = entry.partition("..")
+        start, end = date.fromisoformat(first), date.fromisoformat(last or first)
+        if end < start:
+            raise ValueError(f"blackout '{entry}' ends before it starts")
+        entries.append(f"{start}..{end}" if last else str(start))
+    return entries
+
+def normalize(data):
+    """The schedule fields present in `data`, normalized for storage. Raises ValueError."""
+    fields = {}
+    try:
+        if "cron" in data:
+            fields["cron"] = " ".join(str(data["cron"] or "").split()) or None
+            if fields["cron"]:
+                parse_cron(fields["cron"])
+        if "active_windows" in data:
+            fields["active_windows"] = normalize_windows(data["active_windows"])
+        if "blackout_dates" in data:
+            fields["blackout_dates"] = normalize_blackouts(data["blackout_dates"])
+        if "timezone" in data:
+            fields["timezone"] = data["timezone"] or None
+            if fields["timezone"]:
+                ZoneInfo(fields["timezone"])
+    except ZoneInfoNotFoundError:
+        raise ValueError(f"unknown timezone '{data['timezone']}'")
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"malformed schedule: {e}")
+    return fields
+
+
+# --- EVALUATION ---
+# Monitors are plain dicts; everything below works on a hashable digest of their rules so plans can be memoized
+def rules_of(m):
+    windows = tuple((tuple(DAYS.index(d) for d in w["days"]), w["start"], w["end"]) for w in m.get("active_windows") or [])
+    blackouts = []
+    for entry in m.get("blackout_dates") or []:
+        first, _, last = entry.partition("..")
+        blackouts.append((date.fromisoformat(first), date.fromisoformat(last or first)))
+    return m.get("cron") or None, windows, tuple(blackouts), m.get("timezone") or SCHEDULE_TIMEZONE or None
+
+def is_restricted(m):
+    return any(m.get(field) for field in ("cron", "active_windows", "blackout_dates"))
+
+def _zone(rules):
+    return ZoneInfo(rules[3]) if rules[3] else None
+
+def _local(when, tz):
+    """Naive server-local datetime -> aware datetime in the rules' zone."""
+    return when.astimezone(tz)
+
+def _server(when):
+    return when.astimezone().replace(tzinfo=None)
+
+def _minutes(clock):
+    h, m = clock.split(":")
+    return int(h) * 60 + int(m)
+
+def _allowed(rules, local):
+    _, windows, blackouts, _ = rules
+    if any(start <= local.date() <= end for start, end in blackouts):
+        return False
+    if not windows:
+        return True
+    now = local.hour * 60 + local.minute
+    day, yesterday = local.weekday(), (local.weekday() - 1) % 7
+    for days, start, end in windows:
+        start, end = _minutes(start), _minutes(end)
+        if start < end:
+            if day in days and start <= now < end:
+                return True
+        elif (day in days and now >= start) or (yesterday in days and now < end):
+            return True # overnight (or all-day when start == end)
+    return False
+
+def _next_allowed(rules, local):
+    """First aware instant >= local when scanning is allowed, or None within the horizon."""
+    if _allowed(rules, local):
+        return local
+    tz = local.tzinfo
+    for offset in range(SCHEDULE_HORIZON_DAYS + 1):
+        day = local.date() + timedelta(days=offset)
+        # Scanning can only become allowed at midnight (blackout ends) or when a window opens
+        starts = {dtime(0, 0)} | {dtime.fromisoformat(start) for _, start, _ in rules[1]}
+        for start in sorted(starts):
+            candidate = datetime.combine(day, start, tz)
+            if candidate > local and _allowed(rules, candidate):
+                return candidate
+    return None
+
+def _fires(cron, after):
+    """Cron fire times strictly after the aware datetime `after`, in order, up to the horizon."""
+    minutes, hours, doms, months, weekdays, dom_any, dow_any = cron
+    for offset in range(SCHEDULE_HORIZON_DAYS + 1):
+        day = after.date() + timedelta(days=offset)
+        if day.month not in months:
+            continue
+        dom_ok, dow_ok = day.day in doms, day.weekday() in weekdays
+        # Classic cron: when both day fields are restricted, either one matching is enough
+        matches = (dom_ok or dow_ok) if not (dom_any or dow_any) else (dom_ok and dow_ok)
+        if not matches:
+            continue
+        for hour in hours:
+            if offset == 0 and hour < after.hour:
+                continue
+            for minute in minutes:
+                candidate = datetime.combine(day, dtime(hour, minute), after.tzinfo)
+                if candidate > after:
+                    yield candidate
+
+@lru_cache(maxsize=4096)
+def _plan_interval(rules, candidate, interval_minutes):
+    tz = _zone(rules)
+    local = _local(candidate, tz)
+    allowed_at = _next_allowed(rules, local)
+    if allowed_at is None:
+        return None, 0
+    skipped = int((allowed_at - local).total_seconds() // (interval_minutes * 60)) if interval_minutes > 0 else 0
+    return _server(allowed_at), skipped
+
+@lru_cache(maxsize=4096)
+def _plan_cron(rules, anchor):
+    tz = _zone(rules)
+    skipped = 0
+    for fire in _fires(parse_cron(rules[0]), _local(anchor, tz)):
+        if _allowed(rules, fire):
+            return _server(fire), skipped
+        skipped += 1
+        if skipped > _MAX_SKIPPED_FIRES:
+            break
+    return None, skipped
+
+def plan(m, candidate, interval_minutes, anchor=None):
+    """
+    When monitor m actually runs and how many scans its rules skip on the way: (datetime or None, skipped).
+    Interval monitors: `candidate` is when the interval says it is due; the run moves to the next allowed instant.
+    Cron monitors: the first allowed fire after `anchor` (its last check). Datetimes are naive server-local.
+    """
+    rules = rules_of(m)
+    if rules[0]:
+        return _plan_cron(rules, anchor or candidate)
+    if not (rules[1] or rules[2]):
+        return candidate, 0
+    return _plan_interval(rules, candidate, interval_minutes)
+
+def allowed(m, when):
+    rules = rules_of(m)
+    return _allowed(rules, _local(when, _zone(rules)))
@@ -0,0 +1,154 @@
+import os
+import time
+import socket
+import sqlite3
+import hashlib
+import bisect
+import threading
+
+# --- CONFIGURATION ---
+# Shared membership store. Unset = single node, this process owns every monitor.
+CLUSTER_STORE = os.getenv("CLUSTER_STORE")
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+NODE_TTL = float(os.getenv("NODE_TTL", 60)) # seconds without heartbeat before a node is dropped
+VIRTUAL_NODES = int(os.getenv("VIRTUAL_NODES", 64))
+OBSERVER_REFRESH = float(os.getenv("OBSERVER_REFRESH", 5)) # seconds an API-only process reuses its view of the ring
+# Members heartbeat from their own thread, so a scheduler tick longer than NODE_TTL doesn't drop the node
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", NODE_TTL / 3))
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring. Adding/removing a node only moves ~1/N of the keys."""
+
+    def __init__(self, nodes=(), vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.nodes = sorted(set(nodes))
+        self._points = []
+        self._owners = []
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        for point, node in ring:
+            self._points.append(point)
+            self._owners.append(node)
+
+    def owner(self, key):
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[idx]
+
+
+class MembershipStore:
+    """
+    Node membership kept in a SQLite file. Point CLUSTER_STORE at a shared volume
+    (or swap this class for a networked store) to run several backend nodes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, last_heartbeat REAL NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def heartbeat(self, node_id):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO nodes (node_id, last_heartbeat) VALUES (?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET last_heartbeat = excluded.last_heartbeat",
+                (node_id, time.time()),
+            )
+
+    def leave(self, node_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def live_nodes(self, ttl=NODE_TTL, prune=True):
+        """Nodes that heartbeated within ttl; prune=False only reads (for processes outside the ring)."""
+        cutoff = time.time() - ttl
+        with self._connect() as db:
+            if prune:
+                db.execute("DELETE FROM nodes WHERE last_heartbeat < ?", (cutoff,))
+            rows = db.execute("SELECT node_id FROM nodes WHERE last_heartbeat >= ? ORDER BY node_id", (cutoff,)).fetchall()
+        return [r[0] for r in rows]
+
+
+class Shard:
+    """
+    This node's view of the cluster: which monitors it is responsible for scanning.
+    member=False is a read-only view for processes that don't scan (CAMAI_ROLE=api): it never
+    heartbeats or joins the ring, and re-reads membership on use every OBSERVER_REFRESH seconds.
+    """
+
+    def __init__(self, node_id=NODE_ID, store_path=CLUSTER_STORE, member=True):
+        self.node_id = node_id
+        self.member = member
+        self.store = MembershipStore(store_path) if store_path else None
+        self._lock = threading.Lock()
+        self._ring = HashRing([node_id] if member else [])
+        self._refreshed = 0.0
+        self._heartbeat = None
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def refresh(self):
+        """Heartbeats (members only) and rebuilds the ring if membership changed."""
+        if not self.enabled:
+            return
+        self._refreshed = time.time()
+        try:
+            if self.member:
+                self.store.heartbeat(self.node_id)
+            nodes = self.store.live_nodes(prune=self.member)
+        except sqlite3.Error as e:
+            print(f"   [!] Cluster store unavailable, keeping last ring: {e}")
+            return
+        if self.member and self.node_id not in nodes:
+            nodes.append(self.node_id)
+        with self._lock:
+            if sorted(nodes) != self._ring.nodes:
+                print(f"🔀 Cluster membership changed: {sorted(nodes)}")
+                self._ring = HashRing(nodes)
+
+    def start_heartbeat(self, interval=HEARTBEAT_INTERVAL):
+        """Refreshes every `interval` seconds on a daemon thread (members only), however long a tick takes."""
+        if not (self.enabled and self.member) or self._heartbeat is not None:
+            return
+        def beat():
+            while True:
+                self.refresh()
+                time.sleep(interval)
+        self._heartbeat = threading.Thread(target=beat, name="shard-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def leave(self):
+        if self.enabled and self.member:
+            self.store.leave(self.node_id)
+
+    def owner(self, monitor_id):
+        if self.enabled and not self.member and time.time() - self._refreshed >= OBSERVER_REFRESH:
+            self.refresh()
+        with self._lock:
+            return self._ring.owner(monitor_id)
+
+    def owns(self, monitor_id):
+        return not self.enabled or self.owner(monitor_id) == self.node_id
+
+    def stats(self, monitors=()):
+        owned = sum(1 for m in monitors if self.owns(m['id']))
+        with self._lock:
+            nodes = list(self._ring.nodes)
+        return {
+            "enabled": self.enabled,
+            "node_id": self.node_id,
+            "member": self.member,
+            "nodes": nodes,
+            "owned_monitors": owned,
+            "total_monitors": len(monitors),
+        }
@@ -0,0 +1,33 @@
+import os
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError: # Windows dev machines: single process, no file locking
+    fcntl = None
+
+
+@contextmanager
+def flocked(f):
+    """Exclusive cross-process lock on an open file for the duration of the block."""
+    if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        if fcntl: fcntl.flock(f, fcntl.LOCK_UN)
+
+@contextmanager
+def file_lock(path):
+    """Cross-process lock for read-modify-write of `path` (held on a "<path>.lock" side file)."""
+    with open(f"{path}.lock", "a") as lock_file, flocked(lock_file):
+        yield
+
+def atomic_write(path, data):
+    """
+    Replaces `path` with `data` (str or bytes) by write-then-rename, so readers in other
+    workers/nodes never see a half-written file and a crash mid-write leaves the old one.
+    The tmp name carries the pid: several processes may write the same file at once.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,33 @@
+"""
+Runs from backend/:  python -m pytest tests
+main.py reads its configuration at import, so every file it touches is pointed at a
+scratch directory (and the scheduler kept off) before any test imports it.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_scratch = tempfile.mkdtemp(prefix="camai-tests-")
+os.environ.update(
+    CAMAI_ROLE="api", MOTION_STORE="memory", WARM_STATE_FILE="off", GEMINI_API_KEY="test-key",
+    MONITORS_FILE=os.path.join(_scratch, "monitors.json"), LOGS_FILE=os.path.join(_scratch, "logs.json"),
+    DEAD_LETTERS_FILE=os.path.join(_scratch, "dead_letters.json"), USAGE_FILE=os.path.join(_scratch, "usage.json"),
+)
+
+
+@pytest.fixture
+def backend():
+    """main.py with an empty monitors.json."""
+    import main
+    if os.path.exists(main.MONITORS_FILE):
+        os.remove(main.MONITORS_FILE)
+    return main
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
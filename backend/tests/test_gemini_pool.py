@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+import pytest
+
+import gemini_pool
+from gemini_pool import GeminiPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from gemini_stub import StubGemini
+
+MODEL = "gemini-stub"
+
+
+@pytest.fixture
+def stub():
+    stub = StubGemini(latency=0, key_quota=2).start()
+    yield stub
+    stub.stop()
+
+def generate(pool):
+    return pool.call(lambda client: client.models.generate_content(model=MODEL, contents="ping")).text
+
+def test_calls_rotate_across_keys(stub):
+    pool = GeminiPool(["key-a", "key-b", "key-c"], base_url=stub.url)
+    for _ in range(6):
+        assert generate(pool)
+    assert stub.requests_by_key == {"key-a": 2, "key-b": 2, "key-c": 2}
+    assert stub.throttled == 0 and pool.failovers == 0
+
+def test_throttled_key_fails_over_and_rests(stub):
+    pool = GeminiPool(["key-a", "key-b"], base_url=stub.url)
+    stub._windows["key-a"] = (time.time(), 2) # key-a has spent its quota
+    assert generate(pool)
+    assert stub.throttled == 1 and pool.failovers == 1
+    key_a = pool.stats()["keys"][gemini_pool.label("key-a")]
+    assert key_a["state"] == "cooling_down" and key_a["throttled"] == 1
+    # The rest comes from the 429's RetryInfo (the window's remaining ~60s), not KEY_COOLDOWN
+    assert key_a["cooldown_remaining"] > gemini_pool.KEY_COOLDOWN
+    assert generate(pool) and stub.requests_by_key == {"key-a": 1, "key-b": 2} # the resting key is skipped
+
+def test_every_key_throttled_raises_the_429(stub):
+    pool = GeminiPool(["key-a"], base_url=stub.url)
+    generate(pool), generate(pool)
+    with pytest.raises(Exception) as error:
+        generate(pool)
+    assert gemini_pool.classify(error.value) == "throttled"
+
+def test_retry_delay_and_classification():
+    class Throttled(Exception):
+        code = 429
+        details = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "13s"}]}}
+    assert gemini_pool.retry_delay(Throttled()) == 13.0
+    assert gemini_pool.classify(Throttled()) == "throttled"
+    assert gemini_pool.classify(ValueError("bad request")) is None
+    assert gemini_pool.classify(ConnectionError()) == "unhealthy"
+
+
+class FakeClient:
+    def __init__(self, entry, failures):
+        self.entry, self.failures = entry, failures
+
+    def call(self):
+        if self.failures.get(self.entry):
+            self.failures[self.entry] -= 1
+            raise ConnectionError(f"{self.entry} down")
+        return self.entry
+
+def fake_pool(entries, failures):
+    return GeminiPool(entries, factory=lambda entry: FakeClient(entry, failures))
+
+def test_unhealthy_key_is_taken_out_after_repeated_failures(monkeypatch):
+    monkeypatch.setattr(gemini_pool, "KEY_FAILURE_THRESHOLD", 2)
+    pool = fake_pool(["k1", "k2"], {"k1": 10})
+    answers = [pool.call(lambda client: client.call()) for _ in range(4)]
+    assert answers == ["k2"] * 4
+    k1 = pool.stats()["keys"][gemini_pool.label("k1")]
+    assert k1["state"] == "cooling_down" and k1["errors"] == 2
+
+def test_request_errors_are_not_failed_over():
+    pool = GeminiPool(["k1", "k2"], factory=lambda entry: entry)
+    calls = []
+    def bad_request(client):
+        calls.append(client)
+        raise ValueError("invalid argument")
+    with pytest.raises(ValueError):
+        pool.call(bad_request)
+    assert len(calls) == 1 and pool.failovers == 0
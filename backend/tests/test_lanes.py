@@ -0,0 +1,79 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from lanes import LaneScheduler, INTERACTIVE, TRIGGERED, BACKGROUND
+
+
+def admission_order(scheduler, queued):
+    """Holds the only slot, queues `queued` lanes in order, then records the order they are admitted in."""
+    order, threads = [], []
+    hold = scheduler.slot(TRIGGERED) # charges neither of the lanes compared below
+    hold.__enter__()
+    for i, lane in enumerate(queued):
+        def run(lane=lane, i=i):
+            with scheduler.slot(lane):
+                order.append((lane, i))
+        threads.append(threading.Thread(target=run))
+        threads[-1].start()
+        while scheduler.stats()["lanes"][lane]["waiting"] < queued[:i + 1].count(lane):
+            time.sleep(0.001) # queue them in this exact order
+    hold.__exit__(None, None, None)
+    for thread in threads:
+        thread.join()
+    return order
+
+def test_runs_immediately_below_capacity():
+    scheduler = LaneScheduler(capacity=2)
+    with scheduler.slot(BACKGROUND), scheduler.slot(INTERACTIVE):
+        assert scheduler.stats()["in_flight"] == 2
+    assert scheduler.stats()["lanes"][BACKGROUND]["queued"] == 0
+
+def test_freed_slots_follow_the_lane_weights():
+    scheduler = LaneScheduler(capacity=1, weights={INTERACTIVE: 3, TRIGGERED: 1, BACKGROUND: 1}, max_wait=60)
+    order = admission_order(scheduler, [BACKGROUND] * 4 + [INTERACTIVE] * 6)
+    lanes = [lane for lane, _ in order]
+    # Interactive gets 3 of every 4 slots while both wait, in FIFO order within each lane
+    assert lanes[:8].count(INTERACTIVE) == 6
+    assert [i for lane, i in order if lane == BACKGROUND] == [0, 1, 2, 3]
+    assert [i for lane, i in order if lane == INTERACTIVE] == [4, 5, 6, 7, 8, 9]
+
+def test_a_long_wait_is_promoted_past_the_weights():
+    scheduler = LaneScheduler(capacity=1, weights={INTERACTIVE: 100, TRIGGERED: 1, BACKGROUND: 1}, max_wait=0)
+    order = admission_order(scheduler, [BACKGROUND, INTERACTIVE, INTERACTIVE])
+    assert order[0][0] == BACKGROUND # waited longest: starvation protection wins
+    assert scheduler.stats()["lanes"][BACKGROUND]["promoted"] == 1
+
+def test_unlimited_capacity_never_queues():
+    scheduler = LaneScheduler(capacity=0)
+    slots = [scheduler.slot(BACKGROUND) for _ in range(50)]
+    for slot in slots:
+        slot.__enter__()
+    assert scheduler.stats()["in_flight"] == 50
+    for slot in slots:
+        slot.__exit__(None, None, None)
+
+def test_unknown_lane_is_rejected():
+    with pytest.raises(ValueError):
+        with LaneScheduler(capacity=1).slot("bulk"):
+            pass
+
+def test_coroutines_share_capacity_and_cancelled_waiters_leave_the_queue():
+    scheduler = LaneScheduler(capacity=1)
+
+    async def main():
+        async with scheduler.async_slot(TRIGGERED):
+            waiter = asyncio.ensure_future(scheduler.async_slot(INTERACTIVE).__aenter__())
+            await asyncio.sleep(0.01)
+            assert scheduler.stats()["lanes"][INTERACTIVE]["waiting"] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.stats()["lanes"][INTERACTIVE]["waiting"] == 0
+        assert scheduler.stats()["in_flight"] == 0
+        async with scheduler.async_slot(INTERACTIVE):
+            assert scheduler.stats()["in_flight"] == 1
+
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+import threading
+
+import numpy as np
+import pytest
+
+import motion
+from imaging import THUMB_SIZE
+
+BLACK = np.zeros(THUMB_SIZE, np.uint8)
+WHITE = np.full(THUMB_SIZE, 255, np.uint8)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / "motion.bin")
+
+def test_first_frame_counts_as_changed_then_only_real_change(store):
+    engine = motion.SharedMotionEngine(store, capacity=4)
+    assert engine.compare([("a", BLACK)])["a"][0]
+    assert engine.compare([("a", BLACK)]) == {"a": (False, 0.0)}
+    assert engine.compare([("a", WHITE)]) == {"a": (True, 1.0)}
+
+def test_workers_see_each_others_references(store):
+    scheduler, worker = motion.SharedMotionEngine(store, capacity=4), motion.SharedMotionEngine(store, capacity=4)
+    scheduler.compare([("a", WHITE)])
+    assert worker.compare([("a", WHITE)]) == {"a": (False, 0.0)}
+    worker.remove("a")
+    assert scheduler.get("a") is None and scheduler.monitor_ids() == []
+
+def test_full_store_degrades_to_always_changed(store):
+    engine = motion.SharedMotionEngine(store, capacity=2)
+    engine.compare([("a", BLACK), ("b", BLACK)])
+    results = engine.compare([("a", BLACK), ("b", BLACK), ("c", BLACK)])
+    assert results["a"] == results["b"] == (False, 0.0)
+    assert results["c"] == (True, 1.0) # no slot: no gate, but no crash either
+    engine.set("c", BLACK) # ignored
+    assert engine.stats()["unslotted"] == 1
+
+    engine.remove("a")
+    engine.compare([("c", BLACK)])
+    assert engine.compare([("c", BLACK)]) == {"c": (False, 0.0)} # got the freed slot
+    assert engine.stats()["unslotted"] == 0
+
+def test_reader_redoes_a_slot_written_during_its_diff(store, monkeypatch):
+    engine = motion.SharedMotionEngine(store, capacity=4)
+    engine.compare([("a", BLACK)])
+    slot = engine._find("a")
+    engine._seq[slot] += 1 # another process is mid-write...
+
+    def writer_finishes(_):
+        engine._ref_views[slot][...] = WHITE
+        engine._seq[slot] += 1
+    monkeypatch.setattr(motion.time, "sleep", writer_finishes)
+
+    assert engine.compare([("a", WHITE)]) == {"a": (False, 0.0)} # diffed against the finished write
+
+def test_reader_gives_up_on_a_stuck_writer(store):
+    engine = motion.SharedMotionEngine(store, capacity=4)
+    engine.set("a", BLACK)
+    engine._seq[engine._find("a")] += 1
+    with pytest.raises(RuntimeError, match="busy"):
+        engine.get("a")
+
+def test_concurrent_reads_never_see_a_torn_reference(store):
+    writer, reader = motion.SharedMotionEngine(store, capacity=4), motion.SharedMotionEngine(store, capacity=4)
+    writer.set("a", BLACK)
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            writer.set("a", WHITE)
+            writer.set("a", BLACK)
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        for _ in range(2000):
+            try:
+                ref = reader.get("a")
+            except RuntimeError:
+                continue # a reader may give up, never return a mix
+            assert ref.min() == ref.max()
+    finally:
+        stop.set()
+        thread.join()
+
+def test_in_memory_engine_matches(store):
+    engine = motion.MotionEngine(capacity=1)
+    engine.compare([("a", BLACK), ("b", BLACK)]) # grows past its initial capacity
+    assert engine.compare([("a", BLACK), ("b", WHITE)]) == {"a": (False, 0.0), "b": (True, 1.0)}
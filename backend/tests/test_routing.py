@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import routing
+from routing import FAST_MODEL, STRONG_MODEL
+
+MONITOR = {"id": "m", "type": "PROCESS", "routing_policy": "tiered"}
+judge = lambda result: "ALERT" if result.get("anomalies_detected") else "OK"
+
+
+def scripted(answers):
+    """run(model) returning (or raising) the next scripted answer; records the models asked."""
+    asked = []
+    def run(model):
+        asked.append(model)
+        answer = answers[len(asked) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    return run, asked
+
+def analyze(router, run, sync):
+    if sync:
+        return router.analyze(MONITOR, run, judge)
+    async def arun(model):
+        return run(model)
+    return asyncio.run(router.analyze_async(MONITOR, arun, judge))
+
+both = pytest.mark.parametrize("sync", [True, False], ids=["sync", "async"])
+
+
+@both
+def test_ok_answer_stays_on_the_fast_tier(sync):
+    router = routing.Router()
+    run, asked = scripted([{"anomalies_detected": False}])
+    result, route = analyze(router, run, sync)
+    assert asked == [FAST_MODEL] and route == {"model": FAST_MODEL, "escalations": []}
+    assert router.stats()["tiers"][FAST_MODEL]["answered"] == 1
+
+@both
+def test_not_ok_escalates_and_the_last_tier_is_final(sync):
+    router = routing.Router()
+    run, asked = scripted([{"anomalies_detected": True}, {"anomalies_detected": True}])
+    result, route = analyze(router, run, sync)
+    assert asked == [FAST_MODEL, STRONG_MODEL]
+    assert route["model"] == STRONG_MODEL and route["escalations"] == [{"from": FAST_MODEL, "reason": "not_ok"}]
+
+@both
+def test_malformed_output_escalates_and_raises_from_the_last_tier(sync):
+    router = routing.Router()
+    run, _ = scripted([ValueError("bad json"), {"anomalies_detected": False}])
+    result, route = analyze(router, run, sync)
+    assert route["escalations"][0]["reason"] == "malformed"
+    assert router.stats()["tiers"][FAST_MODEL]["errors"] == 1
+
+    run, _ = scripted([ValueError("bad json"), ValueError("still bad")])
+    with pytest.raises(ValueError, match="still bad"):
+        analyze(router, run, sync)
+
+@both
+def test_api_errors_are_not_escalated(sync):
+    router = routing.Router()
+    run, asked = scripted([ConnectionError("down")])
+    with pytest.raises(ConnectionError):
+        analyze(router, run, sync)
+    assert asked == [FAST_MODEL]
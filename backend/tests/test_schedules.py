@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+import schedules
+from schedules import parse_cron, normalize
+
+
+def monitor(**rules):
+    fields = normalize({"timezone": None, **rules})
+    return {"id": "m", **fields}
+
+def test_cron_fields_and_macros():
+    minutes, hours, doms, months, weekdays, dom_any, dow_any = parse_cron("*/15 8-10 * jan,jul mon-fri")
+    assert minutes == (0, 15, 30, 45) and hours == (8, 9, 10)
+    assert months == (1, 7) and weekdays == (0, 1, 2, 3, 4) and dom_any and not dow_any
+    assert parse_cron("@daily") == parse_cron("0 0 * * *")
+    # Sunday is 0 or 7 in cron, 6 in Python
+    assert parse_cron("0 0 * * 0")[4] == parse_cron("0 0 * * 7")[4] == (6,)
+
+@pytest.mark.parametrize("expr", ["* * * *", "61 * * * *", "*/0 * * * *", "0 0 * * funday"])
+def test_bad_cron_is_rejected(expr):
+    with pytest.raises(ValueError):
+        parse_cron(expr)
+
+def test_cron_runs_at_the_next_fire_time():
+    m = monitor(cron="*/15 8-20 * * mon-fri")
+    friday_evening = datetime(2026, 10, 16, 20, 50)
+    assert schedules.plan(m, None, 1, anchor=friday_evening) == (datetime(2026, 10, 19, 8, 0), 0)
+    assert schedules.plan(m, None, 1, anchor=datetime(2026, 10, 19, 8, 1)) == (datetime(2026, 10, 19, 8, 15), 0)
+
+def test_cron_fires_in_a_blackout_are_skipped_and_counted():
+    m = monitor(cron="0 12 * * *", blackout_dates="2026-12-24..2026-12-26")
+    when, skipped = schedules.plan(m, None, 1, anchor=datetime(2026, 12, 23, 13, 0))
+    assert when == datetime(2026, 12, 27, 12, 0) and skipped == 3
+
+def test_window_forms_normalize_to_the_same_rules():
+    text = monitor(active_windows="mon-fri 08:00-20:00; sat 22:00-02:00")
+    listed = monitor(active_windows=[{"days": "mon-fri", "start": "08:00", "end": "20:00"},
+                                     {"days": "sat", "start": "22:00", "end": "02:00"}])
+    stored = monitor(active_windows=text["active_windows"])
+    assert text == listed == stored
+    assert text["active_windows"][0]["days"] == ["mon", "tue", "wed", "thu", "fri"]
+
+def test_day_ranges_wrap():
+    assert monitor(active_windows="fri-mon 00:00-01:00")["active_windows"][0]["days"] == ["mon", "fri", "sat", "sun"]
+
+def test_interval_scans_wait_for_the_next_window():
+    m = monitor(active_windows="mon-fri 08:00-20:00")
+    saturday = datetime(2026, 10, 17, 9, 0)
+    when, skipped = schedules.plan(m, saturday, 60)
+    assert when == datetime(2026, 10, 19, 8, 0)
+    assert skipped == 47 # hourly scans between Saturday 09:00 and Monday 08:00
+    inside = datetime(2026, 10, 19, 9, 30)
+    assert schedules.plan(m, inside, 60) == (inside, 0)
+
+def test_overnight_window_spans_midnight():
+    m = monitor(active_windows="sat 22:00-02:00")
+    assert schedules.allowed(m, datetime(2026, 10, 17, 23, 0))
+    assert schedules.allowed(m, datetime(2026, 10, 18, 1, 30)) # Sunday morning, Saturday's window
+    assert not schedules.allowed(m, datetime(2026, 10, 18, 23, 0))
+
+def test_unrestricted_monitor_runs_when_due():
+    due = datetime(2026, 10, 17, 9, 0)
+    assert not schedules.is_restricted({"id": "m"})
+    assert schedules.plan({"id": "m"}, due, 5) == (due, 0)
+
+def test_blackouts_must_not_end_before_they_start():
+    with pytest.raises(ValueError):
+        normalize({"blackout_dates": "2026-12-26..2026-12-24"})
@@ -0,0 +1,63 @@
+import time
+
+from sharding import HashRing, MembershipStore, Shard
+
+KEYS = [f"monitor-{i}" for i in range(5000)]
+
+
+def assignment(nodes):
+    ring = HashRing(nodes)
+    return {key: ring.owner(key) for key in KEYS}
+
+def test_every_node_gets_a_fair_share():
+    owners = list(assignment(["a", "b", "c", "d"]).values())
+    for node in "abcd":
+        assert 0.15 < owners.count(node) / len(KEYS) < 0.35
+
+def test_join_only_moves_keys_to_the_new_node():
+    before, after = assignment(["a", "b", "c"]), assignment(["a", "b", "c", "d"])
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == "d" for key in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35 # ~1/4, not a reshuffle
+
+def test_leave_only_moves_the_leaving_nodes_keys():
+    before, after = assignment(["a", "b", "c", "d"]), assignment(["a", "b", "c"])
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert sorted(moved) == sorted(key for key in KEYS if before[key] == "d")
+
+def test_empty_ring_owns_nothing():
+    assert HashRing([]).owner("x") is None
+
+
+def test_members_share_the_fleet_and_observers_do_not_join(tmp_path):
+    store = str(tmp_path / "cluster.db")
+    a, b = Shard("a", store), Shard("b", store)
+    api = Shard("api", store, member=False)
+    for shard in (a, b, a, api):
+        shard.refresh()
+
+    assert sorted(MembershipStore(store).live_nodes()) == ["a", "b"]
+    for key in KEYS[:200]:
+        assert a.owns(key) != b.owns(key)
+        assert api.owner(key) == a.owner(key)
+    api.leave()
+    assert sorted(MembershipStore(store).live_nodes()) == ["a", "b"]
+
+def test_a_node_that_stops_heartbeating_is_dropped(tmp_path):
+    store = MembershipStore(str(tmp_path / "cluster.db"))
+    store.heartbeat("a")
+    store.heartbeat("b")
+    time.sleep(0.05)
+    store.heartbeat("b")
+    assert store.live_nodes(ttl=0.04) == ["b"]
+
+def test_heartbeat_thread_keeps_a_busy_node_alive(tmp_path):
+    store = str(tmp_path / "cluster.db")
+    shard = Shard("a", store)
+    shard.start_heartbeat(interval=0.02)
+    time.sleep(0.1) # no refresh() from a scheduler tick meanwhile
+    assert MembershipStore(store).live_nodes(ttl=0.05, prune=False) == ["a"]
+
+def test_without_a_store_this_node_owns_everything():
+    shard = Shard("solo", None)
+    assert not shard.enabled and all(shard.owns(key) for key in KEYS[:10])
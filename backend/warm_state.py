@@ -0,0 +1,82 @@
+import os
+import gzip
+import json
+import time
+import threading
+
+import storage
+
+# --- CONFIGURATION ---
+# Local checkpoint of the scheduler's warm state, restored on startup. "off" disables it.
+WARM_STATE_FILE = os.getenv("WARM_STATE_FILE", "warm_state.json.gz")
+WARM_STATE_INTERVAL = float(os.getenv("WARM_STATE_INTERVAL", 60))   # seconds between checkpoints
+WARM_STATE_MAX_AGE = float(os.getenv("WARM_STATE_MAX_AGE", 86400))  # older snapshots are ignored
+
+_VERSION = 1
+
+
+class WarmState:
+    """
+    Periodic checkpoint of in-memory scheduler state to one gzip'd JSON file.
+
+    Each owner registers a section with a dump() returning JSON-able data and a
+    load(data) that merges it back in. checkpoint() is cheap to call every tick;
+    it only writes once WARM_STATE_INTERVAL has passed.
+    """
+
+    def __init__(self, path=WARM_STATE_FILE, interval=WARM_STATE_INTERVAL, max_age=WARM_STATE_MAX_AGE):
+        self.path = None if path == "off" else path
+        self.interval = interval
+        self.max_age = max_age
+        self._sections = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"checkpoints": 0, "last_checkpoint": None, "last_bytes": 0, "restored": {}}
+
+    def register(self, name, dump, load):
+        self._sections[name] = (dump, load)
+
+    def checkpoint(self, force=False):
+        if not self.path or not self._sections:
+            return
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_write < self.interval:
+                return
+            self._last_write = now
+            snapshot = {"version": _VERSION, "saved_at": now, "sections": {}}
+            for name, (dump, _) in self._sections.items():
+                try:
+                    snapshot["sections"][name] = dump()
+                except Exception as e:
+                    print(f"   [!] Warm state: could not dump {name}: {e}")
+
+            payload = gzip.compress(json.dumps(snapshot).encode(), compresslevel=6)
+            storage.atomic_write(self.path, payload)
+            self.stats.update(checkpoints=self.stats["checkpoints"] + 1, last_checkpoint=now, last_bytes=len(payload))
+
+    def restore(self):
+        """Loads the last snapshot into every registered section. Returns False if there was none to use."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = json.loads(gzip.decompress(f.read()))
+        except Exception as e:
+            print(f"   [!] Warm state unreadable, starting cold: {e}")
+            return False
+        age = time.time() - snapshot.get("saved_at", 0)
+        if snapshot.get("version") != _VERSION or age > self.max_age:
+            print(f"--- Warm state ignored (version {snapshot.get('version')}, {age:.0f}s old) ---")
+            return False
+
+        for name, (_, load) in self._sections.items():
+            data = snapshot["sections"].get(name)
+            if data is None:
+                continue
+            try:
+                self.stats["restored"][name] = load(data)
+            except Exception as e:
+                print(f"   [!] Warm state: could not restore {name}: {e}")
+        print(f"--- Warm state restored ({age:.0f}s old): {self.stats['restored']} ---")
+        return True
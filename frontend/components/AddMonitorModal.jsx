@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import { ENDPOINTS } from '../config';
+import { readSSE } from '../sse';
 
 const AddMonitorModal = ({ isOpen, onClose }) => {
   const [formData, setFormData] = useState({
@@ -30,23 +31,32 @@ const AddMonitorModal = ({ isOpen, onClose }) => {
     const data = new FormData();
     data.append('mode', formData.mode);
     data.append('rule', formData.rule);
-    data.append('test_image', selectedFile);
+    data.append('image', selectedFile);
 
     try {
-      // 2. Hit the Backend API
-      const response = await fetch(`${ENDPOINTS.TRIGGER}`, {
+      // 2. Hit the Backend API, streamed (SSE): show the model's partial output while it is still generating
+      const response = await fetch(`${ENDPOINTS.TRIGGER_STREAM}`, {
         method: 'POST',
         body: data,
       });
-
-      const result = await response.json();
-      
-      // 3. Handle Result
-      if (response.ok) {
-        setTestResult(result.gemini_response);
-      } else {
+      if (!response.ok || !response.body) {
+        const result = await response.json();
         alert("Error: " + result.error);
+        return;
       }
+
+      // 3. Handle Result
+      let partial = '';
+      await readSSE(response, (event, payload) => {
+        if (event === 'chunk') {
+          partial += payload.text;
+          setTestResult({ partial });
+        } else if (event === 'result') {
+          setTestResult(payload);
+        } else if (event === 'error') {
+          alert("Error: " + payload.error);
+        }
+      });
     } catch (error) {
       console.error("Connection failed", error);
       alert("Could not connect to Backend server (Is it running on port 5000?)");
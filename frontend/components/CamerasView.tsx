@@ -3,6 +3,7 @@ import { Monitor, MonitorType } from '../types';
 import { Plus, X, Upload, Check, Video, MoreHorizontal, FileUp, Trash2, Edit2, Download } from 'lucide-react';
 import { Link as LinkIcon, Copy } from 'lucide-react';
 import { ENDPOINTS } from '../config';
+import { readSSE } from '../sse';
 
 interface CamerasViewProps {
   monitors: Monitor[];
@@ -181,14 +182,25 @@ const handleDownloadBridge = (monitorId: string) => {
         formData.append('ideal_image', idealImageFile);
       }
 
-      // Point this to Python Backend URL
-      const response = await fetch(`${ENDPOINTS.TRIGGER}`, {
+      // Streamed (SSE): show the model's partial output while it is still generating
+      const response = await fetch(`${ENDPOINTS.TRIGGER_STREAM}`, {
         method: 'POST',
         body: formData,
       });
+      if (!response.ok || !response.body) {
+        setTestResult(await response.json());
+        return;
+      }
 
-      const data = await response.json();
-      setTestResult(data);
+      let partial = '';
+      await readSSE(response, (event, data) => {
+        if (event === 'chunk') {
+          partial += data.text;
+          setTestResult({ partial });
+        } else if (event === 'result' || event === 'error') {
+          setTestResult(data);
+        }
+      });
     } catch (error) {
       console.error("Connection Error:", error);
       setTestResult({ error: "Failed to connect to Backend. Is main.py running?" });
@@ -257,8 +269,8 @@ const handleDownloadBridge = (monitorId: string) => {
                 <td className="px-6 py-4 text-sm text-slate-600">{monitor.source}</td>
                 <td className="px-6 py-4">
                   <div className="flex items-center gap-2">
-                    <span className={`w-2 h-2 rounded-full ${monitor.status === 'OK' ? 'bg-green-500' : 'bg-red-500'}`} />
-                    <span className={`text-sm font-medium ${monitor.status === 'OK' ? 'text-green-600' : 'text-red-600'}`}>
+                    <span className={`w-2 h-2 rounded-full ${monitor.status === 'OK' ? 'bg-green-500' : monitor.status === 'OFFLINE' ? 'bg-slate-400' : 'bg-red-500'}`} />
+                    <span className={`text-sm font-medium ${monitor.status === 'OK' ? 'text-green-600' : monitor.status === 'OFFLINE' ? 'text-slate-500' : 'text-red-600'}`}>
                       {monitor.status}
                     </span>
                   </div>
@@ -506,11 +518,11 @@ const handleDownloadBridge = (monitorId: string) => {
                     <div className="flex justify-between items-center mb-2">
                       <span className="text-xs font-mono text-slate-400">JSON RESPONSE</span>
                       <span className={`text-xs px-2 py-0.5 rounded ${testResult.error ? 'bg-red-500/20 text-red-400' : 'bg-green-500/20 text-green-400'}`}>
-                        {testResult.error ? 'ERROR' : 'SUCCESS'}
+                        {testResult.error ? 'ERROR' : testResult.partial !== undefined ? 'STREAMING' : 'SUCCESS'}
                       </span>
                     </div>
                     <pre className="text-xs font-mono text-green-400 overflow-x-auto whitespace-pre-wrap max-h-40">
-                      {JSON.stringify(testResult, null, 2)}
+                      {testResult.partial !== undefined ? testResult.partial : JSON.stringify(testResult, null, 2)}
                     </pre>
                   </div>
                 )}
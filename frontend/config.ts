@@ -4,5 +4,6 @@ export const ENDPOINTS = {
   MONITORS: `${API_BASE_URL}/monitors`,
   LOGS: `${API_BASE_URL}/logs`,
   TRIGGER: `${API_BASE_URL}/trigger-scan`,
+  TRIGGER_STREAM: `${API_BASE_URL}/trigger-scan/stream`,
   TEST: `${API_BASE_URL}/test-rule`,
 };
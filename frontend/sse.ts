@@ -0,0 +1,20 @@
+// Reads a text/event-stream response body (e.g. ENDPOINTS.TRIGGER_STREAM), calling
+// onEvent(event, data) for every complete event with its JSON data parsed.
+export async function readSSE(response: Response, onEvent: (event: string, data: any) => void): Promise<void> {
+  if (!response.body) return;
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop() || '';
+    for (const raw of events) {
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      if (!event) continue;
+      onEvent(event, JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || 'null'));
+    }
+  }
+}